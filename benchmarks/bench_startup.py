@@ -0,0 +1,109 @@
+"""Measures how quickly the Galacton browser starts: module import time and time to first paint.
+
+Usage: python benchmarks/bench_startup.py [--repeat R] [--top N] [--timeout S] [--json]
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MAIN_SCRIPT = os.path.join(APP_DIR, "main.py")
+PROBE_PREFIX = "GALACTON_STARTUP "
+
+
+def import_times(module="main"):
+    """Imports ``module`` in a fresh interpreter and returns its ``-X importtime`` report as (module, cumulative seconds)."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=APP_DIR,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "import failed")
+
+    times = []
+    for line in result.stderr.splitlines():
+        # Lines look like "import time:   self [us] | cumulative | imported package"
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        times.append((name.strip(), int(cumulative) / 1e6))
+    return times
+
+
+def time_to_first_paint(timeout):
+    """Starts the browser with the start-up probe enabled and returns the seconds until each milestone."""
+    env = dict(os.environ, GALACTON_STARTUP_PROBE="1")
+    # Headless machines such as CI runners have no display
+    env.setdefault("QT_QPA_PLATFORM", "offscreen")
+    env.setdefault("QTWEBENGINE_CHROMIUM_FLAGS", "--no-sandbox")
+
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, MAIN_SCRIPT],
+        cwd=APP_DIR,
+        env=env,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        text=True,
+    )
+    milestones = {}
+    try:
+        for line in process.stdout:
+            if line.startswith(PROBE_PREFIX):
+                milestones[line[len(PROBE_PREFIX):].strip()] = time.perf_counter() - start
+            if "page_loaded" in milestones or time.perf_counter() - start > timeout:
+                break
+    finally:
+        process.kill()
+        process.wait()
+    return milestones
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=3, help="runs per measurement; the best one is reported")
+    parser.add_argument("--top", type=int, default=10, help="number of slowest imports to list")
+    parser.add_argument("--timeout", type=float, default=60, help="seconds to wait for the first page")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON for CI")
+    args = parser.parse_args()
+
+    # Import time of the entry point, best of several cold interpreters
+    runs = [import_times() for _ in range(args.repeat)]
+    best = min(runs, key=lambda times: times[-1][1] if times else 0)
+    total = best[-1][1] if best else 0.0
+    # Only top-level packages; their cumulative time already includes submodules
+    top = sorted(
+        ((name, seconds) for name, seconds in best if "." not in name and name != "main"),
+        key=lambda item: item[1],
+        reverse=True,
+    )[:args.top]
+
+    paints = [time_to_first_paint(args.timeout) for _ in range(args.repeat)]
+    first_paint = [run["first_paint"] for run in paints if "first_paint" in run]
+    page_loaded = [run["page_loaded"] for run in paints if "page_loaded" in run]
+
+    results = {
+        "import_seconds": round(total, 4),
+        "slowest_imports": {name: round(seconds, 4) for name, seconds in top},
+        "first_paint_seconds": round(min(first_paint), 4) if first_paint else None,
+        "page_loaded_seconds": round(min(page_loaded), 4) if page_loaded else None,
+    }
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"import main: {results['import_seconds']:.3f} s")
+    for name, seconds in top:
+        print(f"  {name:<30} {seconds:.3f} s")
+    for label, key in (("first paint", "first_paint_seconds"), ("page loaded", "page_loaded_seconds")):
+        value = results[key]
+        print(f"{label}: {value:.3f} s" if value is not None else f"{label}: not reached")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""Compares the single-pass PyML tokenizer with the old regex escape/unescape round trip.
+
+Usage: python benchmarks/bench_tokenizer.py [--blocks N ...] [--repeat R]
+"""
+import os
+import re
+import sys
+import html
+import time
+import random
+import argparse
+
+from lxml import etree
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from corpus import code_document  # noqa: E402
+from galacton.tokenizer import parse_pyml  # noqa: E402
+
+# Lines of code in each block; the tokenizer's work is dominated by the number of blocks
+BLOCK_LINES = 3
+
+
+def generate_document(blocks):
+    """Returns a document with ``blocks`` sections, each holding a <python> and an <r> block."""
+    return code_document(random.Random(0), blocks=blocks, lines=BLOCK_LINES)
+
+
+def legacy_round_trip(pyml_content):
+    # The previous pipeline: regex pre-escaping, parsing, re-escaping element.text and unescaping it again
+    def escape(text):
+        return text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+
+    preprocessed = re.sub(
+        r"(<(python|r)>)([\s\S]*?)(<\/\2>)",
+        lambda match: f"{match.group(1)}{escape(match.group(3))}{match.group(4)}",
+        pyml_content,
+    )
+    root = etree.fromstring(preprocessed)
+    return [html.unescape(escape(element.text)) for element in root.iter("python", "r") if element.text]
+
+
+def tokenizer(pyml_content):
+    root = parse_pyml(pyml_content)
+    return [element.text for element in root.iter("python", "r") if element.text]
+
+
+def measure(function, pyml_content, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(pyml_content)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--blocks", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'blocks':>8} {'size (MB)':>10} {'legacy (s)':>11} {'tokenizer (s)':>14} {'MB/s':>8} {'speedup':>8}")
+    for blocks in args.blocks:
+        pyml_content = generate_document(blocks)
+        # Both paths must hand identical code to the executors
+        assert legacy_round_trip(pyml_content) == tokenizer(pyml_content)
+        size = len(pyml_content.encode("utf-8")) / 1e6
+        legacy = measure(legacy_round_trip, pyml_content, args.repeat)
+        current = measure(tokenizer, pyml_content, args.repeat)
+        print(f"{blocks:>8} {size:>10.2f} {legacy:>11.4f} {current:>14.4f} {size / current:>8.1f} {legacy / current:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
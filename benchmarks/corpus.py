@@ -0,0 +1,193 @@
+"""Generates synthetic .pyml documents that stress each stage of the render pipeline.
+
+Usage: python benchmarks/corpus.py OUTPUT_DIR [--scale S] [--seed N]
+
+The same scale and seed always produce the same files, so timings taken on
+different commits are comparable. Blocks that load remote code refer to
+REMOTE_PLACEHOLDER, which the benchmark harness replaces with the address of
+a local HTTP server (see run.py).
+"""
+import os
+import random
+import argparse
+
+# Stands in for the base URL of remote src scripts until the local server has a port
+REMOTE_PLACEHOLDER = "{{REMOTE}}"
+
+# Document name -> what it stresses
+DOCUMENTS = {
+    "sections.pyml": "many sections of prose and markup",
+    "latex.pyml": "thousands of <latex> elements",
+    "nested.pyml": "deeply nested elements",
+    "code.pyml": "large inline <python> and <r> blocks",
+    "links.pyml": "many links to other documents",
+    "remote.pyml": "<python> and <r> blocks with remote src scripts",
+}
+
+WORDS = (
+    "quantum state wave particle energy field operator spin matrix vector "
+    "probability amplitude measurement observable entropy lattice phase"
+).split()
+
+# libxml2 refuses documents nested deeper than this without its "huge" option
+MAX_NESTING = 250
+
+
+def _sentence(rng, words=12):
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+
+def _paragraph(rng):
+    # Inline markup and entities, like hand-written pages have
+    return (
+        f"<p>{_sentence(rng)} <b>{rng.choice(WORDS)}</b> &amp; <i>{rng.choice(WORDS)}</i> "
+        f"{_sentence(rng, 20)} <code>x &lt; y</code></p>"
+    )
+
+
+def _document(body, title):
+    return (
+        "<document>\n"
+        f"  <meta>\n    title: \"{title}\"\n    author: \"Benchmark\"\n  </meta>\n"
+        f"{body}"
+        "</document>\n"
+    )
+
+
+def sections_document(rng, scale):
+    sections = []
+    for index in range(int(500 * scale)):
+        paragraphs = "\n".join(f"    {_paragraph(rng)}" for _ in range(3))
+        items = "".join(f"<li>{rng.choice(WORDS)}</li>" for _ in range(5))
+        sections.append(
+            f"  <section>\n    <h2>Section {index}</h2>\n{paragraphs}\n    <ul>{items}</ul>\n  </section>\n"
+        )
+    return _document("".join(sections), "Sections")
+
+
+def latex_equation(index):
+    # Every equation is distinct, so none of them is served from another one's image
+    return (
+        f"\\[ \\int_0^{{{index}}} x^{{{index % 7 + 1}}} \\, dx = "
+        f"\\frac{{{index}^{{{index % 7 + 2}}}}}{{{index % 7 + 2}}} \\]"
+    )
+
+
+def latex_document(rng, scale):
+    body = []
+    for index in range(int(2000 * scale)):
+        body.append(f"  <p>{_sentence(rng, 6)}</p>\n  <latex>{latex_equation(index)}</latex>\n")
+    return _document("".join(body), "Equations")
+
+
+def nested_document(rng, scale):
+    depth = min(MAX_NESTING, int(200 * scale) or 1)
+    # Several deep towers side by side, each ending in a paragraph
+    towers = []
+    for tower in range(max(1, int(20 * scale))):
+        opening = "".join(f'<div class="level-{level}">' for level in range(depth))
+        closing = "</div>" * depth
+        towers.append(f"  <section>{opening}{_paragraph(rng)}{closing}</section>\n")
+    return _document("".join(towers), "Nested")
+
+
+def python_code(lines, seed):
+    # Cheap to run, but with the comparisons and entities the tokenizer has to keep raw
+    code = [f"total_{seed} = 0"]
+    for line in range(lines):
+        code.append(f"if {line} < {lines} and {line} % 3 > 0: total_{seed} += {line} & 7")
+    code.append(f'print(f"<b>{{total_{seed}}}</b>")')
+    return "\n".join(code)
+
+
+def r_code(lines, seed):
+    code = [f"total_{seed} <- 0"]
+    for line in range(lines):
+        code.append(f"if ({line} < {lines} && {line} %% 3 > 0) total_{seed} <- total_{seed} + {line}")
+    code.append(f'cat("<b>", total_{seed}, "</b>\\n")')
+    return "\n".join(code)
+
+
+def code_document(rng, scale=1.0, blocks=None, lines=300):
+    # bench_tokenizer.py asks for an exact number of blocks rather than a scale
+    if blocks is None:
+        blocks = max(1, int(20 * scale))
+    body = []
+    for index in range(blocks):
+        body.append(
+            f"  <section>\n    <h2>Block {index}</h2>\n    {_paragraph(rng)}\n"
+            f"    <python>\n{python_code(lines, index)}\n    </python>\n"
+            f"    <r>\n{r_code(lines, index)}\n    </r>\n  </section>\n"
+        )
+    return _document("".join(body), "Code")
+
+
+def links_document(rng, scale):
+    body = []
+    for index in range(int(2000 * scale)):
+        if index % 10 == 0:
+            body.append(f'  <p><a href="https://example.com/{rng.choice(WORDS)}/{index}">External {index}</a></p>\n')
+        else:
+            body.append(f'  <p><a href="pages/page{index}.pyml">Page {index}</a> {_sentence(rng, 5)}</p>\n')
+    return _document("".join(body), "Links")
+
+
+def remote_document(rng, scale):
+    body = []
+    for index in range(max(1, int(10 * scale))):
+        body.append(
+            f'  <python src="{REMOTE_PLACEHOLDER}/scripts/block{index}.py" cache="False" />\n'
+            f'  <r src="{REMOTE_PLACEHOLDER}/scripts/block{index}.R" cache="False" />\n'
+        )
+    return _document("".join(body), "Remote")
+
+
+def remote_scripts(scale):
+    """Returns the relative path and content of every script remote.pyml loads."""
+    scripts = {}
+    for index in range(max(1, int(10 * scale))):
+        scripts[f"scripts/block{index}.py"] = python_code(100, index) + "\n"
+        scripts[f"scripts/block{index}.R"] = r_code(100, index) + "\n"
+    return scripts
+
+
+GENERATORS = {
+    "sections.pyml": sections_document,
+    "latex.pyml": latex_document,
+    "nested.pyml": nested_document,
+    "code.pyml": code_document,
+    "links.pyml": links_document,
+    "remote.pyml": remote_document,
+}
+
+
+def generate_corpus(directory, scale=1.0, seed=0):
+    """Writes the corpus to ``directory`` and returns the paths of the documents by name."""
+    os.makedirs(os.path.join(directory, "scripts"), exist_ok=True)
+    paths = {}
+    for name, generator in GENERATORS.items():
+        # Each document gets its own generator, so changing one does not shift the others
+        rng = random.Random(f"{seed}:{name}")
+        path = os.path.join(directory, name)
+        with open(path, "w", encoding="utf-8") as file:
+            file.write(generator(rng, scale))
+        paths[name] = path
+    for relative_path, content in remote_scripts(scale).items():
+        with open(os.path.join(directory, relative_path), "w", encoding="utf-8") as file:
+            file.write(content)
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("output", help="directory to write the documents to")
+    parser.add_argument("--scale", type=float, default=1.0, help="multiplies the number of elements in every document")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    for name, path in generate_corpus(args.output, args.scale, args.seed).items():
+        print(f"{name:<15} {os.path.getsize(path) / 1e6:8.2f} MB  {DOCUMENTS[name]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,379 @@
+"""Times every stage of the render pipeline on a synthetic corpus and compares it with a baseline.
+
+Usage: python benchmarks/run.py [--scale S] [--repeat R] [--only NAME ...]
+                                [--save-baseline] [--baseline PATH] [--tolerance T] [--json]
+
+Stages: tokenizing (preprocess_pyml_content), parsing, compiling the page
+skeleton, LaTeX rendering, both code executors, fetching and full renders,
+cold (new processes and empty caches) and warm. Remote src scripts are served
+by a local HTTP server, so no network access is needed. Everything is written
+to a temporary directory; the application's tmp/ is left alone.
+
+Peak memory is measured with tracemalloc in a separate run and only covers
+Python allocations of this process: not lxml's own buffers, nor the
+interpreter and TeX subprocesses. The exit status is 1 when a benchmark is
+slower than the baseline by more than the tolerance.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import tempfile
+import threading
+import statistics
+import tracemalloc
+from functools import partial
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from corpus import REMOTE_PLACEHOLDER, generate_corpus, latex_equation, python_code, r_code, remote_scripts  # noqa: E402
+from galacton.cache import OutputCache  # noqa: E402
+from galacton.fetch import Fetcher  # noqa: E402
+from galacton.latex import LatexEngine  # noqa: E402
+from galacton.rkernel import RKernelPool  # noqa: E402
+from galacton.pykernel import PythonKernelPool  # noqa: E402
+from galacton.tokenizer import parse_pyml  # noqa: E402
+from galacton.pyml import PageRenderer, RenderServices, preprocess_pyml_content  # noqa: E402
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+
+class _QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+class LocalServer:
+    """Serves a directory over HTTP on a free local port, standing in for remote src URLs."""
+
+    def __init__(self, directory):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), partial(_QuietHandler, directory=directory))
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class Harness:
+    """Runs benchmarks and collects their results by name."""
+
+    def __init__(self, work_dir, repeat, only=None, log=print):
+        self.work_dir = work_dir
+        self.repeat = repeat
+        self.only = only or []
+        self.log = log
+        self.results = {}
+
+    def selected(self, name):
+        return not self.only or any(pattern in name for pattern in self.only)
+
+    def fresh_dir(self, name):
+        # A new empty directory for caches that have to start cold
+        return tempfile.mkdtemp(prefix=f"{name}-", dir=self.work_dir)
+
+    def run(self, name, body, work=None, unit=None, memory=True):
+        """Times ``body`` and records the result under ``name``.
+
+        ``body`` is called once per repetition and returns the seconds spent in the
+        part being measured, so set-up and tear-down stay outside the timing.
+        ``work`` is the amount processed per call, reported as ``unit`` per second.
+        """
+        if not self.selected(name):
+            return
+        try:
+            samples = [body() for _ in range(self.repeat)]
+            peak = None
+            if memory:
+                # tracemalloc slows everything down, so memory gets a run of its own
+                tracemalloc.start()
+                try:
+                    body()
+                    peak = tracemalloc.get_traced_memory()[1]
+                finally:
+                    tracemalloc.stop()
+        except Exception as e:
+            self.skip(name, f"{type(e).__name__}: {e}")
+            return
+        best = min(samples)
+        result = {
+            "seconds": best,
+            "median": statistics.median(samples),
+            "peak_mb": None if peak is None else peak / 1e6,
+        }
+        if work is not None:
+            result["throughput"] = work / best if best > 0 else float("inf")
+            result["unit"] = f"{unit}/s"
+        self.results[name] = result
+        self.log(format_result(name, result))
+
+    def skip(self, name, reason):
+        if self.selected(name):
+            self.results[name] = {"skipped": reason}
+            self.log(f"{name:<32} skipped: {reason}")
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - start
+
+
+def timed_loop(function, *args, min_seconds=0.05):
+    """Returns the average time of ``function`` over enough calls to smooth out timer noise."""
+    calls = 0
+    start = time.perf_counter()
+    while True:
+        function(*args)
+        calls += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_seconds:
+            return elapsed / calls
+
+
+def bench_documents(harness, paths, services):
+    """Tokenizing, parsing and compiling every document of the corpus."""
+    for name, path in paths.items():
+        with open(path, "r", encoding="utf-8") as file:
+            content = file.read()
+        size = len(content.encode("utf-8")) / 1e6
+        base_url = os.path.dirname(path) + "/"
+        harness.run(f"preprocess/{name}", lambda: timed_loop(preprocess_pyml_content, content), size, "MB")
+        harness.run(f"parse/{name}", lambda: timed_loop(parse_pyml, content), size, "MB")
+        # The renderer does not use Qt, so the skeleton is built exactly as the browser builds it
+        harness.run(f"compile/{name}", lambda: timed_loop(PageRenderer(base_url, services).build_page, content), size, "MB")
+
+
+def bench_latex(harness, equations):
+    """Rendering equations with an empty image cache, then again with every image cached."""
+    codes = [latex_equation(index) for index in range(equations)]
+    latex_path, dvipng_path = LatexEngine(harness.work_dir).tools()
+    if not latex_path or not dvipng_path:
+        for name in ("latex/cold", "latex/warm"):
+            harness.skip(name, "latex or dvipng not found in PATH")
+        return
+
+    def cold():
+        engine = LatexEngine(harness.fresh_dir("latex"))
+        start = time.perf_counter()
+        images = engine.render_many(codes)
+        elapsed = time.perf_counter() - start
+        for image in images.values():
+            if isinstance(image, Exception):
+                raise image
+        return elapsed
+
+    warm_engine = LatexEngine(harness.fresh_dir("latex"))
+    warm_engine.render_many(codes)
+    harness.run("latex/cold", cold, equations, "equations", memory=False)
+    harness.run("latex/warm", lambda: timed(warm_engine.render_many, codes), equations, "equations")
+
+
+def bench_executor(harness, language, make_pool, blocks):
+    """Cold: a new interpreter process runs its first block. Warm: blocks run on an already running one."""
+    def cold():
+        pool = make_pool()
+        try:
+            return timed(pool.execute, "cold", blocks[0])
+        finally:
+            pool.shutdown()
+
+    harness.run(f"{language}/cold", cold, 1, "blocks", memory=False)
+    if not harness.selected(f"{language}/warm"):
+        return
+
+    pool = make_pool()
+    sessions = iter(range(1 << 30))
+
+    def warm():
+        # A new session per repetition, so no run sees another's variables
+        session = f"warm-{next(sessions)}"
+        start = time.perf_counter()
+        for code in blocks:
+            pool.execute(session, code)
+        elapsed = time.perf_counter() - start
+        pool.close_session(session)
+        return elapsed
+
+    try:
+        pool.execute("warm-up", blocks[0])
+        harness.run(f"{language}/warm", warm, len(blocks), "blocks", memory=False)
+    except Exception as e:
+        harness.skip(f"{language}/warm", f"{type(e).__name__}: {e}")
+    finally:
+        pool.shutdown()
+
+
+def bench_fetch(harness, urls):
+    """Downloading the remote scripts into an empty HTTP cache, then revalidating them."""
+    def fetch_all(fetcher):
+        for url in urls:
+            fetcher.get(url)
+
+    def cold():
+        return timed(fetch_all, Fetcher(harness.fresh_dir("http"), offline=False))
+
+    warm_fetcher = Fetcher(harness.fresh_dir("http"), offline=False)
+    harness.run("fetch/cold", cold, len(urls), "requests")
+    fetch_all(warm_fetcher)
+    harness.run("fetch/warm", lambda: timed(fetch_all, warm_fetcher), len(urls), "requests")
+
+
+def bench_render(harness, services, name, path):
+    """A full synchronous render: with empty output and HTTP caches, then served from the output cache."""
+    if not (harness.selected(f"render/{name}/cold") or harness.selected(f"render/{name}/warm")):
+        return
+    with open(path, "r", encoding="utf-8") as file:
+        content = file.read()
+    base_url = os.path.dirname(path) + "/"
+
+    def cold():
+        # Empty caches, but the interpreter processes are already running, as in the browser
+        services.output_cache = OutputCache(harness.fresh_dir("cache"))
+        services.fetcher = Fetcher(harness.fresh_dir("http"), offline=False)
+        return timed(PageRenderer(base_url, services).render, content)
+
+    harness.run(f"render/{name}/cold", cold, memory=False)
+    harness.run(f"render/{name}/warm", lambda: timed(PageRenderer(base_url, services).render, content))
+
+
+def format_result(name, result):
+    line = f"{name:<32} {result['seconds'] * 1000:10.2f} ms"
+    if "throughput" in result:
+        line += f" {result['throughput']:12.1f} {result['unit']:<14}"
+    else:
+        line += " " * 28
+    if result.get("peak_mb") is not None:
+        line += f" peak {result['peak_mb']:8.2f} MB"
+    return line
+
+
+def compare(results, baseline, tolerance, min_delta=0.001):
+    """Returns report lines and the names of benchmarks that got slower than ``baseline`` allows.
+
+    Differences below ``min_delta`` seconds are treated as noise whatever their ratio.
+    """
+    lines = []
+    regressions = []
+    for name, result in results.items():
+        previous = baseline.get("results", {}).get(name)
+        if not previous or "seconds" not in previous or "seconds" not in result:
+            continue
+        ratio = result["seconds"] / previous["seconds"] if previous["seconds"] > 0 else 1.0
+        if abs(result["seconds"] - previous["seconds"]) < min_delta:
+            status = ""
+        elif ratio > 1 + tolerance:
+            regressions.append(name)
+            status = "SLOWER"
+        elif ratio < 1 / (1 + tolerance):
+            status = "faster"
+        else:
+            status = ""
+        lines.append(f"{name:<32} {previous['seconds'] * 1000:10.2f} ms -> {result['seconds'] * 1000:10.2f} ms {ratio:6.2f}x {status}")
+    return lines, regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scale", type=float, default=1.0, help="size of the generated corpus, see corpus.py")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3, help="runs per benchmark; the fastest one is reported")
+    parser.add_argument("--equations", type=int, default=200, help="equations rendered by the LaTeX benchmarks")
+    parser.add_argument("--only", nargs="+", help="run only benchmarks whose name contains one of these strings")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="baseline file to compare with or save to")
+    parser.add_argument("--save-baseline", action="store_true", help="store the results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown before a benchmark counts as a regression")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    parser.add_argument("--keep", action="store_true", help="keep the generated corpus and caches")
+    args = parser.parse_args()
+
+    log = (lambda message: print(message, file=sys.stderr)) if args.json else print
+    work_dir = tempfile.mkdtemp(prefix="galacton-bench-")
+    harness = Harness(work_dir, args.repeat, args.only, log)
+    server = None
+    services = None
+    try:
+        corpus_dir = os.path.join(work_dir, "corpus")
+        paths = generate_corpus(corpus_dir, args.scale, args.seed)
+        server = LocalServer(corpus_dir)
+        # Point the remote blocks at the local server
+        with open(paths["remote.pyml"], "r", encoding="utf-8") as file:
+            remote_content = file.read().replace(REMOTE_PLACEHOLDER, server.url)
+        with open(paths["remote.pyml"], "w", encoding="utf-8") as file:
+            file.write(remote_content)
+        log(f"corpus: {corpus_dir} (scale {args.scale}), remote scripts served from {server.url}\n")
+
+        services = RenderServices(python_workers=1, r_workers=1, prestart=False, output_dir=harness.fresh_dir("services"))
+        bench_documents(harness, paths, services)
+        bench_latex(harness, args.equations)
+        blocks = max(1, int(20 * args.scale))
+        bench_executor(harness, "python", lambda: PythonKernelPool(size=1), [python_code(300, index) for index in range(blocks)])
+        bench_executor(
+            harness,
+            "r",
+            lambda: RKernelPool(harness.fresh_dir("r"), size=1),
+            [r_code(300, index) for index in range(blocks)],
+        )
+        bench_fetch(harness, [f"{server.url}/{relative_path}" for relative_path in remote_scripts(args.scale)])
+        bench_render(harness, services, "code.pyml", paths["code.pyml"])
+        bench_render(harness, services, "remote.pyml", paths["remote.pyml"])
+    finally:
+        if services is not None:
+            services.shutdown()
+        if server is not None:
+            server.close()
+        if args.keep:
+            log(f"\nkept {work_dir}")
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = {
+        "metadata": {
+            "scale": args.scale,
+            "seed": args.seed,
+            "equations": args.equations,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": harness.results,
+    }
+
+    regressions = []
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2)
+        log(f"\nbaseline saved to {args.baseline}")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline, "r", encoding="utf-8") as file:
+            baseline = json.load(file)
+        settings = ("scale", "seed", "equations")
+        if any(baseline.get("metadata", {}).get(key) != report["metadata"][key] for key in settings):
+            log(f"\n{args.baseline} was recorded with other corpus settings; not comparing")
+        else:
+            lines, regressions = compare(harness.results, baseline, args.tolerance)
+            log(f"\ncompared with {args.baseline} (tolerance {args.tolerance:.0%}):")
+            for line in lines:
+                log(line)
+            report["regressions"] = regressions
+    else:
+        # Timings depend on the machine, so no baseline is kept in the repository
+        log(
+            f"\nno baseline at {args.baseline}, so nothing was compared; "
+            "run with --save-baseline on the main branch first"
+        )
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    if regressions:
+        log(f"\n{len(regressions)} benchmark(s) slower than the baseline: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1 @@
+"""Rendering subsystems shared by the Galacton browser and its tooling."""
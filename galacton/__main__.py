@@ -0,0 +1,19 @@
+"""Command line entry point: python -m galacton <command> ..."""
+import sys
+import argparse
+
+from galacton import build, search
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="galacton", description="Headless tools for .pyml documents.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build.add_arguments(commands.add_parser("build", help="render a directory of .pyml pages to static HTML"))
+    search.add_index_arguments(commands.add_parser("index", help="add the .pyml pages in directories to the search index"))
+    search.add_search_arguments(commands.add_parser("search", help="search the indexed documents"))
+    args = parser.parse_args(argv)
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
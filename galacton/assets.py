@@ -0,0 +1,190 @@
+import os
+import re
+import time
+import hashlib
+import mimetypes
+import threading
+from collections import OrderedDict
+
+# URL scheme under which the browser serves stored assets, e.g. galacton://asset/<key>
+ASSET_SCHEME = "galacton"
+ASSET_PREFIX = f"{ASSET_SCHEME}://asset/"
+
+# HTML outputs larger than this are served as a separate document instead of being inlined
+INLINE_HTML_LIMIT = 256 * 1024
+
+_ASSET_URL = re.compile(re.escape(ASSET_PREFIX) + r'([0-9a-f]+\.[A-Za-z0-9]+)')
+
+
+def asset_url(key):
+    return ASSET_PREFIX + key
+
+
+def asset_key(url):
+    """Returns the key of a galacton://asset/ URL, or None for any other URL."""
+    if url.startswith(ASSET_PREFIX):
+        return url[len(ASSET_PREFIX):].split("?", 1)[0].split("#", 1)[0]
+    return None
+
+
+def _extension(mime_type):
+    # Keys carry an extension, so the MIME type survives a restart without an index
+    if mime_type == "text/html":
+        return ".html"
+    return mimetypes.guess_extension(mime_type) or ".bin"
+
+
+class AssetStore:
+    """Content-addressed store for equation images, plot output and rendered pages.
+
+    Assets are named by the sha256 of their content plus an extension for their
+    MIME type, so a URL never changes meaning. Recently used assets are kept in
+    memory (up to ``memory_bytes``); persistent ones are also written under
+    ``directory`` and evicted least recently used first beyond ``max_bytes``.
+    """
+
+    def __init__(self, directory, memory_bytes=64 * 1024 * 1024, max_bytes=512 * 1024 * 1024):
+        self.directory = directory
+        self.memory_bytes = memory_bytes
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()  # key -> data, least recently used first
+        self._memory_total = 0
+        self._files = {}  # (path, size, mtime) -> key of files added with put_file
+        self._entries = None  # key -> size of assets on disk, least recently used first
+        self._disk_total = 0
+
+    def put(self, data, mime_type, persist=True):
+        """Stores ``data`` and returns its galacton:// URL.
+
+        Assets that are not persisted, such as whole pages, only live in memory.
+        """
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        key = hashlib.sha256(data).hexdigest()[:40] + _extension(mime_type)
+        with self._lock:
+            self._remember(key, data)
+            if persist:
+                self._load_index()
+                if key not in self._entries:
+                    self._write(key, data)
+        return asset_url(key)
+
+    def put_file(self, path):
+        """Stores the content of a file, such as a rendered equation, and returns its galacton:// URL."""
+        info = os.stat(path)
+        signature = (os.path.abspath(path), info.st_size, info.st_mtime)
+        with self._lock:
+            key = self._files.get(signature)
+        if key is not None and self.contains(key):
+            return asset_url(key)
+        with open(path, "rb") as file:
+            data = file.read()
+        url = self.put(data, mimetypes.guess_type(path)[0] or "application/octet-stream")
+        with self._lock:
+            self._files[signature] = asset_key(url)
+        return url
+
+    def put_html(self, output_html):
+        """Returns ``output_html`` itself if it is small, or an iframe showing it from the store."""
+        if len(output_html) <= INLINE_HTML_LIMIT:
+            return output_html
+        url = self.put(output_html, "text/html")
+        return f'<iframe src="{url}" width="100%" height="600" frameborder="0" allowfullscreen></iframe>'
+
+    def get(self, key):
+        """Returns the content of an asset, or None if it is not stored."""
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                return data
+            self._load_index()
+            if key not in self._entries:
+                return None
+        try:
+            with open(self._path(key), "rb") as file:
+                data = file.read()
+        except OSError:
+            with self._lock:
+                self._forget(key)
+            return None
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                now = time.time()
+                os.utime(self._path(key), (now, now))
+            self._remember(key, data)
+        return data
+
+    def contains(self, key):
+        with self._lock:
+            if key in self._memory:
+                return True
+            self._load_index()
+            return key in self._entries
+
+    def contains_all(self, output_html):
+        """Tells whether every asset ``output_html`` refers to is still stored."""
+        return all(self.contains(key) for key in set(_ASSET_URL.findall(output_html)))
+
+    def mime_type(self, key):
+        if key.endswith(".html"):
+            return "text/html"
+        return mimetypes.guess_type(key)[0] or "application/octet-stream"
+
+    def _path(self, key):
+        # Keys are generated by put(); refuse anything that could leave the directory
+        if os.sep in key or "/" in key or key.startswith("."):
+            raise ValueError(f"invalid asset key: {key}")
+        return os.path.join(self.directory, key)
+
+    def _remember(self, key, data):
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            return
+        self._memory[key] = data
+        self._memory_total += len(data)
+        while self._memory_total > self.memory_bytes and len(self._memory) > 1:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_total -= len(evicted)
+
+    def _write(self, key, data):
+        # Write to a temporary file first so readers never see a partial asset
+        temp_path = f"{self._path(key)}.{os.getpid()}.{threading.get_ident()}.part"
+        with open(temp_path, "wb") as file:
+            file.write(data)
+        os.replace(temp_path, self._path(key))
+        self._entries[key] = len(data)
+        self._disk_total += len(data)
+        self._evict()
+
+    def _load_index(self):
+        # Build the index from the files on disk the first time it is needed
+        if self._entries is not None:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        found = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".part") or not entry.is_file():
+                continue
+            info = entry.stat()
+            found.append((info.st_mtime, entry.name, info.st_size))
+        found.sort()
+        self._entries = OrderedDict((key, size) for _, key, size in found)
+        self._disk_total = sum(size for _, _, size in found)
+        self._evict()
+
+    def _forget(self, key):
+        size = self._entries.pop(key, None)
+        if size is not None:
+            self._disk_total -= size
+
+    def _evict(self):
+        while self._disk_total > self.max_bytes and len(self._entries) > 1:
+            key = next(iter(self._entries))
+            self._forget(key)
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
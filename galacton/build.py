@@ -0,0 +1,235 @@
+import os
+import re
+import json
+import shutil
+import hashlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from galacton import trace
+from galacton.assets import asset_key
+from galacton.mathmode import BUNDLE_FILES, bundle_dir, bundle_url
+from galacton.pyml import RenderServices, PageRenderer, load_pyml_source
+
+# Name of the file in the output directory that records the inputs each page was built from
+MANIFEST_NAME = ".galacton-build.json"
+
+_HREF = re.compile(r'href="([^"]*?\.pyml)"')
+_SRC = re.compile(r'src="([^"]+)"')
+
+# The services of a build worker process, created once per process by _start_worker
+_services = None
+
+
+def find_pages(source_dir):
+    """Returns every .pyml file below ``source_dir``, as absolute paths."""
+    pages = []
+    for directory, _, files in os.walk(source_dir):
+        pages.extend(os.path.abspath(os.path.join(directory, name)) for name in files if name.endswith(".pyml"))
+    return sorted(pages)
+
+
+def crawl(source_dir, services):
+    """Returns the pages to build: every .pyml file below ``source_dir`` plus the local pages they link to."""
+    pending = find_pages(source_dir)
+    found = set(pending)
+    while pending:
+        path = pending.pop()
+        try:
+            pyml_content, base_url = load_pyml_source(path, services.fetcher)
+            links = PageRenderer(base_url, services).build_page(pyml_content).links
+        except Exception:
+            continue  # The page itself reports the problem when it is rendered
+        for link in links:
+            if link.startswith("http") or link in found or not os.path.isfile(link):
+                continue
+            found.add(link)
+            pending.append(link)
+    return sorted(found)
+
+
+def input_hash(path, services):
+    """Hashes everything a page's output depends on: its source and the scripts its blocks load."""
+    digest = hashlib.sha256()
+    pyml_content, base_url = load_pyml_source(path, services.fetcher)
+    digest.update(pyml_content.encode("utf-8"))
+    renderer = PageRenderer(base_url, services)
+    try:
+        page = renderer.build_page(pyml_content)
+    except Exception:
+        return digest.hexdigest()
+    for block in page.blocks:
+        if block.src_file:
+            try:
+                code, _ = renderer.load_block_code(block.code, block.src_file)
+            except Exception as e:
+                code = f"error: {e}"
+            digest.update(b"\0" + code.encode("utf-8"))
+    return digest.hexdigest()
+
+
+def output_path_for(page_path, source_dir, output_dir):
+    relative = os.path.relpath(page_path, source_dir)
+    if relative.startswith(os.pardir):
+        # A linked page outside the source directory goes into a separate subdirectory
+        relative = os.path.join("_external", os.path.splitdrive(page_path)[1].lstrip(os.sep))
+    return os.path.join(output_dir, os.path.splitext(relative)[0] + ".html")
+
+
+def _start_worker(python_workers):
+    global _services
+    _services = RenderServices(python_workers=python_workers, r_workers=1)
+
+
+def _render_page(page_path, html_path, source_dir, output_dir):
+    # Runs in a build worker process. Returns the errors shown in place of block output, as
+    # (stage, message) pairs; the page is written either way, so the errors can be seen in context
+    page_trace = trace.Trace(page_path)
+    try:
+        with trace.activate(page_trace):
+            pyml_content, base_url = load_pyml_source(page_path, _services.fetcher)
+            content = PageRenderer(base_url, _services).render(pyml_content)
+    except Exception as e:
+        # Some exceptions (lxml's among them) cannot be pickled back to the parent process
+        raise RuntimeError(str(e)) from None
+    content = _relocate(content, html_path, source_dir, output_dir, _services.output_dir, _services.assets)
+    os.makedirs(os.path.dirname(html_path), exist_ok=True)
+    with open(html_path, "w", encoding="utf-8") as file:
+        file.write(content)
+    return page_trace.errors
+
+
+def _relocate(content, html_path, source_dir, output_dir, assets_source, asset_store=None):
+    """Points links at the built .html pages and copies generated assets next to the output.
+
+    Assets are either files under ``assets_source`` or galacton:// URLs of ``asset_store``.
+    """
+    page_dir = os.path.dirname(html_path)
+    assets_dir = os.path.join(output_dir, "assets")
+
+    def link(match):
+        href = match.group(1)
+        if href.startswith("http"):
+            return match.group(0)
+        target = output_path_for(href, source_dir, output_dir)
+        return f'href="{os.path.relpath(target, page_dir)}"'
+
+    def asset(match):
+        src = match.group(1)
+        key = asset_key(src)
+        if key is not None and asset_store is not None:
+            data = asset_store.get(key)
+            if data is None:
+                return match.group(0)
+            target = os.path.join(assets_dir, key)
+            if not os.path.exists(target):
+                # Content-addressed, so an existing file already has the right content
+                os.makedirs(assets_dir, exist_ok=True)
+                temp_path = f"{target}.{os.getpid()}.part"
+                with open(temp_path, "wb") as file:
+                    file.write(data)
+                os.replace(temp_path, target)
+            return f'src="{os.path.relpath(target, page_dir)}"'
+        if ":" in src.split("/")[0]:
+            return match.group(0)  # http:, data: and similar URLs stay as they are
+        path = os.path.abspath(src)
+        if not path.startswith(assets_source + os.sep) or not os.path.isfile(path):
+            return match.group(0)
+        target = os.path.join(assets_dir, os.path.relpath(path, assets_source))
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        shutil.copyfile(path, target)
+        return f'src="{os.path.relpath(target, page_dir)}"'
+
+    content = _SRC.sub(asset, _HREF.sub(link, content))
+
+    # Pages typeset by KaTeX or MathJax get a copy of the renderer, fonts included
+    for mode in BUNDLE_FILES:
+        if bundle_url(mode) not in content:
+            continue
+        target = os.path.join(assets_dir, mode)
+        shutil.copytree(bundle_dir(mode), target, dirs_exist_ok=True)
+        relative = os.path.relpath(target, page_dir).replace(os.sep, "/")
+        content = content.replace(bundle_url(mode), relative + "/")
+    return content
+
+
+def build_site(source_dir, output_dir, jobs=None, force=False, log=print):
+    """Renders every page of a .pyml site to static HTML in ``output_dir``.
+
+    Pages are rendered in parallel worker processes; pages whose source and
+    scripts have not changed since the last build are skipped. A page with a
+    block that failed counts as failed and is rendered again next time.
+    Returns the number of pages that failed.
+    """
+    source_dir = os.path.abspath(source_dir)
+    output_dir = os.path.abspath(output_dir)
+    jobs = jobs or os.cpu_count() or 1
+    os.makedirs(output_dir, exist_ok=True)
+
+    manifest_path = os.path.join(output_dir, MANIFEST_NAME)
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as file:
+            manifest = json.load(file)
+    except (OSError, ValueError):
+        manifest = {}
+
+    # Crawling and hashing only parse pages, so no interpreter workers are needed here
+    services = RenderServices(python_workers=1, r_workers=1, prestart=False)
+    try:
+        pages = crawl(source_dir, services)
+        hashes = {}
+        work = []
+        for page_path in pages:
+            html_path = output_path_for(page_path, source_dir, output_dir)
+            try:
+                hashes[page_path] = input_hash(page_path, services)
+            except Exception as e:
+                log(f"failed   {page_path}: {e}")
+                continue
+            if not force and manifest.get(page_path) == hashes[page_path] and os.path.exists(html_path):
+                log(f"skipped  {os.path.relpath(page_path, source_dir)} (unchanged)")
+                continue
+            work.append((page_path, html_path))
+    finally:
+        services.shutdown()
+
+    failures = len(pages) - len(hashes)
+    if work:
+        # Each worker process renders one page at a time with its own small set of interpreters
+        with ProcessPoolExecutor(max_workers=min(jobs, len(work)), initializer=_start_worker, initargs=(1,)) as executor:
+            futures = {
+                executor.submit(_render_page, page_path, html_path, source_dir, output_dir): page_path
+                for page_path, html_path in work
+            }
+            for future in as_completed(futures):
+                page_path = futures[future]
+                try:
+                    errors = future.result()
+                    if errors:
+                        stage, message = errors[0]
+                        more = f" (and {len(errors) - 1} more)" if len(errors) > 1 else ""
+                        raise RuntimeError(f"{len(errors)} block error(s), first in {stage}: {message}{more}")
+                except Exception as e:
+                    # Left out of the manifest, so the next build tries the page again
+                    failures += 1
+                    manifest.pop(page_path, None)
+                    log(f"failed   {os.path.relpath(page_path, source_dir)}: {e}")
+                    continue
+                manifest[page_path] = hashes[page_path]
+                log(f"rendered {os.path.relpath(page_path, source_dir)}")
+
+    with open(manifest_path, "w", encoding="utf-8") as file:
+        json.dump(manifest, file, indent=2, sort_keys=True)
+    return failures
+
+
+def main(args):
+    failures = build_site(args.source, args.output or os.path.join(args.source, "_build"), args.jobs, args.force)
+    return 1 if failures else 0
+
+
+def add_arguments(parser):
+    parser.add_argument("source", help="directory containing .pyml pages")
+    parser.add_argument("-o", "--output", help="output directory (default: <source>/_build)")
+    parser.add_argument("-j", "--jobs", type=int, help="number of pages rendered in parallel (default: CPU count)")
+    parser.add_argument("--force", action="store_true", help="render every page even if its inputs are unchanged")
+    parser.set_defaults(handler=main)
@@ -0,0 +1,185 @@
+import os
+import sys
+import time
+import hashlib
+import platform
+import threading
+import subprocess
+from collections import OrderedDict
+
+from galacton import trace
+
+# Packages whose versions can change the output of a <python> block
+PYTHON_PACKAGES = ["numpy", "pandas", "plotly", "matplotlib", "scipy", "seaborn", "scikit-learn", "sympy"]
+
+# Prints the R version and every installed package with its version, sorted by name
+R_PACKAGES_SCRIPT = (
+    'ip <- installed.packages()[, c("Package", "Version"), drop = FALSE]; '
+    'ip <- ip[order(ip[, "Package"]), , drop = FALSE]; '
+    'cat(R.version.string, paste(ip[, "Package"], ip[, "Version"], sep = "==", collapse = ";"), sep = "\\n")'
+)
+
+
+def python_environment_fingerprint():
+    """Returns a string describing the Python interpreter and scientific package versions."""
+    from importlib import metadata
+
+    parts = [sys.implementation.name, platform.python_version()]
+    for package in PYTHON_PACKAGES:
+        try:
+            parts.append(f"{package}=={metadata.version(package)}")
+        except metadata.PackageNotFoundError:
+            parts.append(f"{package}==none")
+    return ";".join(parts)
+
+
+def r_environment_fingerprint():
+    """Returns a hash of the R version and installed package versions, or 'none' if R is unavailable."""
+    try:
+        result = subprocess.run(["Rscript", "-e", R_PACKAGES_SCRIPT], capture_output=True, text=True)
+    except OSError:
+        return "none"
+    # Hundreds of packages may be installed, so only their hash goes into the cache keys
+    return hashlib.sha256((result.stdout + result.stderr).encode("utf-8")).hexdigest()
+
+
+class OutputCache:
+    """Persistent, content-addressed store for the HTML produced by code blocks.
+
+    Entries live as individual files under ``directory`` and are evicted least
+    recently used first once they exceed ``max_bytes`` or are older than ``max_age``.
+    """
+
+    def __init__(self, directory, max_bytes=256 * 1024 * 1024, max_age=30 * 24 * 3600):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = None  # key -> (size, last access time), least recently used first
+        self._total_bytes = 0
+        self._fingerprints = {}
+
+    def fingerprint(self, language):
+        # Interpreter versions are expensive to query, so compute them once per language
+        if language not in self._fingerprints:
+            if language == "r":
+                self._fingerprints[language] = r_environment_fingerprint()
+            else:
+                self._fingerprints[language] = python_environment_fingerprint()
+        return self._fingerprints[language]
+
+    def make_key(self, language, code, src_file=None, context=""):
+        """Builds the cache key for a block from its code, its source and the interpreter versions.
+
+        ``context`` identifies anything else the output depends on, such as earlier blocks of the same session.
+        """
+        digest = hashlib.sha256()
+        for part in (language, src_file or "", code, self.fingerprint(language), context):
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def get(self, key):
+        """Returns the cached HTML for ``key``, or None on a miss."""
+        with self._lock:
+            self._load_index()
+            entry = self._entries.get(key)
+            if entry is not None and time.time() - entry[1] > self.max_age:
+                # Expired: delete it now rather than at the next eviction
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                trace.count("output_cache.miss")
+                return None
+            try:
+                with open(self._path(key), "r", encoding="utf-8") as file:
+                    output_html = file.read()
+            except OSError:
+                # The file vanished behind our back; forget about it
+                self._forget(key)
+                self.misses += 1
+                trace.count("output_cache.miss")
+                return None
+
+            # Mark the entry as recently used, both in memory and on disk
+            now = time.time()
+            self._entries[key] = (entry[0], now)
+            self._entries.move_to_end(key)
+            os.utime(self._path(key), (now, now))
+            self.hits += 1
+            trace.count("output_cache.hit")
+            return output_html
+
+    def put(self, key, output_html):
+        """Stores ``output_html`` under ``key`` and evicts old entries if needed."""
+        data = output_html.encode("utf-8")
+        with self._lock:
+            self._load_index()
+            # Write to a temporary file first so readers never see a partial entry; the pid keeps
+            # build workers apart, whose thread ids can be the same in every forked process
+            temp_path = f"{self._path(key)}.{os.getpid()}.{threading.get_ident()}.part"
+            with open(temp_path, "wb") as file:
+                file.write(data)
+            os.replace(temp_path, self._path(key))
+
+            self._forget(key)
+            self._entries[key] = (len(data), time.time())
+            self._total_bytes += len(data)
+            self._evict()
+
+    def stats(self):
+        """Returns the hit/miss counters and current size of the cache."""
+        with self._lock:
+            self._load_index()
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+            }
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.html")
+
+    def _load_index(self):
+        # Build the in-memory index from the files on disk the first time it is needed
+        if self._entries is not None:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        found = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".html"):
+                continue
+            try:
+                info = os.stat(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            found.append((info.st_mtime, name[:-len(".html")], info.st_size))
+        found.sort()
+        self._entries = OrderedDict((key, (size, mtime)) for mtime, key, size in found)
+        self._total_bytes = sum(size for _, _, size in found)
+        self._evict()
+
+    def _forget(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._total_bytes -= entry[0]
+
+    def _evict(self):
+        # Drop entries that are too old, then the least recently used until under budget
+        cutoff = time.time() - self.max_age
+        for key, (size, accessed) in list(self._entries.items()):
+            if accessed < cutoff or self._total_bytes > self.max_bytes:
+                self._remove(key)
+            else:
+                break
+
+    def _remove(self, key):
+        self._forget(key)
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
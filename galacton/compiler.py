@@ -0,0 +1,109 @@
+import html
+
+# Elements that have no closing tag in HTML
+VOID_ELEMENTS = {"area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "param", "source", "track", "wbr"}
+# Elements whose text is copied verbatim instead of being escaped
+RAW_TEXT_ELEMENTS = {"script", "style"}
+
+# Handlers registered for every compiler, by tag name
+TAG_HANDLERS = {}
+
+
+def register_tag_handler(tag, handler=None):
+    """Registers ``handler(compiler, element, out)`` to compile every ``tag`` element.
+
+    The handler appends the element's output to ``out``; the element's tail text
+    is emitted by the compiler afterwards. Can be used as a decorator.
+    """
+    if handler is None:
+        return lambda function: register_tag_handler(tag, function)
+    TAG_HANDLERS[tag] = handler
+    return handler
+
+
+def format_attributes(attributes):
+    """Formats an attribute mapping as HTML, with a leading space if it is not empty."""
+    return "".join(f' {key}="{html.escape(str(value), quote=True)}"' for key, value in attributes.items())
+
+
+class PyMLCompiler:
+    """Compiles a parsed .pyml tree into HTML, preserving the nesting of its elements.
+
+    Elements without a handler are copied with their attributes, text, children
+    and tail text, all properly escaped. The tree is walked with an explicit stack,
+    so deeply nested documents work, and output is produced as a stream of parts
+    (strings, or whatever objects handlers emit) in a single linear pass.
+    """
+
+    def __init__(self, handlers=None, context=None):
+        self.handlers = dict(TAG_HANDLERS)
+        self.handlers.update(handlers or {})
+        self.context = context  # Whatever the handlers need, such as the page being rendered
+
+    def compile(self, root):
+        """Returns the HTML for the children of ``root`` as a single string."""
+        return "".join(self.iter_compile(root))
+
+    def iter_compile(self, root):
+        """Yields the output parts for the content of ``root`` (its text and children) in order."""
+        out = []
+        if root.text:
+            out.append(self.escape_text(root.text))
+        # Each stack entry is (element, True) when the element's closing tag is due
+        stack = [(child, False) for child in reversed(root)]
+        while stack:
+            element, closing = stack.pop()
+            if closing:
+                out.append(f"</{self.tag_name(element)}>")
+                self._tail(element, out)
+            else:
+                self._open(element, out, stack)
+            if out:
+                yield from out
+                out.clear()
+        yield from out
+
+    def compile_children(self, element, out):
+        """Appends the compiled content of ``element`` to ``out``; for handlers that wrap their children."""
+        out.extend(self.iter_compile(element))
+
+    def attributes(self, element, **overrides):
+        """Returns the escaped attributes of ``element``, with some values optionally replaced."""
+        attributes = dict(element.attrib)
+        attributes.update(overrides)
+        return format_attributes(attributes)
+
+    @staticmethod
+    def tag_name(element):
+        # Strip the namespace from "{namespace}tag"
+        return element.tag.rpartition("}")[2]
+
+    @staticmethod
+    def escape_text(text):
+        return html.escape(text, quote=False)
+
+    def _open(self, element, out, stack):
+        # Comments and processing instructions are dropped, but their tail text is content
+        if not isinstance(element.tag, str):
+            self._tail(element, out)
+            return
+
+        tag = self.tag_name(element)
+        handler = self.handlers.get(tag)
+        if handler is not None:
+            handler(self, element, out)
+            self._tail(element, out)
+            return
+
+        out.append(f"<{tag}{self.attributes(element)}>")
+        if tag in VOID_ELEMENTS:
+            self._tail(element, out)
+            return
+        if element.text:
+            out.append(element.text if tag in RAW_TEXT_ELEMENTS else self.escape_text(element.text))
+        stack.append((element, True))
+        stack.extend((child, False) for child in reversed(element))
+
+    def _tail(self, element, out):
+        if element.tail:
+            out.append(self.escape_text(element.tail))
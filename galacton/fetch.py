@@ -0,0 +1,261 @@
+import os
+import re
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from email.utils import parsedate_to_datetime
+
+from galacton import trace
+
+
+class FetchResult:
+    """The body of a fetched URL and where it came from."""
+
+    def __init__(self, url, content, encoding=None, from_cache=False):
+        self.url = url
+        self.content = content
+        self.encoding = encoding or "utf-8"
+        self.from_cache = from_cache
+
+    @property
+    def text(self):
+        return self.content.decode(self.encoding, errors="replace")
+
+
+def parse_cache_control(headers):
+    """Returns (max_age, no_cache, no_store) from the caching headers of a response."""
+    directives = {}
+    for part in headers.get("Cache-Control", "").split(","):
+        name, _, value = part.strip().partition("=")
+        if name:
+            directives[name.lower()] = value.strip('"')
+    no_store = "no-store" in directives
+    no_cache = "no-cache" in directives
+    max_age = 0
+    if directives.get("max-age", "").isdigit():
+        max_age = int(directives["max-age"])
+    elif "Expires" in headers:
+        # Fall back to Expires relative to the server's Date
+        try:
+            expires = parsedate_to_datetime(headers["Expires"]).timestamp()
+            date = parsedate_to_datetime(headers["Date"]).timestamp() if "Date" in headers else time.time()
+            max_age = max(0, int(expires - date))
+        except (TypeError, ValueError):
+            max_age = 0
+    return max_age, no_cache, no_store
+
+
+class Fetcher:
+    """HTTP client shared by every page, with pooled connections and an on-disk cache.
+
+    Cached responses are served directly while fresh according to Cache-Control
+    (or Expires), and revalidated with If-None-Match/If-Modified-Since otherwise,
+    so an unchanged file costs a 304 instead of a download. When the network is
+    unreachable, or in offline mode, cached copies are served regardless of age.
+    """
+
+    def __init__(self, cache_dir, max_bytes=128 * 1024 * 1024, timeout=30, offline=None):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        if offline is None:
+            offline = os.environ.get("GALACTON_OFFLINE", "").lower() in ("1", "true", "yes")
+        self.offline = offline
+        self.hits = 0  # Served from disk without contacting the server
+        self.revalidated = 0  # Served from disk after a 304
+        self.downloads = 0
+        self.bytes_downloaded = 0
+        self._session = None
+        self._lock = threading.Lock()
+        self._entries = None  # key -> (size, last access time), least recently used first
+        self._total_bytes = 0
+
+    @property
+    def session(self):
+        # Created on first use, which also defers importing requests until something is fetched;
+        # one adapter keeps a pool of keep-alive connections per host
+        if self._session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=8, pool_maxsize=16)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            self._session = session
+        return self._session
+
+    def get_text(self, url, allow_stale=False):
+        return self.get(url, allow_stale).text
+
+    def get(self, url, allow_stale=False):
+        """Fetches ``url``, using and updating the on-disk cache.
+
+        With ``allow_stale`` any cached copy is returned without contacting the
+        server; the caller is expected to revalidate it later.
+        """
+        key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        metadata = self._load_metadata(key)
+
+        if metadata is not None:
+            fresh = not metadata["no_cache"] and time.time() - metadata["stored"] < metadata["max_age"]
+            if self.offline or fresh or allow_stale:
+                return self._serve(key, metadata)
+        elif self.offline:
+            raise ConnectionError(f"Offline and {url} is not cached")
+
+        import requests
+
+        # Ask the server whether our copy is still current
+        headers = {}
+        if metadata is not None:
+            if metadata.get("etag"):
+                headers["If-None-Match"] = metadata["etag"]
+            if metadata.get("last_modified"):
+                headers["If-Modified-Since"] = metadata["last_modified"]
+        try:
+            response = self.session.get(url, headers=headers, timeout=self.timeout)
+        except (requests.ConnectionError, requests.Timeout):
+            if metadata is not None:
+                return self._serve(key, metadata)  # Serve the stale copy rather than nothing
+            raise
+
+        max_age, no_cache, no_store = parse_cache_control(response.headers)
+        if response.status_code == 304 and metadata is not None:
+            metadata.update(stored=time.time(), max_age=max_age, no_cache=no_cache)
+            self._write_metadata(key, metadata)
+            self.revalidated += 1
+            trace.count("http.not_modified")
+            return self._serve(key, metadata, count_hit=False)
+
+        response.raise_for_status()  # Check for HTTP errors
+        self.downloads += 1
+        self.bytes_downloaded += len(response.content)
+        trace.count("http.downloads")
+        trace.count("http.bytes_fetched", len(response.content))
+        encoding = response.encoding or response.apparent_encoding
+        if no_store:
+            self._remove(key)
+        else:
+            self._store(key, response.content, {
+                "url": url,
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+                "stored": time.time(),
+                "max_age": max_age,
+                "no_cache": no_cache,
+                "encoding": encoding,
+            })
+        return FetchResult(url, response.content, encoding)
+
+    def stats(self):
+        with self._lock:
+            self._load_index()
+            return {
+                "hits": self.hits,
+                "revalidated": self.revalidated,
+                "downloads": self.downloads,
+                "bytes_downloaded": self.bytes_downloaded,
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+            }
+
+    def _body_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.body")
+
+    def _metadata_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def _load_metadata(self, key):
+        with self._lock:
+            self._load_index()
+            if key not in self._entries:
+                return None
+        try:
+            with open(self._metadata_path(key), "r", encoding="utf-8") as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return None
+
+    def _write_metadata(self, key, metadata):
+        temp_path = f"{self._metadata_path(key)}.{os.getpid()}.{threading.get_ident()}.part"
+        with open(temp_path, "w", encoding="utf-8") as file:
+            json.dump(metadata, file)
+        os.replace(temp_path, self._metadata_path(key))
+
+    def _serve(self, key, metadata, count_hit=True):
+        try:
+            with open(self._body_path(key), "rb") as file:
+                content = file.read()
+        except OSError:
+            # The body was evicted behind our back; fetch it again
+            self._remove(key)
+            return self.get(metadata["url"])
+        with self._lock:
+            if key in self._entries:
+                now = time.time()
+                self._entries[key] = (self._entries[key][0], now)
+                self._entries.move_to_end(key)
+                os.utime(self._body_path(key), (now, now))
+        if count_hit:
+            self.hits += 1
+            trace.count("http.cache_hit")
+        return FetchResult(metadata["url"], content, metadata.get("encoding"), from_cache=True)
+
+    def _store(self, key, content, metadata):
+        with self._lock:
+            self._load_index()
+            temp_path = f"{self._body_path(key)}.{os.getpid()}.{threading.get_ident()}.part"
+            with open(temp_path, "wb") as file:
+                file.write(content)
+            os.replace(temp_path, self._body_path(key))
+            self._write_metadata(key, metadata)
+
+            self._forget(key)
+            self._entries[key] = (len(content), time.time())
+            self._total_bytes += len(content)
+            self._evict()
+
+    def _load_index(self):
+        # Build the in-memory index from the files on disk the first time it is needed
+        if self._entries is not None:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        found = []
+        for name in os.listdir(self.cache_dir):
+            if not re.fullmatch(r"[0-9a-f]{64}\.body", name):
+                continue
+            try:
+                info = os.stat(os.path.join(self.cache_dir, name))
+            except OSError:
+                continue
+            found.append((info.st_mtime, name[:-len(".body")], info.st_size))
+        found.sort()
+        self._entries = OrderedDict((key, (size, mtime)) for mtime, key, size in found)
+        self._total_bytes = sum(size for _, _, size in found)
+        self._evict()
+
+    def _forget(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._total_bytes -= entry[0]
+
+    def _evict(self):
+        # Drop the least recently used responses until under budget
+        while self._total_bytes > self.max_bytes and self._entries:
+            self._delete(next(iter(self._entries)))
+
+    def _remove(self, key):
+        with self._lock:
+            self._load_index()
+            self._delete(key)
+
+    def _delete(self, key):
+        self._forget(key)
+        for path in (self._body_path(key), self._metadata_path(key)):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
@@ -0,0 +1,107 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+def page_key(url, pyml_content):
+    """Identifies a rendered page by its resolved URL and the hash of its source."""
+    return url, hashlib.sha256(pyml_content.encode("utf-8")).hexdigest()
+
+
+class PageCache:
+    """In-memory LRU of fully rendered pages, bounded by the total size of their HTML.
+
+    The key only covers the document itself, so each page is stored along with
+    the src scripts its blocks loaded, for get() to check that they are unchanged.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._pages = OrderedDict()  # key -> (HTML, sources), least recently used first
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key, is_current=None):
+        """Returns the page stored under ``key``, or None.
+
+        ``is_current`` is called with the sources the page was stored with; a page
+        it rejects is dropped and counts as a miss.
+        """
+        with self._lock:
+            entry = self._pages.get(key)
+        # Checking the sources may read files or go to the network, so it is done outside the lock
+        if entry is not None and is_current is not None and not is_current(entry[1]):
+            self._remove(key, entry)
+            entry = None
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            if key in self._pages:
+                self._pages.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._pages
+
+    def put(self, key, content, sources=None):
+        """Stores a page; ``sources`` maps the src scripts it loaded to the hashes of their code."""
+        size = len(content.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._pages:
+                self._total_bytes -= len(self._pages.pop(key)[0].encode("utf-8"))
+            self._pages[key] = (content, dict(sources or {}))
+            self._total_bytes += size
+            # Drop the least recently viewed pages until under budget
+            while self._total_bytes > self.max_bytes:
+                _, (evicted, _) = self._pages.popitem(last=False)
+                self._total_bytes -= len(evicted.encode("utf-8"))
+
+    def _remove(self, key, entry):
+        with self._lock:
+            # Only if it has not been replaced in the meantime
+            if self._pages.get(key) is entry:
+                del self._pages[key]
+                self._total_bytes -= len(entry[0].encode("utf-8"))
+
+
+class History:
+    """Back/forward list of visited documents."""
+
+    def __init__(self):
+        self.entries = []
+        self.index = -1
+
+    @property
+    def current(self):
+        return self.entries[self.index] if self.index >= 0 else None
+
+    def visit(self, url):
+        """Records a navigation to ``url``, discarding anything ahead of the current entry."""
+        if url == self.current:
+            return
+        del self.entries[self.index + 1:]
+        self.entries.append(url)
+        self.index += 1
+
+    def can_go_back(self):
+        return self.index > 0
+
+    def can_go_forward(self):
+        return self.index < len(self.entries) - 1
+
+    def back(self):
+        if self.can_go_back():
+            self.index -= 1
+        return self.current
+
+    def forward(self):
+        if self.can_go_forward():
+            self.index += 1
+        return self.current
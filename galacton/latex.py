@@ -0,0 +1,177 @@
+import os
+import re
+import shutil
+import hashlib
+import tempfile
+import threading
+import subprocess
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+from galacton import trace
+
+# Mirrors the preamble sympy's preview() uses, with the preview package splitting
+# every equation onto its own tightly cropped page
+LATEX_PREAMBLE = r"""\documentclass[12pt]{article}
+\usepackage{amsmath,amsfonts}
+\usepackage{euler}
+\usepackage{varwidth}
+\usepackage[active,tightpage]{preview}
+\pagestyle{empty}
+\begin{document}
+"""
+
+LATEX_EQUATION = r"""\begin{preview}\begin{varwidth}{\linewidth}
+%s
+\end{varwidth}\end{preview}
+"""
+
+
+def latex_hash(latex_code):
+    """Returns the md5 key under which the image for ``latex_code`` is cached."""
+    return hashlib.md5(latex_code.encode('utf-8')).hexdigest()
+
+
+# Image formats and the program that turns the DVI file into one image per page
+IMAGE_CONVERTERS = {"png": "dvipng", "svg": "dvisvgm"}
+
+
+class LatexEngine:
+    """Renders LaTeX snippets to PNG or SVG images cached by md5 in ``output_dir``.
+
+    All uncached snippets of a document are compiled in a single multi-page TeX run
+    and split into one image per page by dvipng or dvisvgm. If that run fails, the
+    snippets are compiled individually on a bounded pool so one bad equation only
+    breaks itself.
+    """
+
+    def __init__(self, output_dir, dpi=150, max_workers=None, timeout=120):
+        self.output_dir = output_dir
+        self.dpi = dpi
+        self.max_workers = max_workers or min(4, os.cpu_count() or 1)
+        self.timeout = timeout
+        self._tools = None
+        self._lock = threading.Lock()
+
+    def tools(self, image_format="png"):
+        # Look the programs up once, after the window has had a chance to extend PATH
+        if self._tools is None:
+            self._tools = {name: shutil.which(name) for name in ("latex", *IMAGE_CONVERTERS.values())}
+        return self._tools["latex"], self._tools[IMAGE_CONVERTERS[image_format]]
+
+    def image_path(self, latex_code, image_format="png"):
+        return os.path.join(self.output_dir, f"{latex_hash(latex_code)}.{image_format}")
+
+    def render_many(self, latex_codes, image_format="png"):
+        """Renders every snippet and returns a dict mapping each one to its image path or an Exception."""
+        results = {}
+        missing = {}
+        for latex_code in latex_codes:
+            output_image_path = self.image_path(latex_code, image_format)
+            if os.path.exists(output_image_path):
+                results[latex_code] = output_image_path
+                trace.count("latex.cache_hit")
+            else:
+                missing[latex_hash(latex_code)] = latex_code
+                trace.count("latex.cache_miss")
+        if not missing:
+            return results
+
+        latex_path, converter_path = self.tools(image_format)
+        if not latex_path or not converter_path:
+            converter = IMAGE_CONVERTERS[image_format]
+            error = EnvironmentError(f"LaTeX or {converter} program is not installed or not found in PATH.")
+            results.update((latex_code, error) for latex_code in missing.values())
+            return results
+
+        # Two pages rendering the same equations at once would only duplicate the work
+        with self._lock:
+            pending = [code for code in missing.values() if not os.path.exists(self.image_path(code, image_format))]
+            try:
+                self._compile(pending, image_format)
+            except Exception:
+                # Isolate the failing snippets by compiling them one by one
+                with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                    # Compile in copies of this context so the runs show up in the page's trace
+                    compiles = [
+                        executor.submit(contextvars.copy_context().run, self._compile_single, code, image_format)
+                        for code in pending
+                    ]
+                    errors = dict(zip(pending, (future.result() for future in compiles)))
+                for latex_code, error in errors.items():
+                    if error is not None:
+                        results[latex_code] = error
+
+        for latex_code in missing.values():
+            results.setdefault(latex_code, self.image_path(latex_code, image_format))
+        return results
+
+    def render(self, latex_code, image_format="png"):
+        """Renders a single snippet and returns its image path, raising on failure."""
+        result = self.render_many([latex_code], image_format)[latex_code]
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def _compile_single(self, latex_code, image_format="png"):
+        try:
+            self._compile([latex_code], image_format)
+        except Exception as e:
+            return e
+        return None
+
+    def _compile(self, latex_codes, image_format="png"):
+        if not latex_codes:
+            return
+        with trace.span("latex.compile", equations=len(latex_codes), format=image_format):
+            self._compile_in_directory(latex_codes, image_format)
+
+    def _compile_in_directory(self, latex_codes, image_format):
+        # Work inside the output directory so the finished images can be renamed into place
+        with tempfile.TemporaryDirectory(dir=self.output_dir) as work_dir:
+            tex_path = os.path.join(work_dir, "equations.tex")
+            with open(tex_path, "w", encoding="utf-8") as tex_file:
+                tex_file.write(LATEX_PREAMBLE)
+                for latex_code in latex_codes:
+                    tex_file.write(LATEX_EQUATION % latex_code)
+                tex_file.write("\\end{document}\n")
+
+            trace.count("subprocess.spawn")
+            result = subprocess.run(
+                ["latex", "-interaction=nonstopmode", "-halt-on-error", "equations.tex"],
+                cwd=work_dir, capture_output=True, text=True, errors="replace", timeout=self.timeout,
+            )
+            if result.returncode != 0:
+                raise RuntimeError(f"latex error: {_first_tex_error(result.stdout)}")
+
+            converter = IMAGE_CONVERTERS[image_format]
+            if image_format == "svg":
+                # Glyphs become paths, so the images need no fonts and scale without re-rendering
+                command = ["dvisvgm", "--page=1-", "--no-fonts", "--exact-bbox", "-o", "page%p.svg", "equations.dvi"]
+            else:
+                command = ["dvipng", "-D", str(self.dpi), "-o", "page%d.png", "equations.dvi"]
+            trace.count("subprocess.spawn")
+            result = subprocess.run(
+                command, cwd=work_dir, capture_output=True, text=True, errors="replace", timeout=self.timeout,
+            )
+            if result.returncode != 0:
+                raise RuntimeError(f"{converter} error: {result.stderr.strip()}")
+
+            # dvisvgm pads page numbers to the width of the last one, so match them by value
+            pages = {}
+            for name in os.listdir(work_dir):
+                match = re.fullmatch(rf"page(\d+)\.{image_format}", name)
+                if match:
+                    pages[int(match.group(1))] = os.path.join(work_dir, name)
+
+            # Page n of the DVI holds the n-th equation
+            for page, latex_code in enumerate(latex_codes, start=1):
+                if page not in pages:
+                    raise RuntimeError(f"{converter} error: page {page} was not produced")
+                os.replace(pages[page], self.image_path(latex_code, image_format))
+
+
+def _first_tex_error(log):
+    # TeX reports errors on lines starting with "!"
+    match = re.search(r"^!.*$", log, re.MULTILINE)
+    return match.group(0) if match else log.strip()[-500:]
@@ -0,0 +1,147 @@
+import os
+import sys
+import threading
+
+try:
+    import resource  # Not available on Windows, where only the wall-clock timeout applies
+except ImportError:
+    resource = None
+
+MB = 1024 * 1024
+
+
+class LimitExceeded(BaseException):
+    """Raised inside a worker when a block runs out of CPU time or output.
+
+    It derives from BaseException, like KeyboardInterrupt, so that a bare
+    ``except Exception`` in the block's own code does not swallow it.
+    """
+
+
+class BudgetExceeded(Exception):
+    """Raised when a page has used up its CPU budget before all its blocks have run."""
+
+
+def _env_number(name, default):
+    value = os.environ.get(name)
+    if not value:
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        return default
+
+
+class ResourceLimits:
+    """Limits on the code blocks of a page, read from the environment by from_env.
+
+    A limit of 0 or None turns that limit off. CPU time is enforced with
+    RLIMIT_CPU in the Python workers and setTimeLimit in R, to the nearest
+    second; memory with RLIMIT_AS on every worker process.
+    """
+
+    def __init__(self, block_cpu_seconds=60, page_cpu_seconds=300, memory_bytes=2048 * MB, output_bytes=16 * MB):
+        self.block_cpu_seconds = block_cpu_seconds  # CPU time of a single block
+        self.page_cpu_seconds = page_cpu_seconds  # CPU time of all the blocks of a page together
+        self.memory_bytes = memory_bytes  # Address space of each worker process
+        self.output_bytes = output_bytes  # Text, HTML and images a single block may produce
+
+    @classmethod
+    def from_env(cls):
+        defaults = cls()
+        return cls(
+            block_cpu_seconds=_env_number("GALACTON_CPU_LIMIT", defaults.block_cpu_seconds),
+            page_cpu_seconds=_env_number("GALACTON_PAGE_CPU_BUDGET", defaults.page_cpu_seconds),
+            memory_bytes=int(_env_number("GALACTON_MEMORY_LIMIT", defaults.memory_bytes / MB) * MB),
+            output_bytes=int(_env_number("GALACTON_OUTPUT_LIMIT", defaults.output_bytes / MB) * MB),
+        )
+
+
+class PageBudget:
+    """The CPU time left to the blocks of one page, which may run concurrently."""
+
+    def __init__(self, limits):
+        self.limits = limits
+        self.used = 0.0
+        self._lock = threading.Lock()
+
+    def allowance(self):
+        """Returns the CPU seconds the next block may use, or None for no limit.
+
+        Raises BudgetExceeded once the page has used its whole budget.
+        """
+        allowed = self.limits.block_cpu_seconds or None
+        if self.limits.page_cpu_seconds:
+            with self._lock:
+                left = self.limits.page_cpu_seconds - self.used
+            if left <= 0:
+                raise BudgetExceeded(f"the page has used its CPU budget of {self.limits.page_cpu_seconds:g} s")
+            allowed = left if allowed is None else min(allowed, left)
+        return allowed
+
+    def charge(self, usage):
+        if usage:
+            with self._lock:
+                self.used += usage.get("cpu_seconds", 0.0)
+
+
+def limit_memory(memory_bytes):
+    """Caps the address space of the calling process; the Python workers call it as they start."""
+    if memory_bytes and resource is not None:
+        resource.setrlimit(resource.RLIMIT_AS, (memory_bytes, memory_bytes))
+
+
+def limit_process_memory(pid, memory_bytes):
+    """Caps the address space of the already running process ``pid``, where prlimit is available (Linux)."""
+    if memory_bytes and hasattr(resource, "prlimit"):
+        try:
+            resource.prlimit(pid, resource.RLIMIT_AS, (memory_bytes, memory_bytes))
+        except ProcessLookupError:
+            # It has already exited, which the caller finds out when it talks to it
+            pass
+
+
+def memory_limited_command(command, memory_bytes):
+    """Returns ``command``, started through a shell that caps its address space where prlimit is unavailable.
+
+    Elsewhere it is returned unchanged, for limit_process_memory once it has started.
+    """
+    if not memory_bytes or os.name != "posix" or hasattr(resource, "prlimit"):
+        return command
+    # ulimit -v takes kilobytes; exec "$@" runs the command with its arguments untouched
+    return ["sh", "-c", f'ulimit -v {memory_bytes // 1024}; exec "$@"', "sh"] + list(command)
+
+
+def limit_cpu(seconds):
+    """Lets the calling process use ``seconds`` more CPU time before it gets SIGXCPU; None lifts the limit.
+
+    Only the soft limit is changed, so it can be raised again for the next block.
+    """
+    if resource is None:
+        return
+    _, hard = resource.getrlimit(resource.RLIMIT_CPU)
+    if seconds:
+        soft = int(cpu_time() + seconds + 0.999)
+        if hard != resource.RLIM_INFINITY:
+            soft = min(soft, hard)
+    else:
+        soft = hard
+    resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+
+
+def cpu_time():
+    """CPU seconds used by the calling process so far, in user and system mode."""
+    if resource is None:
+        times = os.times()
+        return times.user + times.system
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def max_rss_bytes():
+    """Peak resident memory of the calling process, or None where it cannot be measured."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == "darwin" else peak * 1024
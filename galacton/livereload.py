@@ -0,0 +1,79 @@
+import os
+
+from PyQt5.QtCore import QFileSystemWatcher, QObject, QTimer, pyqtSignal, pyqtSlot
+
+# Editors often write a file in several steps; wait this long after the last change before reloading
+DEBOUNCE_MS = 100
+
+
+def _signature(path):
+    try:
+        info = os.stat(path)
+    except OSError:
+        return None
+    return info.st_mtime_ns, info.st_size
+
+
+class FileWatcher(QObject):
+    """Watches a set of local files and reports when any of them has been saved.
+
+    Many editors save by writing a new file and renaming it over the old one,
+    which makes QFileSystemWatcher drop the path. The directories are watched
+    as well, so such files are picked up again as soon as they reappear.
+    """
+
+    # Emitted once per burst of changes, after DEBOUNCE_MS without further changes
+    changed = pyqtSignal()
+
+    def __init__(self, parent=None, delay_ms=DEBOUNCE_MS):
+        super().__init__(parent)
+        self._watcher = QFileSystemWatcher(self)
+        self._watcher.fileChanged.connect(self._file_changed)
+        self._watcher.directoryChanged.connect(self._directory_changed)
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(delay_ms)
+        self._timer.timeout.connect(self.changed)
+        self._files = {}  # path -> (mtime, size) when last seen, or None while it is missing
+
+    def watch(self, paths):
+        """Replaces the watched files with ``paths``; an empty list stops watching."""
+        paths = {os.path.abspath(path) for path in paths}
+        if paths == set(self._files):
+            return
+        self._timer.stop()
+        for watched in (self._watcher.files(), self._watcher.directories()):
+            if watched:
+                self._watcher.removePaths(watched)
+        self._files = {path: _signature(path) for path in paths}
+        directories = {os.path.dirname(path) for path in paths}
+        existing = [path for path in list(paths) + list(directories) if os.path.exists(path)]
+        if existing:
+            self._watcher.addPaths(existing)
+
+    @property
+    def files(self):
+        return sorted(self._files)
+
+    @pyqtSlot(str)
+    def _file_changed(self, path):
+        self._check(path, modified=True)
+
+    @pyqtSlot(str)
+    def _directory_changed(self, directory):
+        # Something in the directory was created, removed or renamed: look at our files in it
+        for path in list(self._files):
+            if os.path.dirname(path) == directory:
+                self._check(path)
+
+    def _check(self, path, modified=False):
+        if path not in self._files:
+            return
+        signature = _signature(path)
+        if signature is not None and path not in self._watcher.files():
+            # The file was replaced rather than written in place
+            self._watcher.addPath(path)
+        if signature != self._files[path] or modified:
+            self._files[path] = signature
+            if signature is not None:
+                self._timer.start()
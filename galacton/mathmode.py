@@ -0,0 +1,98 @@
+import os
+import html
+import pathlib
+
+from galacton import trace
+
+# How <latex> blocks are shown: as PNG or SVG images made by the TeX toolchain, or typeset
+# in the page by a locally installed KaTeX or MathJax
+MATH_MODES = ("png", "svg", "katex", "mathjax")
+DEFAULT_MATH_MODE = "png"
+
+# Client-side renderers are loaded from assets/<mode>/ next to main.py, never from a CDN
+BUNDLES_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "assets")
+BUNDLE_FILES = {
+    "katex": ("katex.min.js", "katex.min.css", "contrib/auto-render.min.js"),
+    "mathjax": ("tex-svg.js",),
+}
+
+KATEX_HEAD = """
+                <link rel="stylesheet" href="{base}katex.min.css">
+                <script defer src="{base}katex.min.js"></script>
+                <script defer src="{base}contrib/auto-render.min.js"></script>
+                <script>
+                document.addEventListener("DOMContentLoaded", function () {
+                    document.querySelectorAll(".galacton-math").forEach(function (element) {
+                        renderMathInElement(element, {
+                            delimiters: [
+                                {left: "$$", right: "$$", display: true},
+                                {left: "\\\\[", right: "\\\\]", display: true},
+                                {left: "\\\\begin{equation}", right: "\\\\end{equation}", display: true},
+                                {left: "\\\\begin{align}", right: "\\\\end{align}", display: true},
+                                {left: "\\\\(", right: "\\\\)", display: false},
+                                {left: "$", right: "$", display: false}
+                            ],
+                            throwOnError: false
+                        });
+                    });
+                });
+                </script>"""
+
+MATHJAX_HEAD = """
+                <script>
+                window.MathJax = {
+                    tex: {inlineMath: [["$", "$"], ["\\\\(", "\\\\)"]], processEnvironments: true},
+                    options: {ignoreHtmlClass: "galacton-page", processHtmlClass: "galacton-math"}
+                };
+                </script>
+                <script defer src="{base}tex-svg.js"></script>"""
+
+
+def bundle_dir(mode):
+    return os.path.join(BUNDLES_DIR, mode)
+
+
+def bundle_url(mode):
+    """Returns the file:// URL of a client-side renderer's directory, with a trailing slash."""
+    return pathlib.Path(bundle_dir(mode)).as_uri() + "/"
+
+
+def bundle_available(mode):
+    return all(os.path.isfile(os.path.join(bundle_dir(mode), name)) for name in BUNDLE_FILES[mode])
+
+
+def resolve_math_mode(requested, latex_engine):
+    """Returns the math mode for a document.
+
+    ``requested`` is the document's math="..." attribute; without it GALACTON_MATH
+    decides, and PNG is the default. A client-side renderer that is not installed
+    falls back to SVG images, and SVG falls back to PNG when dvisvgm is missing.
+    """
+    mode = (requested or os.environ.get("GALACTON_MATH") or DEFAULT_MATH_MODE).strip().lower()
+    if mode not in MATH_MODES:
+        trace.error("math", f"unknown math mode {mode!r}; using {DEFAULT_MATH_MODE}")
+        return DEFAULT_MATH_MODE
+    if mode in BUNDLE_FILES and not bundle_available(mode):
+        trace.error("math", f"{mode} is not installed in {bundle_dir(mode)}; rendering equations as images")
+        mode = "svg"
+    if mode == "svg" and not latex_engine.tools("svg")[1]:
+        mode = "png"
+    return mode
+
+
+def is_client_side(mode):
+    return mode in BUNDLE_FILES
+
+
+def math_head(mode):
+    """Returns the <head> markup that loads the client-side renderer for ``mode``, if any."""
+    if mode == "katex":
+        return KATEX_HEAD.replace("{base}", bundle_url(mode))
+    if mode == "mathjax":
+        return MATHJAX_HEAD.replace("{base}", bundle_url(mode))
+    return ""
+
+
+def math_html(latex_code):
+    """Returns the markup the client-side renderers typeset: the LaTeX source, escaped."""
+    return f'<div class="galacton-math">{html.escape(latex_code)}</div>'
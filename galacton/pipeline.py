@@ -0,0 +1,406 @@
+import os
+import threading
+from urllib.parse import urlparse
+
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, QTimer, pyqtSignal, pyqtSlot
+
+from galacton import trace
+from galacton.history import PageCache, page_key
+from galacton.livereload import FileWatcher
+from galacton.pyml import PageRenderer, document_url, load_pyml_source, sources_unchanged
+
+# How long the view has to stay idle after a page finishes before its links are prefetched
+PREFETCH_DELAY_MS = 1000
+
+
+def _env_flag(name, default):
+    return os.environ.get(name, "1" if default else "0").lower() in ("1", "true", "yes")
+
+
+class _Task(QRunnable):
+    """Runs a callable on a thread pool."""
+
+    def __init__(self, function, *args):
+        super().__init__()
+        self.function = function
+        self.args = args
+
+    def run(self):
+        self.function(*self.args)
+
+
+class _LivePage:
+    """What is on screen for a local document that is watched for changes."""
+
+    def __init__(self, file_path, base_url, page=None, renderer=None, shown=None):
+        self.file_path = file_path
+        self.base_url = base_url
+        self.page = page  # Page whose skeleton is displayed, or None if it came from the page cache
+        self.renderer = renderer  # Renderer of the blocks, whose outputs a reload can reuse
+        self.shown = dict(shown or {})  # block index -> HTML currently displayed
+
+
+class RenderPipeline(QObject):
+    """Fetches, parses and renders .pyml documents off the GUI thread.
+
+    Every call to load() starts a new generation; work belonging to an older
+    generation is abandoned at the next block boundary and its results are dropped.
+    Code the abandoned page is still running is stopped by killing its interpreter,
+    which is restarted, so the next page never waits for it.
+
+    Fully rendered pages are kept in a PageCache keyed by URL and content hash, so
+    revisiting an unchanged page shows it at once. A page is only shown from there
+    if its src scripts are unchanged too, and pages with cache="False" blocks are
+    never kept, so their blocks run on every visit. Once a page has finished and
+    the view has been idle for a moment, the documents it links to are prefetched
+    into the HTTP cache (GALACTON_PREFETCH, on by default) and optionally rendered
+    ahead of time into the page cache (GALACTON_PRERENDER, off by default, since
+    it runs the linked pages' code).
+
+    Each load is timed by a Trace that is reported through ``traced`` once the
+    page is done, and saved as a Chrome trace file unless GALACTON_TRACE=0.
+
+    Every document that is opened is added to the search index in the background,
+    along with the other documents in a local document's directory.
+
+    Local documents and their local src scripts are watched while they are shown
+    (GALACTON_LIVE_RELOAD, on by default). When one is saved, only the blocks
+    whose code or session history changed are run again, and only the blocks
+    whose output changed are sent to the view. If the static markup changed too,
+    ``page_updated`` asks the view to swap the skeleton without losing its place.
+    """
+
+    # generation, file path, document content, base URL
+    fetched = pyqtSignal(int, str, str, str)
+    # generation, skeleton HTML with a placeholder per block
+    page_ready = pyqtSignal(int, str)
+    # generation, element id of the block placeholder, rendered HTML
+    block_ready = pyqtSignal(int, str, str)
+    # generation, error HTML to display instead of the page
+    failed = pyqtSignal(int, str)
+    # generation, links of a page whose blocks have all been rendered
+    finished = pyqtSignal(int, list)
+    # generation, file path of a page that was shown from a stale cached copy and has changed since
+    outdated = pyqtSignal(int, str)
+    # generation, Trace of a page that has finished loading, successfully or not
+    traced = pyqtSignal(int, object)
+    # generation, new skeleton HTML for the page on screen, to be shown at the same scroll position
+    page_updated = pyqtSignal(int, str)
+    # generation, _LivePage of a page built on a worker, and whether to watch its files at once;
+    # live reload state and the file watcher are only touched on the GUI thread
+    _live_started = pyqtSignal(int, object, bool)
+
+    def __init__(self, services, parent=None, prefetch=None, prerender=None, live_reload=None):
+        super().__init__(parent)
+        self.services = services
+        self.generation = 0
+        self.page_cache = PageCache()
+        self.prefetch = _env_flag("GALACTON_PREFETCH", True) if prefetch is None else prefetch
+        self.prerender = _env_flag("GALACTON_PRERENDER", False) if prerender is None else prerender
+        self.save_traces = _env_flag("GALACTON_TRACE", True)
+        self.current_trace = None
+        self.live_reload = _env_flag("GALACTON_LIVE_RELOAD", True) if live_reload is None else live_reload
+        self.live = None  # _LivePage of the watched document
+        self.watcher = FileWatcher(self)
+        self.watcher.changed.connect(self.reload_changed)
+        # Renderer of the page on screen, whose running code is stopped when it is abandoned
+        self.active_renderer = None
+        self._renderer_lock = threading.Lock()
+
+        # Fetching and building pages can overlap freely; one task per page drives that page's block scheduler
+        self.fetch_pool = QThreadPool(self)
+        self.block_pool = QThreadPool(self)
+        self.block_pool.setMaxThreadCount(1)
+        # Prefetching happens one document at a time so it never competes much with the visible page
+        self.prefetch_pool = QThreadPool(self)
+        self.prefetch_pool.setMaxThreadCount(1)
+        # Indexing is a single background queue, so SQLite only ever sees one writer
+        self.index_pool = QThreadPool(self)
+        self.index_pool.setMaxThreadCount(1)
+
+        self.fetched.connect(self._schedule_index)
+        self._live_started.connect(self._set_live)
+        self.finished.connect(self._schedule_prefetch)
+        self.finished.connect(self._watch)
+        self.outdated.connect(self._reload_outdated)
+
+    def load(self, file_path, allow_stale=False):
+        """Starts rendering ``file_path`` and cancels whatever was rendering before.
+
+        With ``allow_stale`` a cached copy of a remote page is shown straight away
+        and revalidated in the background; the page is reloaded if it changed.
+        """
+        self._abandon()
+        self.current_trace = trace.Trace(file_path)
+        self._stop_watching()
+        self.fetch_pool.start(_Task(self._fetch, self.generation, file_path, allow_stale, self.current_trace))
+        return self.generation
+
+    def render_content(self, pyml_content, base_url):
+        """Starts rendering already loaded content, cancelling whatever was rendering before."""
+        self._abandon()
+        self.current_trace = trace.Trace(base_url)
+        self._stop_watching()
+        self.fetch_pool.start(_Task(self._build_page, self.generation, "", pyml_content, base_url, self.current_trace))
+        return self.generation
+
+    def cancel(self):
+        """Abandons the page currently being rendered."""
+        self._abandon()
+        self._stop_watching()
+
+    @pyqtSlot()
+    def reload_changed(self):
+        """Brings the watched document up to date after it or one of its src scripts was saved."""
+        live = self.live
+        if live is None:
+            return
+        self._abandon()
+        self.current_trace = trace.Trace(live.file_path)
+        self.fetch_pool.start(_Task(self._rebuild_page, self.generation, live, self.current_trace))
+
+    def is_current(self, generation):
+        return generation == self.generation
+
+    def _abandon(self):
+        # Start a new generation and stop the code still running for the previous page, so
+        # it does not hold on to the block pool and the interpreters until it finishes
+        self.generation += 1
+        with self._renderer_lock:
+            renderer, self.active_renderer = self.active_renderer, None
+        if renderer is not None:
+            renderer.cancel()
+
+    def _activate_renderer(self, generation, renderer):
+        # Runs on a worker thread. Tells whether the renderer's page is still wanted
+        with self._renderer_lock:
+            if not self.is_current(generation):
+                return False
+            self.active_renderer = renderer
+            return True
+
+    def _rebuild_page(self, generation, live, page_trace):
+        # Runs on a worker thread
+        try:
+            pyml_content, base_url = load_pyml_source(live.file_path, self.services.fetcher)
+        except OSError:
+            return  # Saved halfway; the watcher reports the rest of the save
+        previous_outputs = dict(live.renderer.outputs) if live.renderer is not None else {}
+
+        with trace.activate(page_trace):
+            renderer = PageRenderer(base_url, self.services, previous_outputs)
+            if not self._activate_renderer(generation, renderer):
+                return
+            try:
+                page = renderer.build_page(pyml_content)
+            except Exception as e:
+                # Most likely a half-typed edit: show the error and start from scratch on the next save
+                trace.error("parse", e)
+                self._live_started.emit(generation, _LivePage(live.file_path, base_url, renderer=live.renderer), False)
+                self.failed.emit(generation, f"<p>Error parsing PyML: {e}</p>")
+                self._complete_trace(generation, page_trace)
+                return
+            if page.same_layout(live.page):
+                # Only code changed: the blocks are patched into the page as it is
+                shown = live.shown
+            else:
+                # Keep showing the old output of blocks that are still in the same place until they are redone
+                shown = {
+                    block.index: live.shown[block.index]
+                    for block in page.blocks
+                    if block.index in live.shown and live.page is not None
+                    and block.index < len(live.page.blocks) and live.page.blocks[block.index].tag == block.tag
+                }
+                with trace.span("skeleton"):
+                    self.page_updated.emit(generation, page.html(shown))
+        live = _LivePage(live.file_path, base_url, page, renderer, shown)
+        self._live_started.emit(generation, live, False)
+        self.index_pool.start(_Task(self._index, live.file_path, pyml_content))
+        key = page_key(document_url(live.file_path), pyml_content)
+        self.block_pool.start(_Task(self._render_blocks, generation, renderer, page, key, page_trace, live))
+
+    def _fetch(self, generation, file_path, allow_stale=False, page_trace=None):
+        # Runs on a worker thread
+        with trace.activate(page_trace):
+            try:
+                with trace.span("fetch", url=file_path):
+                    pyml_content, base_url = load_pyml_source(file_path, self.services.fetcher, allow_stale)
+            except Exception as e:
+                trace.error("fetch", e)
+                self.failed.emit(generation, f"<p>Error loading PyML: {e}</p>")
+                self._complete_trace(generation, page_trace)
+                return
+        self.fetched.emit(generation, file_path, pyml_content, base_url)
+        self._build_page(generation, file_path, pyml_content, base_url, page_trace)
+
+        if allow_stale:
+            # Now check with the server whether the copy that is being shown is still current
+            try:
+                latest_content, _ = load_pyml_source(file_path, self.services.fetcher)
+            except Exception:
+                return
+            if latest_content != pyml_content:
+                self.outdated.emit(generation, file_path)
+
+    @pyqtSlot(int, str)
+    def _reload_outdated(self, generation, file_path):
+        if self.is_current(generation):
+            self.load(file_path)
+
+    def _build_page(self, generation, file_path, pyml_content, base_url, page_trace=None):
+        # Runs on a worker thread, so that parsing and compiling a large document never blocks the view
+        if not self.is_current(generation):
+            return
+        with trace.activate(page_trace):
+            key = page_key(document_url(file_path), pyml_content) if file_path else None
+            cached_page = self.page_cache.get(key, self._sources_unchanged) if key else None
+            if cached_page is not None:
+                trace.count("page_cache.hit")
+                self.page_ready.emit(generation, cached_page)
+                # No blocks will run, so the document can be watched straight away
+                self._start_watching(generation, file_path, base_url, watch=True)
+                self._complete_trace(generation, page_trace)
+                return
+
+            renderer = PageRenderer(base_url, self.services)
+            if not self._activate_renderer(generation, renderer):
+                return
+            try:
+                page = renderer.build_page(pyml_content)
+            except Exception as e:
+                trace.error("parse", e)
+                self.failed.emit(generation, f"<p>Error parsing PyML: {e}</p>")
+                self._complete_trace(generation, page_trace)
+                return
+            with trace.span("skeleton"):
+                self.page_ready.emit(generation, page.html())
+        live = self._start_watching(generation, file_path, base_url, page, renderer)
+        self.block_pool.start(_Task(self._render_blocks, generation, renderer, page, key, page_trace, live))
+
+    def _render_blocks(self, generation, renderer, page, key, page_trace=None, live=None):
+        # Runs on a worker thread
+        results = {}
+        shown = live.shown if live is not None else {}
+        rendered = renderer.render_blocks(page.blocks, lambda: not self.is_current(generation))
+        with trace.activate(page_trace):
+            try:
+                with trace.span("blocks", blocks=len(page.blocks)):
+                    for block, output_html in rendered:
+                        if not self.is_current(generation):
+                            return  # The user navigated away
+                        results[block.index] = output_html
+                        if shown.get(block.index) == output_html:
+                            continue  # Already on screen, from before a live reload
+                        shown[block.index] = output_html
+                        self.block_ready.emit(generation, block.element_id, output_html)
+            except Exception as e:
+                trace.error("render", e)
+                self.failed.emit(generation, f"<p>Error rendering PyML: {e}</p>")
+                self._complete_trace(generation, page_trace)
+                return
+            finally:
+                # The blocks still running are waited for before their sessions are freed
+                rendered.close()
+                renderer.close()
+        if key is not None and page.cacheable:
+            self.page_cache.put(key, page.html(results), renderer.sources)
+        self._complete_trace(generation, page_trace)
+        self.finished.emit(generation, page.links)
+
+    def _sources_unchanged(self, sources):
+        return sources_unchanged(sources, self.services.fetcher)
+
+    @pyqtSlot(int, str, str, str)
+    def _schedule_index(self, generation, file_path, pyml_content, base_url):
+        if file_path:
+            self.index_pool.start(_Task(self._index, file_path, pyml_content))
+
+    def _index(self, file_path, pyml_content):
+        # Runs on a worker thread. Search is a convenience: a document that cannot be indexed is left out
+        url = document_url(file_path)
+        search_index = self.services.search_index
+        try:
+            search_index.add(url, pyml_content)
+            if urlparse(url).scheme not in ['http', 'https']:
+                search_index.scan(os.path.dirname(url), recursive=False)
+        except Exception:
+            pass
+
+    def _start_watching(self, generation, file_path, base_url, page=None, renderer=None, watch=False):
+        # Remember what is shown of a local document, so a save can be turned into a patch
+        if not self.live_reload or not file_path or urlparse(document_url(file_path)).scheme in ['http', 'https']:
+            return None
+        live = _LivePage(document_url(file_path), base_url, page, renderer)
+        self._live_started.emit(generation, live, watch)
+        return live
+
+    @pyqtSlot(int, object, bool)
+    def _set_live(self, generation, live, watch):
+        if not self.is_current(generation):
+            return
+        self.live = live
+        if watch:
+            self._watch(generation)
+
+    def _stop_watching(self):
+        self.live = None
+        self.watcher.watch([])
+
+    def _watch(self, generation, links=None):
+        # The src scripts are only known once the blocks have been planned
+        live = self.live
+        if live is None or not self.is_current(generation):
+            return
+        sources = live.renderer.local_sources if live.renderer is not None else ()
+        self.watcher.watch([live.file_path, *sources])
+
+    def _complete_trace(self, generation, page_trace):
+        # Save the trace of a page that is done and hand it to whoever displays it
+        if page_trace is None:
+            return
+        page_trace.finish()
+        try:
+            if self.save_traces:
+                page_trace.save(self.services.trace_dir)
+            else:
+                page_trace.save_profile(self.services.trace_dir)
+        except OSError:
+            pass
+        self.traced.emit(generation, page_trace)
+
+    @pyqtSlot(int, list)
+    def _schedule_prefetch(self, generation, links):
+        if not (self.prefetch or self.prerender) or not links:
+            return
+        QTimer.singleShot(PREFETCH_DELAY_MS, lambda: self._start_prefetch(generation, links))
+
+    def _start_prefetch(self, generation, links):
+        # Only prefetch if the user is still looking at the same page
+        if self.is_current(generation):
+            self.prefetch_pool.start(_Task(self._prefetch, generation, links))
+
+    def _prefetch(self, generation, links):
+        # Runs on a worker thread
+        for link in links:
+            if not self.is_current(generation):
+                return  # Stop as soon as the user navigates
+            try:
+                pyml_content, base_url = load_pyml_source(link, self.services.fetcher)
+            except Exception:
+                continue
+            key = page_key(document_url(link), pyml_content)
+            if not self.prerender or key in self.page_cache:
+                continue
+
+            renderer = PageRenderer(base_url, self.services)
+            try:
+                page = renderer.build_page(pyml_content)
+                results = {}
+                for block, output_html in renderer.render_blocks(page.blocks, lambda: not self.is_current(generation)):
+                    results[block.index] = output_html
+            except Exception:
+                continue
+            finally:
+                renderer.close()
+            if self.is_current(generation) and len(results) == len(page.blocks) and page.cacheable:
+                self.page_cache.put(key, page.html(results), renderer.sources)
@@ -0,0 +1,360 @@
+import io
+import os
+import sys
+import queue
+import base64
+import pickle
+import signal
+import struct
+import threading
+import importlib
+import subprocess
+
+from galacton import trace
+from galacton.limits import MB, LimitExceeded, cpu_time, limit_cpu, limit_memory, max_rss_bytes
+
+# Modules from requirements.txt that workers import before accepting any code
+WARM_IMPORTS = ["numpy", "pandas", "matplotlib", "plotly.graph_objects", "scipy"]
+
+# Command line flag that turns a frozen Galacton executable into a Python worker
+KERNEL_FLAG = "--galacton-python-kernel"
+
+
+class PythonExecutionError(Exception):
+    """Raised when Python code fails inside a worker, carrying what the code used until then."""
+
+    def __init__(self, message, usage=None):
+        super().__init__(message)
+        self.usage = usage
+
+
+def _write_message(stream, message):
+    # Messages are pickles prefixed with their length
+    data = pickle.dumps(message)
+    stream.write(struct.pack("!I", len(data)) + data)
+    stream.flush()
+
+
+def _read_message(stream):
+    header = stream.read(4)
+    if len(header) < 4:
+        raise EOFError
+    (length,) = struct.unpack("!I", header)
+    return pickle.loads(stream.read(length))
+
+
+class _Outputs(io.TextIOBase):
+    """Stands in for sys.stdout in a worker, keeping printed text and displayed objects in order."""
+
+    def __init__(self, limit=None):
+        self.items = []
+        self.size = 0
+        self.limit = limit  # Bytes of output allowed, or None
+
+    def _account(self, size):
+        self.size += size
+        if self.limit and self.size > self.limit:
+            raise LimitExceeded(f"output limit of {self.limit / MB:g} MB exceeded")
+
+    def write(self, text):
+        self._account(len(text))
+        if self.items and self.items[-1][0] == "text":
+            self.items[-1] = ("text", self.items[-1][1] + text)
+        else:
+            self.items.append(("text", text))
+        return len(text)
+
+    def display(self, obj):
+        """Shows ``obj`` on the page, using its HTML or PNG representation when it has one."""
+        # Representations may return None, as a matplotlib figure's _repr_html_ does outside notebooks
+        output_html = obj._repr_html_() if hasattr(obj, "_repr_html_") else None
+        if output_html is not None:
+            self._account(len(output_html))
+            self.items.append(("html", output_html))
+            return
+        png = obj._repr_png_() if hasattr(obj, "_repr_png_") else None
+        if png is None and hasattr(obj, "savefig"):
+            buffer = io.BytesIO()
+            obj.savefig(buffer, format="png")
+            png = buffer.getvalue()
+        if png is not None:
+            self._account(len(png))
+            self.items.append(("image", png))
+        else:
+            self.write(f"{obj}\n")
+
+
+def serve():
+    """Runs the worker loop on stdin/stdout. This is the entry point of every worker process."""
+    memory_limit = int(os.environ.get("GALACTON_KERNEL_MEMORY", 0))
+    # Keep the real stdout for replies, so that output written straight to file
+    # descriptor 1 by extension modules cannot corrupt the protocol
+    replies = os.fdopen(os.dup(sys.stdout.fileno()), "wb")
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+    requests = sys.stdin.buffer
+
+    limit_memory(memory_limit)
+    cpu_limit = None
+
+    def cpu_exceeded(signum, frame):
+        # Delivered once the block has used its CPU time; see limit_cpu
+        raise LimitExceeded(f"CPU time limit of {cpu_limit:g} s exceeded" if cpu_limit else "CPU time limit exceeded")
+
+    if hasattr(signal, "SIGXCPU"):
+        signal.signal(signal.SIGXCPU, cpu_exceeded)
+
+    for module in WARM_IMPORTS:
+        try:
+            importlib.import_module(module)
+        except ImportError:
+            pass
+
+    sessions = {}
+    while True:
+        try:
+            command, session, code, limits = _read_message(requests)
+        except EOFError:
+            break
+        if command == "close":
+            sessions.pop(session, None)
+            continue
+
+        outputs = _Outputs(limits.get("output_bytes"))
+        namespace = sessions.setdefault(session, {"__name__": "__main__"})
+        namespace["display"] = outputs.display
+        cpu_limit = limits.get("cpu_seconds")
+        started = cpu_time()
+        peak_before = max_rss_bytes()
+        sys.stdout = outputs
+        try:
+            limit_cpu(cpu_limit)
+            exec(compile(code, "<python>", "exec"), namespace)
+            reply = ("ok", outputs.items)
+        except MemoryError:
+            reply = ("error", "out of memory")
+        except BaseException as e:
+            reply = ("error", str(e))
+        finally:
+            limit_cpu(None)
+            sys.stdout = sys.__stdout__
+        # What the block used, for the page's CPU budget and the profile panel
+        # The peak RSS of a process only ever grows, so the block's own share is how far it raised it
+        peak_after = max_rss_bytes()
+        usage = {
+            "cpu_seconds": cpu_time() - started,
+            "worker_peak_rss_bytes": peak_after,
+            "peak_rss_growth_bytes": None if peak_after is None else peak_after - peak_before,
+            "output_bytes": outputs.size,
+        }
+        _write_message(replies, reply + (usage,))
+
+
+class PythonKernel:
+    """A pre-started Python worker process that executes code in named sessions.
+
+    Each session is a separate global namespace, so later code in the same
+    session sees names defined earlier. A worker that crashes or runs longer than
+    ``timeout`` is replaced by a fresh one; its sessions are lost when that happens.
+    Each block can also be given a CPU time and output limit, which end the block
+    with an error but keep the worker and its sessions.
+    """
+
+    def __init__(self, timeout=300, memory_limit=None):
+        self.timeout = timeout
+        self.memory_limit = memory_limit
+        self.sessions = set()
+        self._process = None
+        self._replies = None
+        self._running = None  # Session whose code the worker is running
+        self._interrupted = set()  # Sessions that may not run any more code until they are closed
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Starts the worker ahead of time so its imports are done before the first request."""
+        with self._lock:
+            self._ensure_running()
+
+    def execute(self, session, code, cpu_limit=None, output_limit=None):
+        """Runs ``code`` in ``session``.
+
+        Returns its outputs as a list of (kind, data) pairs, and a dict of the
+        resources it used: cpu_seconds, worker_peak_rss_bytes (the worker's peak
+        since it started), peak_rss_growth_bytes (how far this block raised that
+        peak) and output_bytes.
+        """
+        with self._lock:
+            # _running is set before _interrupted is checked, and interrupt() does the opposite,
+            # so an interrupt that arrives while the block starts is never lost
+            self._running = session
+            try:
+                self._ensure_running()
+                self.sessions.add(session)
+                if session in self._interrupted:
+                    raise RuntimeError("Python code was stopped because its page was closed")
+                self._send(("exec", session, code, {"cpu_seconds": cpu_limit, "output_bytes": output_limit}))
+                status, result, usage = self._receive()
+            finally:
+                self._running = None
+            if status != "ok":
+                raise PythonExecutionError(result, usage)
+            return result, usage
+
+    def close_session(self, session):
+        """Frees the namespace of ``session``."""
+        with self._lock:
+            if session in self.sessions and self._is_running():
+                self._send(("close", session, None, None))
+            self.sessions.discard(session)
+            self._interrupted.discard(session)
+
+    def interrupt(self, session):
+        """Kills the worker if it is running code of ``session``, which makes that execute fail.
+
+        Later code of the session is refused until close_session(). Called without
+        the lock, which the waiting execute holds; the worker is replaced as the
+        execute fails.
+        """
+        self._interrupted.add(session)
+        process = self._process
+        if self._running == session and process is not None and process.poll() is None:
+            process.kill()
+
+    def shutdown(self):
+        with self._lock:
+            self._stop()
+
+    def _command(self):
+        if getattr(sys, "frozen", False):
+            # A bundled executable has no interpreter to run -m with; main.py handles this flag
+            return [sys.executable, KERNEL_FLAG]
+        return [sys.executable, "-m", "galacton.pykernel"]
+
+    def _is_running(self):
+        return self._process is not None and self._process.poll() is None
+
+    def _ensure_running(self):
+        if self._is_running():
+            return
+        self._stop()
+        env = dict(os.environ, MPLBACKEND="Agg")  # Workers have no display
+        env.pop("GALACTON_KERNEL_MEMORY", None)
+        if self.memory_limit:
+            env["GALACTON_KERNEL_MEMORY"] = str(self.memory_limit)
+        # Make the galacton package importable no matter what the current directory is
+        package_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        env["PYTHONPATH"] = os.pathsep.join(filter(None, [package_root, env.get("PYTHONPATH")]))
+        trace.count("subprocess.spawn")
+        self._process = subprocess.Popen(self._command(), stdin=subprocess.PIPE, stdout=subprocess.PIPE, env=env)
+        # Read replies on a separate thread so that they can be waited for with a timeout
+        self._replies = queue.Queue()
+        threading.Thread(target=_pump_messages, args=(self._process.stdout, self._replies), daemon=True).start()
+
+    def _stop(self):
+        if self._process is not None:
+            if self._process.poll() is None:
+                self._process.kill()
+            self._process.wait()
+        self._process = None
+        self.sessions.clear()
+
+    def _restart(self):
+        # Start the replacement right away so it is warm by the next request
+        self._stop()
+        self._ensure_running()
+
+    def _send(self, message):
+        try:
+            _write_message(self._process.stdin, message)
+        except OSError as e:
+            self._restart()
+            raise RuntimeError(f"Python worker is not accepting input: {e}")
+
+    def _receive(self):
+        try:
+            reply = self._replies.get(timeout=self.timeout)
+        except queue.Empty:
+            self._restart()
+            raise TimeoutError(f"Python code did not finish within {self.timeout} seconds")
+        if reply is None:
+            self._restart()
+            raise RuntimeError("Python worker exited unexpectedly")
+        return reply
+
+
+class PythonKernelPool:
+    """A fixed set of Python workers. Each session stays on one worker, so pages run in parallel."""
+
+    def __init__(self, size=2, timeout=300, memory_limit=2 * 1024 ** 3):
+        self.kernels = [PythonKernel(timeout, memory_limit) for _ in range(size)]
+        self._assignments = {}
+        self._lock = threading.Lock()
+
+    def start(self):
+        for kernel in self.kernels:
+            kernel.start()
+
+    def execute(self, session, code, cpu_limit=None, output_limit=None):
+        return self._kernel_for(session).execute(session, code, cpu_limit, output_limit)
+
+    def close_session(self, session):
+        with self._lock:
+            kernel = self._assignments.pop(session, None)
+        if kernel is not None:
+            kernel.close_session(session)
+
+    def interrupt(self, session):
+        """Stops the code running in ``session``, if any, and refuses any more until it is closed.
+
+        A worker that was running the session's code is restarted and loses its other sessions.
+        """
+        # A session that has not run anything yet is assigned now, so its first block is refused
+        self._kernel_for(session).interrupt(session)
+
+    def shutdown(self):
+        for kernel in self.kernels:
+            kernel.shutdown()
+
+    def _kernel_for(self, session):
+        with self._lock:
+            if session not in self._assignments:
+                # Put new sessions on the worker with the fewest sessions
+                load = {id(kernel): 0 for kernel in self.kernels}
+                for kernel in self._assignments.values():
+                    load[id(kernel)] += 1
+                self._assignments[session] = min(self.kernels, key=lambda kernel: load[id(kernel)])
+            return self._assignments[session]
+
+
+def outputs_to_html(outputs, assets=None):
+    """Converts the (kind, data) pairs returned by a worker to HTML.
+
+    With an AssetStore, images and large HTML outputs are stored there and
+    referenced by URL; otherwise images are inlined as data URIs.
+    """
+    parts = []
+    for kind, data in outputs:
+        if kind == "html":
+            parts.append(assets.put_html(data) if assets is not None else data)
+        elif kind == "image":
+            if assets is not None:
+                src = assets.put(data, "image/png")
+            else:
+                src = f'data:image/png;base64,{base64.b64encode(data).decode("ascii")}'
+            parts.append(f'<img src="{src}" alt="Python Output Image">')
+        else:
+            # Convert line breaks to <br> tags to maintain formatting
+            parts.append(data.replace("\n", "<br>"))
+    return "".join(parts)
+
+
+def _pump_messages(stream, replies):
+    while True:
+        try:
+            replies.put(_read_message(stream))
+        except (EOFError, OSError, pickle.UnpicklingError):
+            break
+    replies.put(None)
+
+
+if __name__ == "__main__":
+    serve()
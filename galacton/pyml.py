@@ -0,0 +1,640 @@
+import os
+import stat
+import hashlib
+import textwrap
+import html
+import json
+import uuid
+from urllib.parse import urlparse, urljoin, unquote
+
+from galacton import trace
+from galacton.assets import AssetStore
+from galacton.cache import OutputCache
+from galacton.compiler import PyMLCompiler
+from galacton.fetch import Fetcher
+from galacton.latex import LatexEngine
+from galacton.limits import PageBudget, ResourceLimits
+from galacton.mathmode import is_client_side, math_head, math_html, resolve_math_mode
+from galacton.rkernel import RExecutionError, RKernelPool
+from galacton.pykernel import PythonExecutionError, PythonKernelPool, outputs_to_html
+from galacton.search import INDEX_NAME, SearchIndex
+from galacton.tokenizer import mark_raw_text, parse_pyml
+from galacton.scheduler import BlockScheduler, Task, infer_sessions, python_names, r_names
+
+# The application directory, which holds the "tmp" output directory
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Tags whose content is rendered by a (potentially slow) backend rather than copied to the page
+BLOCK_TAGS = ("latex", "python", "r")
+
+
+def ensure_tmp_directory():
+    # Define the output directory for temporary images
+    output_dir = os.path.join(APP_DIR, "tmp")  # Make 'tmp' relative to the application's location
+
+    # Create the directory if it doesn't exist
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+
+    # Ensure the directory has the correct permissions
+    os.chmod(output_dir, stat.S_IRWXU | stat.S_IRWXG | stat.S_IRWXO)  # Read, write, and execute for everyone
+
+    return output_dir
+
+def unescape_special_chars(escaped_text):
+    """Unescapes special characters like &lt;, &gt;, and &amp; back to their original form."""
+    return html.unescape(escaped_text)
+
+def preprocess_pyml_content(pyml_content):
+    """Preprocess the .pyml content so that code blocks reach the parser as raw text."""
+    return mark_raw_text(pyml_content)
+
+def convert_file_url_to_local_path(file_url):
+    # Convert 'file://' URL to local path
+    if file_url.startswith('file://'):
+        # Remove 'file://' prefix and unquote to handle spaces or special characters
+        return unquote(file_url[7:])
+    return file_url
+
+def document_url(file_path):
+    """Returns the canonical form of a document location: the URL, or the absolute local path."""
+    file_path = convert_file_url_to_local_path(file_path)
+    if urlparse(file_path).scheme in ['http', 'https']:
+        return file_path
+    return os.path.abspath(file_path)
+
+def source_hash(code):
+    """Identifies the code loaded from a src script."""
+    return hashlib.sha256(code.encode("utf-8")).hexdigest()
+
+
+def sources_unchanged(sources, fetcher):
+    """Tells whether every src script in ``sources`` (path -> source_hash) still has the same code.
+
+    Remote scripts are checked through the HTTP cache, which revalidates them with the server.
+    """
+    for path, expected in sources.items():
+        try:
+            if urlparse(path).scheme in ['http', 'https']:
+                code = fetcher.get_text(path)
+            else:
+                with open(path, 'r') as file:
+                    code = file.read()
+        except Exception:
+            return False
+        if source_hash(code) != expected:
+            return False
+    return True
+
+
+def load_pyml_source(file_path, fetcher, allow_stale=False):
+    """Reads a .pyml document from a URL or local path and returns its content and base URL.
+
+    With ``allow_stale`` a cached copy of a remote document is used without revalidating it.
+    """
+    # Convert file URL to a local path if necessary
+    if file_path.startswith('file://'):
+        file_path = convert_file_url_to_local_path(file_path)
+
+    # Check if the path is a URL
+    parsed_url = urlparse(file_path)
+    if parsed_url.scheme in ['http', 'https']:
+        # Fetch content from the URL through the shared HTTP cache
+        pyml_content = fetcher.get_text(file_path, allow_stale)
+        # The base URL is the directory of the current file
+        return pyml_content, os.path.dirname(file_path) + '/'
+
+    # Load content from a local file
+    with open(file_path, 'r') as file:
+        return file.read(), os.path.dirname(os.path.abspath(file_path)) + '/'
+
+
+class RenderServices:
+    """Caches and engines shared by every page render."""
+
+    def __init__(self, python_workers=None, r_workers=2, max_concurrency=None, prestart=True, output_dir=None, limits=None):
+        # Everything is written under tmp/ unless another directory is given, as the benchmarks do
+        if output_dir is None:
+            output_dir = ensure_tmp_directory()
+        else:
+            os.makedirs(output_dir, exist_ok=True)
+        self.output_dir = output_dir
+        # Chrome trace files of rendered pages and GALACTON_PROFILE captures
+        self.trace_dir = os.path.join(output_dir, "traces")
+        # Pooled HTTP connections and an on-disk cache of remote documents and scripts
+        self.fetcher = Fetcher(os.path.join(output_dir, "http"))
+        # Persistent cache of code block outputs, stored under tmp/
+        self.output_cache = OutputCache(os.path.join(output_dir, "cache"))
+        # Equation images, cached by the md5 of their source
+        self.latex_engine = LatexEngine(output_dir)
+        # Images and large outputs referenced by galacton:// URLs instead of file paths or data URIs
+        self.assets = AssetStore(os.path.join(output_dir, "assets"))
+        # CPU, memory and output limits on code blocks (GALACTON_CPU_LIMIT and friends)
+        self.limits = limits or ResourceLimits.from_env()
+        # Long-lived R processes, so <r> blocks do not pay for R's startup each time
+        self.r_kernels = RKernelPool(output_dir, size=r_workers, memory_limit=self.limits.memory_bytes)
+        # Python workers are started now so the scientific stack is imported by the first <python> block
+        self.python_kernels = PythonKernelPool(
+            size=python_workers or min(4, os.cpu_count() or 1), memory_limit=self.limits.memory_bytes
+        )
+        if prestart:
+            self.python_kernels.start()
+        # Runs independent blocks concurrently
+        self.scheduler = BlockScheduler(max_concurrency)
+        # Full-text index of the documents that have been visited or scanned
+        self.search_index = SearchIndex(os.path.join(output_dir, INDEX_NAME))
+
+    def shutdown(self):
+        """Stops the worker processes."""
+        self.scheduler.shutdown()
+        self.r_kernels.shutdown()
+        self.python_kernels.shutdown()
+
+
+class Block:
+    """A <latex>, <python> or <r> element whose output is produced after the page skeleton is shown."""
+
+    def __init__(self, index, tag, code, src_file=None, cache_enabled=True, attrs="", block_id=None, after=(), session=None):
+        self.index = index
+        self.tag = tag
+        self.code = code
+        self.src_file = src_file
+        self.cache_enabled = cache_enabled
+        self.attrs = attrs
+        self.block_id = block_id  # The element's id attribute, which after= refers to
+        self.after = list(after)  # Ids of blocks that must finish before this one starts
+        self.session = session  # Explicit interpreter session shared with other blocks
+
+    @property
+    def element_id(self):
+        return f"galacton-block-{self.index}"
+
+
+class Page:
+    """The static skeleton of a rendered document plus the blocks that still need to be rendered."""
+
+    def __init__(self, parts, blocks, links=()):
+        self.parts = parts  # Static HTML strings, with a Block wherever a block's output goes
+        self.blocks = blocks
+        self.links = list(links)  # Resolved targets of the page's links to other .pyml documents
+
+    def html(self, results=None):
+        """Returns the page HTML with the given block results filled in and placeholders elsewhere."""
+        results = results or {}
+        content = []
+        for part in self.parts:
+            if isinstance(part, Block):
+                output = results.get(part.index, '<p class="galacton-pending">Rendering&hellip;</p>')
+                content.append(f'<div id="{part.element_id}">{output}</div>')
+            else:
+                content.append(part)
+        return "".join(content)
+
+    @property
+    def cacheable(self):
+        """Whether the rendered page may be shown again later: not if a block has cache="False"."""
+        return all(block.cache_enabled for block in self.blocks)
+
+    def same_layout(self, other):
+        """Tells whether two pages differ at most in their blocks' code, so one can be patched into the other."""
+        if other is None or len(self.parts) != len(other.parts):
+            return False
+        for part, other_part in zip(self.parts, other.parts):
+            if isinstance(part, Block) and isinstance(other_part, Block):
+                if part.element_id != other_part.element_id:
+                    return False
+            elif part != other_part:
+                return False
+        return True
+
+
+# Scripts put into the page through innerHTML never run, so after a block's output has
+# been inserted each of its scripts is replaced with a fresh copy, in document order.
+# The next script waits until an external one has loaded (or failed), so that inline
+# code, such as a plotly figure's, runs after the library it uses.
+_PATCH_SCRIPT = """(function (id, html) {
+  var placeholder = document.getElementById(id);
+  if (!placeholder) return;
+  placeholder.innerHTML = html;
+  var scripts = Array.prototype.slice.call(placeholder.querySelectorAll("script"));
+  function next() {
+    var old = scripts.shift();
+    if (!old) return;
+    var script = document.createElement("script");
+    for (var i = 0; i < old.attributes.length; i++) {
+      script.setAttribute(old.attributes[i].name, old.attributes[i].value);
+    }
+    script.text = old.text;
+    var external = old.hasAttribute("src");
+    if (external) script.onload = script.onerror = next;
+    old.parentNode.replaceChild(script, old);
+    if (!external) next();
+  }
+  next();
+})(%s, %s);"""
+
+
+def block_patch_script(element_id, output_html):
+    """Returns JavaScript that puts a block's output into its placeholder in the live page and runs its scripts."""
+    return _PATCH_SCRIPT % (json.dumps(element_id), json.dumps(output_html))
+
+
+class PageRenderer:
+    """Renders one .pyml document, resolving relative paths against the document's base URL.
+
+    This class does not touch Qt, so its methods can run on worker threads.
+    """
+
+    def __init__(self, base_url, services, previous_outputs=None):
+        self.current_base_url = base_url
+        self.services = services
+        self.output_cache = services.output_cache
+        # Prefix of the interpreter sessions this page's blocks run in
+        self.session = uuid.uuid4().hex
+        self._sessions = set()  # (language, session) pairs in use
+        self._history = {}  # session -> cache key of the last block run in the session
+        self._replay = {}  # session -> code of blocks served from the cache but not yet executed
+        # How <latex> blocks are shown; set from the document by build_page (see galacton.mathmode)
+        self.math_mode = "png"
+        # Outputs of an earlier render of the same document, by cache key, reused even with cache="False"
+        self.previous_outputs = previous_outputs or {}
+        self.outputs = {}  # cache key -> output of every block rendered so far
+        self.local_sources = set()  # Local src files the blocks were loaded from
+        self.sources = {}  # Resolved path of every src script loaded -> source_hash of its code
+        # CPU time left to this page's blocks
+        self.budget = PageBudget(services.limits)
+        self.cancelled = False  # Set by cancel(); blocks that have not started yet are skipped
+
+    def build_page(self, pyml_content):
+        """Parses the document and returns its skeleton, deferring every block to render_block."""
+        with trace.profile():
+            return self._build_page(pyml_content)
+
+    def _build_page(self, pyml_content):
+        # Parse the content, with code blocks kept as raw text
+        with trace.span("parse", bytes=len(pyml_content)):
+            root = parse_pyml(pyml_content)
+
+        self.math_mode = resolve_math_mode(root.get('math'), self.services.latex_engine)
+        client_side_math = is_client_side(self.math_mode)
+        blocks = []
+        links = []
+        seen_links = set()
+
+        def compile_meta(compiler, element, out):
+            # parse the meta tag if needed. But don't include in final output
+            pass
+
+        def compile_block(compiler, element, out):
+            tag = compiler.tag_name(element)
+            if tag == 'latex':
+                code = (element.text or "").strip()
+                if client_side_math:
+                    # Typeset by the page itself, so there is nothing to render in the background
+                    out.append(f"<div{compiler.attributes(element)}>{math_html(code)}</div>\n")
+                    return
+            else:
+                code = element.text
+            block = Block(
+                len(blocks),
+                tag,
+                code,
+                src_file=element.get('src'),
+                cache_enabled=element.get('cache', 'True').lower() == 'true',
+                attrs=compiler.attributes(element),
+                block_id=element.get('id'),
+                after=element.get('after', '').replace(',', ' ').split(),
+                session=element.get('session'),
+            )
+            blocks.append(block)
+            out.append(block)
+
+        def compile_link(compiler, element, out):
+            # Resolve relative URLs
+            href = element.get('href')
+            if href is not None:
+                href = self.resolve_relative_path(href)
+                if href.endswith('.pyml') and href not in seen_links:
+                    seen_links.add(href)
+                    links.append(href)
+                out.append(f"<a{compiler.attributes(element, href=href)}>")
+            else:
+                out.append(f"<a{compiler.attributes(element)}>")
+            compiler.compile_children(element, out)
+            out.append("</a>")
+
+        handlers = {'meta': compile_meta, 'a': compile_link}
+        handlers.update((tag, compile_block) for tag in BLOCK_TAGS)
+        compiler = PyMLCompiler(handlers, context=self)
+
+        # Start building the HTML content
+        body_class = ' class="galacton-page"' if self.math_mode == "mathjax" else ""
+        parts = [f"""
+            <!DOCTYPE html>
+            <html>
+            <head>
+                <title>PyML Renderer</title>{math_head(self.math_mode)}
+            </head>
+            <body{body_class}>
+            """]
+        with trace.span("compile"):
+            parts.extend(compiler.iter_compile(root))
+
+        # Close HTML content
+        parts.append("""
+            </body>
+            </html>
+            """)
+        return Page(parts, blocks, links)
+
+    def render_block(self, block):
+        """Runs the backend for a single block and returns its HTML."""
+        if block.tag == 'latex':
+            # Convert LaTeX to an image and embed it
+            img_tag = self.render_latex_to_image(block.code)
+            return f"<div{block.attrs}>{img_tag}</div>\n"
+        try:
+            code, src_path = self.load_block_code(block.code, block.src_file)
+        except Exception as e:
+            return self.code_error(block.tag, e)
+        session = self.session_for(block.tag, block.session or f"block:{block.index}")
+        return self.execute_code(block.tag, code, src_path, block.cache_enabled, session)
+
+    def plan_blocks(self, blocks):
+        """Builds the task graph for the given blocks.
+
+        Blocks are independent unless they share variables (see infer_sessions), name
+        the same session="..." or list each other in after="...". All equations are
+        rendered together by a single task.
+        """
+        with trace.span("plan", blocks=len(blocks)):
+            return self._plan_blocks(blocks)
+
+    def _plan_blocks(self, blocks):
+        tasks = []
+        latex_blocks = [block for block in blocks if block.tag == 'latex']
+        if latex_blocks:
+            tasks.append(Task("latex", lambda: self.render_latex_blocks(latex_blocks)))
+
+        # Code has to be loaded before the variables it shares can be worked out
+        code_blocks = {}
+        for block in blocks:
+            if block.tag == 'latex':
+                continue
+            try:
+                code_blocks[block.index] = self.load_block_code(block.code, block.src_file)
+            except Exception as e:
+                code_blocks[block.index] = e
+
+        ids = {block.block_id: ("latex" if block.tag == 'latex' else block.index) for block in blocks if block.block_id}
+        for language, names in (("python", python_names), ("r", r_names)):
+            language_blocks = [block for block in blocks if block.tag == language]
+            groups = infer_sessions(
+                [
+                    (block.index, block.session, code_blocks[block.index][0])
+                    for block in language_blocks
+                    if not isinstance(code_blocks[block.index], Exception)
+                ],
+                names,
+            )
+            previous = {}  # session -> key of the last block of that session
+            for block in language_blocks:
+                loaded = code_blocks[block.index]
+                dependencies = {ids[block_id] for block_id in block.after if block_id in ids}
+                if isinstance(loaded, Exception):
+                    tasks.append(Task(block.index, lambda block=block, e=loaded: [(block, self.code_error(block.tag, e))], dependencies))
+                    continue
+                group = groups[block.index]
+                # Blocks of one session run in document order
+                if group in previous:
+                    dependencies.add(previous[group])
+                previous[group] = block.index
+                session = self.session_for(language, group)
+                tasks.append(Task(
+                    block.index,
+                    lambda block=block, loaded=loaded, session=session: [
+                        (block, self.run_block(block, loaded[0], loaded[1], session))
+                    ],
+                    dependencies,
+                ))
+        return tasks
+
+    def run_block(self, block, code, src_path, session):
+        """Runs a loaded <python> or <r> block, timing it as a span of the page's trace."""
+        if self.cancelled:
+            return ""
+        with trace.span(f"<{block.tag}> #{block.index}", "block", element_id=block.element_id, source=src_path or "inline"), trace.profile():
+            return self.execute_code(block.tag, code, src_path, block.cache_enabled, session)
+
+    def render_blocks(self, blocks, is_cancelled=None):
+        """Renders the given blocks concurrently, yielding (block, html) pairs as each one finishes."""
+        by_key = {block.index: block for block in blocks}
+        results = self.services.scheduler.run(self.plan_blocks(blocks), is_cancelled)
+        try:
+            for key, result in results:
+                if isinstance(result, Exception):
+                    # Only a failing task or a dependency cycle gets here; blame the block itself
+                    targets = [block for block in blocks if block.tag == 'latex'] if key == "latex" else [by_key[key]]
+                    trace.error("render", result)
+                    for block in targets:
+                        yield block, f"<p>Error rendering block: {result}</p>\n"
+                    continue
+                yield from result
+        finally:
+            # Stopping early waits for the blocks still running, so close() can free their sessions
+            results.close()
+
+    def render_latex_blocks(self, latex_blocks):
+        # Equations are rendered in one batch; see LatexEngine
+        if self.cancelled:
+            return []
+        with trace.span("<latex>", "block", equations=len(latex_blocks)), trace.profile():
+            images = self.services.latex_engine.render_many((block.code for block in latex_blocks), self.image_format)
+        return [
+            (block, f"<div{block.attrs}>{self.latex_image_tag(images[block.code])}</div>\n")
+            for block in latex_blocks
+        ]
+
+    def session_for(self, language, group):
+        """Returns the interpreter session id used for a group of blocks on this page."""
+        session = f"{self.session}-{group}".replace(":", "-").replace(" ", "-")
+        self._sessions.add((language, session))
+        return session
+
+    def render(self, pyml_content):
+        """Renders the whole document synchronously and returns the final HTML."""
+        page = self.build_page(pyml_content)
+        try:
+            return page.html({block.index: output_html for block, output_html in self.render_blocks(page.blocks)})
+        finally:
+            self.close()
+
+    def close(self):
+        """Releases the interpreter sessions used by this page."""
+        for language, session in self._sessions:
+            kernels = self.services.python_kernels if language == "python" else self.services.r_kernels
+            kernels.close_session(session)
+        self._sessions.clear()
+
+    def cancel(self):
+        """Stops the code of this page that is running, and skips its blocks that have not started.
+
+        Used once the page has been abandoned. Safe to call from any thread; the
+        renderer's own thread still calls close() once its blocks are done.
+        """
+        self.cancelled = True
+        for language, session in list(self._sessions):
+            kernels = self.services.python_kernels if language == "python" else self.services.r_kernels
+            kernels.interrupt(session)
+
+    @property
+    def image_format(self):
+        # Client-side math never reaches the engine, but keep a sensible answer for it
+        return self.math_mode if self.math_mode in ("png", "svg") else "png"
+
+    def render_latex_to_image(self, latex_code):
+        try:
+            output_image_path = self.services.latex_engine.render(latex_code, self.image_format)
+        except Exception as e:
+            output_image_path = e
+        return self.latex_image_tag(output_image_path)
+
+    def latex_image_tag(self, output_image_path):
+        # The engine reports failures by returning the exception instead of a path
+        if isinstance(output_image_path, Exception):
+            trace.error("latex", output_image_path)
+            return f"<p>Error rendering LaTeX: {output_image_path}</p>\n"
+        # Return an HTML img tag pointing at the image in the asset store
+        try:
+            src = self.services.assets.put_file(output_image_path)
+        except OSError as e:
+            trace.error("latex", e)
+            return f"<p>Error rendering LaTeX: {e}</p>\n"
+        return f'<img src="{src}" alt="LaTeX Image">'
+
+    def resolve_relative_path(self, path):
+        # If the path is already a complete URL, return it as is
+        if urlparse(path).scheme in ['http', 'https']:
+            return path
+
+        # Use the correct base URL (remote or local)
+        if self.current_base_url.startswith('http'):
+            # If currently using a remote base URL, use urljoin for proper resolution
+            return urljoin(self.current_base_url, path)
+
+        # Otherwise, assume it's a local file path
+        return os.path.abspath(os.path.join(self.current_base_url, path))
+
+
+    def load_block_code(self, inline_code=None, src_file=None):
+        """Returns the code of a <python> or <r> block and the resolved path of its source file, if any."""
+        # Determine if we're executing inline code or loading from a file
+        if src_file:
+            # Resolve the path to make it an absolute URL if needed
+            file_path = self.resolve_relative_path(src_file)
+
+            # Determine if the file path is local or remote
+            is_remote = file_path.startswith('http')
+
+            # Read the script content
+            with trace.span("load src", url=file_path):
+                if is_remote:
+                    # Load script from the remote URL through the shared HTTP cache
+                    code = self.services.fetcher.get_text(file_path)
+                else:
+                    # Load script from the local file
+                    self.local_sources.add(file_path)
+                    with open(file_path, 'r') as file:
+                        code = file.read()
+            self.sources[file_path] = source_hash(code)
+        else:
+            file_path = None
+            # Use inline code directly, dedenting to handle any leading spaces
+            code = textwrap.dedent(inline_code or "")
+
+        return code, file_path
+
+    def execute_code(self, language, code, src_path=None, cache_enabled=True, session=None):
+        """Runs a <python> or <r> block in ``session`` and returns its HTML."""
+        session = session or self.session_for(language, "default")
+        try:
+            if language == "python":
+                return self.run_code(session, language, code, src_path, cache_enabled, self._run_python)
+            return self.run_code(session, language, code, src_path, cache_enabled, self._run_r)
+        except Exception as e:
+            return self.code_error(language, e)
+
+    def run_limited(self, kernels, span_name, session, code):
+        """Runs code on a worker within the block and page limits, and records what it used.
+
+        Raises BudgetExceeded without running anything once the page's CPU budget is spent.
+        """
+        cpu_limit = self.budget.allowance()
+        usage = None
+        try:
+            with trace.span(span_name):
+                result, usage = kernels.execute(session, code, cpu_limit, self.services.limits.output_bytes)
+            return result
+        except (PythonExecutionError, RExecutionError) as e:
+            usage = e.usage
+            raise
+        finally:
+            if usage:
+                self.budget.charge(usage)
+                # Shown with the block in the profile panel and in the saved trace
+                trace.annotate(**usage)
+                trace.count("blocks.cpu_ms", round(usage["cpu_seconds"] * 1000))
+
+    def code_error(self, language, error):
+        trace.error(language, error)
+        if language == "python":
+            return f"Error executing code: {error}\n"
+        return f"Error executing R code: {error}\n"
+
+    def run_code(self, session, language, code, src_path, cache_enabled, execute):
+        """Runs code in ``session``, serving the stored output where possible.
+
+        The cache key covers every earlier block of the session, because they
+        define the variables this block sees. Blocks served from the cache are
+        executed later after all if a following block of the session has to run.
+        """
+        cache_key = self.output_cache.make_key(language, code, src_path, self._history.get(session, ""))
+        self._history[session] = cache_key
+
+        # On a live reload, a block whose code and session history are unchanged keeps its output
+        cached_output = self.previous_outputs.get(cache_key)
+        if cached_output is None and cache_enabled:
+            cached_output = self.output_cache.get(cache_key)
+        # Output whose images have been evicted from the asset store has to be produced again
+        if cached_output is not None and self.services.assets.contains_all(cached_output):
+            self._replay.setdefault(session, []).append(code)
+            self.outputs[cache_key] = cached_output
+            trace.annotate(cached=True)
+            return cached_output
+        trace.annotate(cached=False)
+
+        # Bring the session up to date before running this block
+        replay = self._replay.pop(session, [])
+        if replay:
+            with trace.span("replay", blocks=len(replay)):
+                for earlier_code in replay:
+                    execute(session, earlier_code)
+
+        output_html = execute(session, code)
+        self.outputs[cache_key] = output_html
+        if cache_enabled:
+            self.output_cache.put(cache_key, output_html)
+        return output_html
+
+    def _run_python(self, session, code):
+        # Run the code in the session's namespace on a worker process and collect its output
+        outputs = self.run_limited(self.services.python_kernels, "python exec", session, code)
+        return f"<div>{outputs_to_html(outputs, self.services.assets)}</div>\n"
+
+    def _run_r(self, session, code):
+        # Execute the R code in the session and capture the output
+        output = self.run_limited(self.services.r_kernels, "Rscript", session, code)
+
+        # Process the output and return
+        output = unescape_special_chars(output).replace("\n", "<br>")
+        return f"<div>{output}</div>\n"
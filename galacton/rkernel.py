@@ -0,0 +1,280 @@
+import os
+import queue
+import secrets
+import threading
+import subprocess
+
+from galacton import trace
+from galacton.limits import MB, limit_process_memory, memory_limited_command
+
+# Evaluation loop run by every R worker. Requests are a header line
+# "<marker> <command> <session> <line count> <CPU limit>" followed by that many lines of code;
+# responses are a header line "<marker> <status> <line count> <CPU seconds>" followed by the output.
+# A CPU limit of 0 means no limit.
+R_KERNEL_SCRIPT = r"""
+local({
+  marker <- commandArgs(trailingOnly = TRUE)[1]
+  input <- file("stdin", open = "r")
+  sessions <- new.env()
+  repeat {
+    header <- readLines(input, n = 1)
+    if (length(header) == 0) break
+    fields <- strsplit(header, " ", fixed = TRUE)[[1]]
+    if (length(fields) != 5 || fields[1] != marker) next
+    command <- fields[2]
+    session <- fields[3]
+    code <- readLines(input, n = as.integer(fields[4]))
+    cpu_limit <- as.numeric(fields[5])
+
+    if (command == "close") {
+      if (exists(session, envir = sessions, inherits = FALSE)) rm(list = session, envir = sessions)
+      next
+    }
+
+    if (!exists(session, envir = sessions, inherits = FALSE)) {
+      assign(session, new.env(parent = globalenv()), envir = sessions)
+    }
+    env <- get(session, envir = sessions, inherits = FALSE)
+
+    output <- character(0)
+    capture <- textConnection("output", "w", local = TRUE)
+    sink(capture)
+    started <- proc.time()
+    status <- tryCatch({
+      if (cpu_limit > 0) setTimeLimit(cpu = cpu_limit)
+      for (expression in parse(text = code)) {
+        result <- withVisible(eval(expression, env))
+        if (result$visible) print(result$value)
+      }
+      "ok"
+    }, error = function(e) {
+      cat(conditionMessage(e), "\n", sep = "")
+      "error"
+    }, finally = setTimeLimit(cpu = Inf))
+    used <- proc.time() - started
+    sink()
+    close(capture)
+
+    cat(marker, status, length(output), used[["user.self"]] + used[["sys.self"]], "\n")
+    writeLines(output)
+    flush(stdout())
+  }
+})
+"""
+
+
+class RExecutionError(Exception):
+    """Raised when R code fails, carrying the error message printed by R and what the code used."""
+
+    def __init__(self, message, usage=None):
+        super().__init__(message)
+        self.usage = usage
+
+
+class RKernel:
+    """A long-lived R process that evaluates code in named sessions.
+
+    Each session is an R environment, so later code in the same session sees
+    variables defined earlier. The process is restarted on the next request
+    after it crashes or exceeds ``timeout``; its sessions are lost when that happens.
+    Its address space is capped at ``memory_limit`` bytes, and each block can be
+    given a CPU time and output limit.
+    """
+
+    def __init__(self, script_path, timeout=300, memory_limit=None):
+        self.script_path = script_path
+        self.timeout = timeout
+        self.memory_limit = memory_limit
+        self.sessions = set()
+        self._process = None
+        self._lines = None
+        self._running = None  # Session whose code the process is running
+        self._interrupted = set()  # Sessions that may not run any more code until they are closed
+        self._lock = threading.Lock()
+
+    def execute(self, session, code, cpu_limit=None, output_limit=None):
+        """Runs ``code`` in ``session``.
+
+        Returns its printed output, and a dict of the resources it used:
+        cpu_seconds and output_bytes.
+        """
+        with self._lock:
+            # _running is set before _interrupted is checked, and interrupt() does the opposite,
+            # so an interrupt that arrives while the block starts is never lost
+            self._running = session
+            try:
+                self._ensure_running()
+                self.sessions.add(session)
+                if session in self._interrupted:
+                    raise RuntimeError("R code was stopped because its page was closed")
+                self._send("eval", session, code, cpu_limit)
+                status, output, usage = self._receive(output_limit)
+            finally:
+                self._running = None
+            if status != "ok":
+                raise RExecutionError(output, usage)
+            return output, usage
+
+    def close_session(self, session):
+        """Frees the variables of ``session``."""
+        with self._lock:
+            if session in self.sessions and self._is_running():
+                self._send("close", session, "")
+            self.sessions.discard(session)
+            self._interrupted.discard(session)
+
+    def interrupt(self, session):
+        """Kills the process if it is running code of ``session``, which makes that execute fail.
+
+        Later code of the session is refused until close_session(). Called without
+        the lock, which the waiting execute holds; the process is started again
+        by the next request.
+        """
+        self._interrupted.add(session)
+        process = self._process
+        if self._running == session and process is not None and process.poll() is None:
+            process.kill()
+
+    def shutdown(self):
+        with self._lock:
+            self._stop()
+
+    def _is_running(self):
+        return self._process is not None and self._process.poll() is None
+
+    def _ensure_running(self):
+        if self._is_running():
+            return
+        self._stop()
+        self._marker = secrets.token_hex(8)
+        trace.count("subprocess.spawn")
+        # The memory limit is applied from outside rather than in a preexec_fn, which is not
+        # safe to run in a process with threads
+        self._process = subprocess.Popen(
+            # The user's .Rprofile and .Renviron are honoured, for library paths and options;
+            # anything they print is skipped while waiting for a reply header
+            memory_limited_command(["Rscript", self.script_path, self._marker], self.memory_limit),
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+            encoding="utf-8",
+            errors="replace",
+        )
+        limit_process_memory(self._process.pid, self.memory_limit)
+        # Read stdout on a separate thread so that replies can be waited for with a timeout
+        self._lines = queue.Queue()
+        threading.Thread(target=_pump_lines, args=(self._process.stdout, self._lines), daemon=True).start()
+
+    def _stop(self):
+        if self._process is not None:
+            if self._process.poll() is None:
+                self._process.kill()
+            self._process.wait()
+        self._process = None
+        self.sessions.clear()
+
+    def _send(self, command, session, code, cpu_limit=None):
+        lines = code.replace("\r\n", "\n").split("\n")
+        try:
+            self._process.stdin.write(f"{self._marker} {command} {session} {len(lines)} {cpu_limit or 0:g}\n")
+            self._process.stdin.write("\n".join(lines) + "\n")
+            self._process.stdin.flush()
+        except OSError as e:
+            self._stop()
+            raise RuntimeError(f"R process is not accepting input: {e}")
+
+    def _receive(self, output_limit=None):
+        # Skip anything printed outside the output capture until the reply header
+        while True:
+            line = self._read_line()
+            fields = line.split()
+            if len(fields) == 4 and fields[0] == self._marker:
+                break
+        status, count = fields[1], int(fields[2])
+        # Lines beyond the output limit are read, so the stream stays in step, but not kept
+        output = []
+        size = 0
+        for _ in range(count):
+            line = self._read_line()
+            size += len(line) + 1
+            if not output_limit or size <= output_limit:
+                output.append(line)
+        usage = {"cpu_seconds": float(fields[3]), "output_bytes": size}
+        if output_limit and size > output_limit:
+            return "error", f"output limit of {output_limit / MB:g} MB exceeded\n", usage
+        return status, "\n".join(output) + ("\n" if output else ""), usage
+
+    def _read_line(self):
+        try:
+            line = self._lines.get(timeout=self.timeout)
+        except queue.Empty:
+            self._stop()
+            raise TimeoutError(f"R code did not finish within {self.timeout} seconds")
+        if line is None:
+            self._stop()
+            raise RuntimeError("R process exited unexpectedly")
+        return line.rstrip("\n")
+
+
+class RKernelPool:
+    """A fixed set of R kernels. Each session stays on one kernel, so pages render in parallel."""
+
+    def __init__(self, output_dir, size=2, timeout=300, memory_limit=None):
+        self.script_path = os.path.join(output_dir, "galacton_kernel.R")
+        _write_script(self.script_path)
+        self.kernels = [RKernel(self.script_path, timeout, memory_limit) for _ in range(size)]
+        self._assignments = {}
+        self._lock = threading.Lock()
+
+    def execute(self, session, code, cpu_limit=None, output_limit=None):
+        return self._kernel_for(session).execute(session, code, cpu_limit, output_limit)
+
+    def close_session(self, session):
+        with self._lock:
+            kernel = self._assignments.pop(session, None)
+        if kernel is not None:
+            kernel.close_session(session)
+
+    def interrupt(self, session):
+        """Stops the code running in ``session``, if any, and refuses any more until it is closed.
+
+        A kernel that was running the session's code is restarted and loses its other sessions.
+        """
+        # A session that has not run anything yet is assigned now, so its first block is refused
+        self._kernel_for(session).interrupt(session)
+
+    def shutdown(self):
+        for kernel in self.kernels:
+            kernel.shutdown()
+
+    def _kernel_for(self, session):
+        with self._lock:
+            if session not in self._assignments:
+                # Put new sessions on the kernel with the fewest sessions
+                load = {id(kernel): 0 for kernel in self.kernels}
+                for kernel in self._assignments.values():
+                    load[id(kernel)] += 1
+                self._assignments[session] = min(self.kernels, key=lambda kernel: load[id(kernel)])
+            return self._assignments[session]
+
+
+def _write_script(path):
+    # Several processes (such as build workers) may start at once and read the script at any
+    # moment, so it is only replaced, never rewritten in place, and only when it has changed
+    try:
+        with open(path, "r", encoding="utf-8") as script_file:
+            if script_file.read() == R_KERNEL_SCRIPT:
+                return
+    except OSError:
+        pass
+    temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.part"
+    with open(temp_path, "w", encoding="utf-8") as script_file:
+        script_file.write(R_KERNEL_SCRIPT)
+    os.replace(temp_path, path)
+
+
+def _pump_lines(stream, lines):
+    for line in stream:
+        lines.put(line)
+    lines.put(None)
@@ -0,0 +1,179 @@
+import os
+import re
+import ast
+import builtins
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+# Names every Python block can use without another block defining them
+PYTHON_BUILTINS = set(dir(builtins)) | {"display"}
+
+# Identifiers, strings and comments in R code
+R_TOKEN = re.compile(r'"(?:[^"\\]|\\.)*"|\'(?:[^\'\\]|\\.)*\'|#[^\n]*|`[^`]*`|[A-Za-z.][A-Za-z0-9._]*')
+# An identifier followed by an assignment operator (or a named argument, which is harmless to include)
+R_ASSIGNMENT = re.compile(r'([A-Za-z.][A-Za-z0-9._]*)\s*(?:<<?-|=(?!=))')
+R_RIGHT_ASSIGNMENT = re.compile(r'->>?\s*([A-Za-z.][A-Za-z0-9._]*)')
+
+
+def default_concurrency():
+    """Returns the number of blocks run at once, overridable with GALACTON_MAX_CONCURRENCY.
+
+    A value that is not a positive integer is ignored.
+    """
+    try:
+        configured = int(os.environ.get("GALACTON_MAX_CONCURRENCY", 0))
+    except ValueError:
+        configured = 0
+    return configured if configured > 0 else min(8, (os.cpu_count() or 1) + 2)
+
+
+def python_names(code):
+    """Returns the names a Python block binds and the names it reads before binding them itself.
+
+    Returns None if the code does not parse.
+    """
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return None
+    # Go statement by statement: a name only comes from another block if this
+    # block reads it before a statement of its own has bound it
+    bound, used = set(), set()
+    for statement in tree.body:
+        stores = set()
+        for node in ast.walk(statement):
+            if isinstance(node, ast.Name):
+                if isinstance(node.ctx, ast.Load):
+                    if node.id not in bound:
+                        used.add(node.id)
+                else:
+                    stores.add(node.id)
+            elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                stores.add(node.name)
+            elif isinstance(node, (ast.Import, ast.ImportFrom)):
+                stores.update((alias.asname or alias.name).split(".")[0] for alias in node.names)
+        bound |= stores
+    return bound, used - PYTHON_BUILTINS
+
+
+def r_names(code):
+    """Returns an over-approximation of the names an R block binds and reads."""
+    tokens = [token for token in R_TOKEN.findall(code) if token[0] not in "\"'#"]
+    bound = set(R_ASSIGNMENT.findall(code)) | set(R_RIGHT_ASSIGNMENT.findall(code))
+    return bound, {token.strip("`") for token in tokens}
+
+
+def infer_sessions(blocks, names):
+    """Groups blocks that share variables, returning a session name per block.
+
+    ``blocks`` is a list of (key, explicit session or None, code) tuples in document
+    order and ``names`` returns the (bound, used) names of some code. A block that
+    reads a name bound by an earlier block joins that block's session; otherwise it
+    gets a session of its own and can run independently. Blocks with an explicit
+    session always share it, and take part in this like any other block.
+    """
+    parent = {}
+
+    def find(group):
+        while parent[group] != group:
+            parent[group] = parent[parent[group]]
+            group = parent[group]
+        return group
+
+    binders = {}  # name -> group of the latest block that bound it
+    groups = {}
+    for key, explicit, code in blocks:
+        group = f"session:{explicit}" if explicit else f"block:{key}"
+        parent.setdefault(group, group)
+        analysis = names(code)
+        bound, used = analysis if analysis is not None else (set(), set())
+        for name in used:
+            if name in binders:
+                # An explicit session may already be part of a larger group
+                parent[find(binders[name])] = find(group)
+        for name in bound:
+            binders[name] = group
+        groups[key] = group
+    return {key: find(group) for key, group in groups.items()}
+
+
+class Task:
+    """A unit of work for the scheduler: ``function`` runs once every key in ``dependencies`` has finished."""
+
+    def __init__(self, key, function, dependencies=()):
+        self.key = key
+        self.function = function
+        self.dependencies = set(dependencies)
+
+
+class BlockScheduler:
+    """Runs a graph of tasks on a thread pool, starting each task as soon as its dependencies finish.
+
+    The heavy lifting happens in interpreter and TeX subprocesses, so threads are
+    enough to keep many of them busy at once.
+    """
+
+    def __init__(self, max_workers=None):
+        self.max_workers = max_workers or default_concurrency()
+        self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="galacton-block")
+
+    def run(self, tasks, is_cancelled=None):
+        """Runs ``tasks`` and yields (key, result) pairs in completion order.
+
+        A task that raises yields its exception as the result. Once ``is_cancelled``
+        returns True no further tasks are started. Tasks caught in a dependency cycle
+        yield a RuntimeError. Closing the generator early cancels the tasks that have
+        not started and waits for the others.
+        """
+        tasks = {task.key: task for task in tasks}
+        waiting = {}
+        dependents = {key: [] for key in tasks}
+        for task in tasks.values():
+            # Dependencies on unknown keys are ignored
+            known = {dependency for dependency in task.dependencies if dependency in tasks and dependency != task.key}
+            waiting[task.key] = len(known)
+            for dependency in known:
+                dependents[dependency].append(task.key)
+
+        running = {}
+        finished = set()
+
+        def submit(key):
+            # Each task runs in a copy of the caller's context, so it reports to the caller's trace
+            context = contextvars.copy_context()
+            running[self.executor.submit(context.run, tasks[key].function)] = key
+
+        for key, count in waiting.items():
+            if count == 0:
+                submit(key)
+
+        try:
+            while running:
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    key = running.pop(future)
+                    finished.add(key)
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        result = e
+                    yield key, result
+                    for dependent in dependents[key]:
+                        waiting[dependent] -= 1
+                        if waiting[dependent] == 0 and not (is_cancelled and is_cancelled()):
+                            submit(dependent)
+        finally:
+            # When the caller stops early, tasks that have not started are dropped and the
+            # running ones are waited for, so none of them is still going once this returns
+            for future in running:
+                future.cancel()
+            wait(running)
+
+        if is_cancelled and is_cancelled():
+            return
+        for key in tasks:
+            if key not in finished:
+                yield key, RuntimeError("circular 'after' dependency")
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
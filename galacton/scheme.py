@@ -0,0 +1,47 @@
+from PyQt5.QtCore import QBuffer, QByteArray, QIODevice
+from PyQt5.QtWebEngineCore import QWebEngineUrlRequestJob, QWebEngineUrlScheme, QWebEngineUrlSchemeHandler
+
+from galacton.assets import ASSET_SCHEME
+
+
+def register_scheme():
+    """Declares the galacton:// scheme to Qt WebEngine. Must be called before the QApplication is created."""
+    scheme = QWebEngineUrlScheme(ASSET_SCHEME.encode("ascii"))
+    scheme.setSyntax(QWebEngineUrlScheme.Syntax.Host)
+    # Pages served from the scheme may still show local files, such as the plots scripts write to tmp/
+    scheme.setFlags(QWebEngineUrlScheme.SecureScheme | QWebEngineUrlScheme.LocalAccessAllowed)
+    QWebEngineUrlScheme.registerScheme(scheme)
+
+
+class AssetSchemeHandler(QWebEngineUrlSchemeHandler):
+    """Answers galacton://asset/<key> requests from an AssetStore.
+
+    Qt 5 offers no way to add response headers, so caching relies on the URLs
+    being content-addressed: a URL always names the same bytes.
+    """
+
+    def __init__(self, store, parent=None):
+        super().__init__(parent)
+        self.store = store
+
+    def install(self, profile):
+        profile.installUrlSchemeHandler(ASSET_SCHEME.encode("ascii"), self)
+
+    def requestStarted(self, job):
+        url = job.requestUrl()
+        if url.host() != "asset":
+            job.fail(QWebEngineUrlRequestJob.UrlNotFound)
+            return
+        key = url.path().lstrip("/")
+        try:
+            data = self.store.get(key)
+        except ValueError:
+            data = None
+        if data is None:
+            job.fail(QWebEngineUrlRequestJob.UrlNotFound)
+            return
+        # The buffer is parented to the job, so it lives exactly as long as the reply
+        buffer = QBuffer(job)
+        buffer.setData(QByteArray(data))
+        buffer.open(QIODevice.ReadOnly)
+        job.reply(self.store.mime_type(key).encode("ascii"), buffer)
@@ -0,0 +1,347 @@
+"""Full-text search over visited and local .pyml documents.
+
+Usage: python -m galacton index DIRECTORY...
+       python -m galacton search QUERY...
+"""
+import os
+import re
+import html
+import time
+import hashlib
+import sqlite3
+import threading
+
+from galacton.tokenizer import parse_pyml
+
+# Name of the index file in the output directory
+INDEX_NAME = "search.sqlite3"
+
+# Indexed fields, in column order, with their weight in the BM25 ranking
+FIELDS = ("title", "author", "date", "headings", "body", "latex")
+WEIGHTS = (10.0, 4.0, 2.0, 5.0, 1.0, 2.0)
+
+HEADING_TAGS = ("h1", "h2", "h3", "h4", "h5", "h6")
+# Code is not prose; its output is not known until it runs
+SKIPPED_TAGS = ("python", "r", "meta")
+
+_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS documents (
+        id INTEGER PRIMARY KEY,
+        url TEXT UNIQUE NOT NULL,
+        digest TEXT NOT NULL,
+        mtime_ns INTEGER,
+        size INTEGER,
+        indexed_at REAL NOT NULL
+    );
+    CREATE VIRTUAL TABLE IF NOT EXISTS entries USING fts5(
+        title, author, date, headings, body, latex,
+        tokenize = 'unicode61 remove_diacritics 2',
+        prefix = '2 3'
+    );
+"""
+
+# Marks the matched terms in snippets; replaced by markup once the snippet has been escaped
+_MATCH_START, _MATCH_END = "\x02", "\x03"
+
+_META_LINE = re.compile(r"^\s*([A-Za-z_][\w-]*)\s*:\s*(.*?)\s*$")
+_LATEX_TOKEN = re.compile(r"\\([A-Za-z]+)|([^\W\d_]+|\d+)")
+_QUERY_TERM = re.compile(r'(?:(\w+):)?("[^"]*"|\S+)')
+_WORD = re.compile(r"\w+")
+
+
+def parse_meta(text):
+    """Reads the key: "value" lines of a <meta> element into a dict."""
+    fields = {}
+    for line in (text or "").splitlines():
+        match = _META_LINE.match(line)
+        if match:
+            fields[match.group(1).lower()] = match.group(2).strip("\"'")
+    return fields
+
+
+def latex_tokens(latex_code):
+    """Returns the commands and symbols of LaTeX source as words, e.g. "\\frac{a}{b}" -> "frac a b"."""
+    return " ".join(command or word for command, word in _LATEX_TOKEN.findall(latex_code or ""))
+
+
+def extract_fields(pyml_content):
+    """Returns the searchable text of a document, by field."""
+    root = parse_pyml(pyml_content)
+    meta = {}
+    headings = []
+    body = []
+    latex = []
+
+    def visit(element):
+        tag = element.tag if isinstance(element.tag, str) else None
+        if tag is None:
+            pass  # A comment or processing instruction
+        elif tag == "meta":
+            meta.update(parse_meta(element.text))
+        elif tag in HEADING_TAGS:
+            headings.append(" ".join("".join(element.itertext()).split()))
+        elif tag == "latex":
+            latex.append(latex_tokens(element.text))
+        elif tag not in SKIPPED_TAGS:
+            if element.text:
+                body.append(element.text)
+            for child in element:
+                visit(child)
+        # Text after an element belongs to its parent
+        if element.tail:
+            body.append(element.tail)
+
+    visit(root)
+    return {
+        "title": meta.get("title", headings[0] if headings else ""),
+        "author": meta.get("author", ""),
+        "date": meta.get("date", ""),
+        "headings": "\n".join(headings),
+        "body": " ".join(" ".join(body).split()),
+        "latex": "\n".join(latex),
+    }
+
+
+def build_query(text):
+    """Turns what the user typed into an FTS5 query.
+
+    Every word has to match, as a prefix; field:word restricts a word to one
+    field, e.g. title:quantum or latex:frac. Returns None if nothing is left.
+    """
+    terms = []
+    for field, value in _QUERY_TERM.findall(text):
+        words = _WORD.findall(value)
+        if not words:
+            continue
+        phrase = " AND ".join(f'"{word}"*' for word in words)
+        if field.lower() in FIELDS:
+            terms.append(f"{field.lower()} : ({phrase})")
+        else:
+            terms.append(phrase)
+    # FTS5 does not accept an implicit AND after a parenthesised group, so spell it out
+    return " AND ".join(terms) or None
+
+
+class SearchResult:
+    def __init__(self, url, title, author, date, snippet, score):
+        self.url = url
+        self.title = title
+        self.author = author
+        self.date = date
+        self.snippet = snippet  # Plain text, with the matched terms between _MATCH_START and _MATCH_END
+        self.score = score  # BM25; lower is better
+
+    def snippet_html(self):
+        return html.escape(self.snippet).replace(_MATCH_START, "<b>").replace(_MATCH_END, "</b>")
+
+
+class SearchIndex:
+    """An inverted index of documents in an SQLite FTS5 table, ranked with BM25.
+
+    Each thread gets its own connection; the database runs in WAL mode, so
+    searches are not held up by a background thread adding documents.
+    Documents whose content is unchanged are not indexed again.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._schema_lock = threading.Lock()
+        self._schema_ready = False
+
+    def _connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            with self._schema_lock:
+                if not self._schema_ready:
+                    with connection:
+                        connection.executescript(_SCHEMA)
+                    self._schema_ready = True
+            self._local.connection = connection
+        return connection
+
+    def add(self, url, pyml_content, mtime_ns=None, size=None):
+        """Indexes a document unless it is already indexed with the same content. Returns True if it was indexed."""
+        digest = hashlib.sha256(pyml_content.encode("utf-8")).hexdigest()
+        connection = self._connection()
+        row = connection.execute("SELECT id, digest FROM documents WHERE url = ?", (url,)).fetchone()
+        if row is not None and row[1] == digest:
+            if mtime_ns is not None:
+                with connection:
+                    connection.execute("UPDATE documents SET mtime_ns = ?, size = ? WHERE id = ?", (mtime_ns, size, row[0]))
+            return False
+        # Parse before touching the index, so a broken document keeps its last good entry
+        fields = extract_fields(pyml_content)
+        with connection:
+            if row is None:
+                document_id = connection.execute(
+                    "INSERT INTO documents (url, digest, mtime_ns, size, indexed_at) VALUES (?, ?, ?, ?, ?)",
+                    (url, digest, mtime_ns, size, time.time()),
+                ).lastrowid
+            else:
+                document_id = row[0]
+                connection.execute(
+                    "UPDATE documents SET digest = ?, mtime_ns = ?, size = ?, indexed_at = ? WHERE id = ?",
+                    (digest, mtime_ns, size, time.time(), document_id),
+                )
+                connection.execute("DELETE FROM entries WHERE rowid = ?", (document_id,))
+            connection.execute(
+                f"INSERT INTO entries (rowid, {', '.join(FIELDS)}) VALUES (?, {', '.join('?' * len(FIELDS))})",
+                (document_id, *(fields[field] for field in FIELDS)),
+            )
+        return True
+
+    def add_file(self, path):
+        """Indexes a local document, skipping it without reading it if its size and mtime are unchanged."""
+        path = os.path.abspath(path)
+        info = os.stat(path)
+        row = self._connection().execute("SELECT mtime_ns, size FROM documents WHERE url = ?", (path,)).fetchone()
+        if row is not None and row == (info.st_mtime_ns, info.st_size):
+            return False
+        with open(path, "r", encoding="utf-8") as file:
+            pyml_content = file.read()
+        return self.add(path, pyml_content, info.st_mtime_ns, info.st_size)
+
+    def remove(self, url):
+        connection = self._connection()
+        with connection:
+            row = connection.execute("SELECT id FROM documents WHERE url = ?", (url,)).fetchone()
+            if row is not None:
+                connection.execute("DELETE FROM entries WHERE rowid = ?", row)
+                connection.execute("DELETE FROM documents WHERE id = ?", row)
+
+    def scan(self, directory, recursive=True):
+        """Brings the index up to date with the .pyml files in ``directory``.
+
+        Returns the number of documents indexed, and drops documents that are gone.
+        """
+        directory = os.path.abspath(directory)
+        found = set()
+        for current, subdirectories, files in os.walk(directory):
+            if not recursive:
+                subdirectories.clear()
+            found.update(os.path.join(current, name) for name in files if name.endswith(".pyml"))
+
+        indexed = 0
+        for path in sorted(found):
+            try:
+                indexed += self.add_file(path)
+            except Exception:
+                continue  # Unreadable or not well-formed; it is picked up again once it is fixed
+
+        prefix = os.path.join(directory, "")
+        for (url,) in self._connection().execute(
+            "SELECT url FROM documents WHERE substr(url, 1, ?) = ?", (len(prefix), prefix)
+        ).fetchall():
+            if url in found or (not recursive and os.path.dirname(url) != directory):
+                continue
+            self.remove(url)
+        return indexed
+
+    def search(self, text, limit=20):
+        """Returns the best matches for what the user typed, best first."""
+        query = build_query(text)
+        if query is None:
+            return []
+        try:
+            rows = self._connection().execute(
+                f"""
+                SELECT documents.url, entries.title, entries.author, entries.date,
+                       snippet(entries, -1, ?, ?, '…', 16),
+                       bm25(entries, {', '.join(map(str, WEIGHTS))}) AS score
+                FROM entries JOIN documents ON documents.id = entries.rowid
+                WHERE entries MATCH ?
+                ORDER BY score
+                LIMIT ?
+                """,
+                (_MATCH_START, _MATCH_END, query, limit),
+            ).fetchall()
+        except sqlite3.OperationalError:
+            return []  # A query FTS5 cannot parse matches nothing
+        return [SearchResult(*row) for row in rows]
+
+    def __len__(self):
+        return self._connection().execute("SELECT count(*) FROM documents").fetchone()[0]
+
+    def close(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+
+def results_html(query, results, file_url=None):
+    """Returns a page listing search results; ``file_url`` turns a local path into a link."""
+    items = []
+    for result in results:
+        href = result.url if result.url.startswith(("http://", "https://")) or file_url is None else file_url(result.url)
+        byline = " · ".join(html.escape(part) for part in (result.author, result.date) if part)
+        items.append(
+            f'<li><a href="{html.escape(href)}">{html.escape(result.title or result.url)}</a>'
+            f'<div class="byline">{byline}</div>'
+            f'<div class="snippet">{result.snippet_html()}</div>'
+            f'<div class="url">{html.escape(result.url)}</div></li>'
+        )
+    listing = f"<ol>{''.join(items)}</ol>" if items else "<p>No documents match.</p>"
+    return f"""
+        <!DOCTYPE html>
+        <html>
+        <head>
+            <title>Search: {html.escape(query)}</title>
+            <style>
+                li {{ margin-bottom: 1em; }}
+                .byline, .url {{ color: #666; font-size: smaller; }}
+            </style>
+        </head>
+        <body>
+            <h2>Results for &ldquo;{html.escape(query)}&rdquo;</h2>
+            {listing}
+        </body>
+        </html>
+        """
+
+
+def default_index_path():
+    from galacton.pyml import ensure_tmp_directory  # galacton.pyml imports this module
+
+    return os.path.join(ensure_tmp_directory(), INDEX_NAME)
+
+
+def index_main(args):
+    index = SearchIndex(args.index or default_index_path())
+    for directory in args.directories:
+        started = time.perf_counter()
+        indexed = index.scan(directory)
+        print(f"{directory}: indexed {indexed} changed documents in {time.perf_counter() - started:.2f}s")
+    print(f"{len(index)} documents in {index.path}")
+    return 0
+
+
+def search_main(args):
+    index = SearchIndex(args.index or default_index_path())
+    query = " ".join(args.query)
+    started = time.perf_counter()
+    results = index.search(query, args.limit)
+    elapsed = time.perf_counter() - started
+    for result in results:
+        snippet = result.snippet.replace(_MATCH_START, "*").replace(_MATCH_END, "*")
+        print(f"{result.score:8.3f}  {result.title or '(untitled)'}\n          {result.url}\n          {snippet}")
+    print(f"{len(results)} results in {elapsed * 1000:.1f} ms")
+    return 0 if results else 1
+
+
+def add_index_arguments(parser):
+    parser.add_argument("directories", nargs="+", help="directories whose .pyml files are indexed, recursively")
+    parser.add_argument("--index", help=f"index file (default: tmp/{INDEX_NAME})")
+    parser.set_defaults(handler=index_main)
+
+
+def add_search_arguments(parser):
+    parser.add_argument("query", nargs="+", help="words to look for; field:word searches one of " + ", ".join(FIELDS))
+    parser.add_argument("--index", help=f"index file (default: tmp/{INDEX_NAME})")
+    parser.add_argument("-n", "--limit", type=int, default=20, help="number of results (default: 20)")
+    parser.set_defaults(handler=search_main)
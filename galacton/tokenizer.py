@@ -0,0 +1,53 @@
+import re
+
+# Elements whose content is code, kept byte for byte instead of being parsed as markup
+RAW_TEXT_TAGS = ("python", "r")
+
+# Comments and CDATA sections are skipped; anything else matched is the opening tag of a code element
+_MARKUP = re.compile(
+    r"<!--.*?-->|<!\[CDATA\[.*?\]\]>|<(%s)(?=[\s/>])([^>]*)>" % "|".join(RAW_TEXT_TAGS),
+    re.DOTALL,
+)
+
+
+def mark_raw_text(pyml_content):
+    """Wraps the body of every code element in a CDATA section, in a single pass over the document.
+
+    Code may then contain <, > and & freely, and lxml hands it back untouched as
+    the element's text. Opening tags may carry attributes or be self-closing.
+    """
+    out = []
+    position = 0
+    while True:
+        match = _MARKUP.search(pyml_content, position)
+        if match is None:
+            break
+        tag = match.group(1)
+        if tag is None or match.group(2).rstrip().endswith("/"):
+            # A comment, CDATA section or self-closing element: copy it as is
+            out.append(pyml_content[position:match.end()])
+            position = match.end()
+            continue
+
+        closing_tag = f"</{tag}>"
+        body_start = match.end()
+        body_end = pyml_content.find(closing_tag, body_start)
+        if body_end < 0:
+            # Unterminated; leave the rest for the XML parser to report
+            break
+        body = pyml_content[body_start:body_end]
+        out.append(pyml_content[position:body_start])
+        if body:
+            # "]]>" cannot appear inside CDATA, so split the section around it
+            out.append("<![CDATA[" + body.replace("]]>", "]]]]><![CDATA[>") + "]]>")
+        out.append(closing_tag)
+        position = body_end + len(closing_tag)
+    out.append(pyml_content[position:])
+    return "".join(out)
+
+
+def parse_pyml(pyml_content):
+    """Parses a .pyml document, returning the root element with code element bodies as raw text."""
+    from lxml import etree  # Imported on first use to keep start-up fast
+
+    return etree.fromstring(mark_raw_text(pyml_content))
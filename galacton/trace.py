@@ -0,0 +1,241 @@
+import os
+import re
+import json
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+
+# The trace of the page being rendered in the current thread or task, if any
+_current = contextvars.ContextVar("galacton_trace", default=None)
+# Details of the innermost open span, which annotate() adds to
+_details = contextvars.ContextVar("galacton_span_details", default=None)
+
+# Number of trace files kept in the trace directory; older ones are deleted
+MAX_TRACE_FILES = 50
+
+
+class Trace:
+    """Timings, counters and errors collected while loading and rendering one page.
+
+    Spans are recorded as Chrome trace events, so a saved trace can be opened in
+    chrome://tracing or https://ui.perfetto.dev.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.started = time.time()
+        self._origin = time.perf_counter()
+        self._lock = threading.Lock()
+        self.spans = []  # (name, category, start, duration, thread id, args), times in seconds
+        self.counters = {}
+        self.errors = []  # (stage, message)
+        self.path = None  # Where the trace was saved, if it was
+        self.duration = None  # Set by finish()
+        self.profiles = []  # cProfile profilers of the page's work, one per profile() block (GALACTON_PROFILE)
+        self.profile_path = None  # Where their combined statistics were saved, if they were
+
+    def add_span(self, name, category, start, duration, args=None):
+        with self._lock:
+            self.spans.append((name, category, start - self._origin, duration, threading.get_ident(), args or {}))
+
+    def add_profile(self, profiler):
+        with self._lock:
+            self.profiles.append(profiler)
+
+    def count(self, name, amount=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def error(self, stage, message):
+        with self._lock:
+            self.errors.append((stage, str(message)))
+            self.counters["errors"] = self.counters.get("errors", 0) + 1
+
+    def elapsed(self):
+        return time.perf_counter() - self._origin
+
+    def finish(self):
+        """Marks the page as done and returns the total time it took."""
+        if self.duration is None:
+            self.duration = self.elapsed()
+        return self.duration
+
+    def stage_totals(self):
+        """Returns the summed duration of every non-block span name, in order of first appearance."""
+        totals = {}
+        with self._lock:
+            for name, category, _, duration, _, _ in self.spans:
+                if category != "block":
+                    totals[name] = totals.get(name, 0.0) + duration
+        return totals
+
+    def block_spans(self):
+        """Returns (name, duration, args) for every block span, slowest first."""
+        with self._lock:
+            blocks = [(name, duration, args) for name, category, _, duration, _, args in self.spans if category == "block"]
+        return sorted(blocks, key=lambda block: block[1], reverse=True)
+
+    def to_chrome(self):
+        """Returns the trace as a Chrome trace-event document."""
+        pid = os.getpid()
+        with self._lock:
+            events = [
+                {
+                    "name": name,
+                    "cat": category,
+                    "ph": "X",
+                    "ts": round(start * 1e6),
+                    "dur": round(duration * 1e6),
+                    "pid": pid,
+                    "tid": tid,
+                    "args": args,
+                }
+                for name, category, start, duration, tid, args in self.spans
+            ]
+            end = round((self.duration if self.duration is not None else self.elapsed()) * 1e6)
+            events.extend(
+                {"name": name, "ph": "C", "ts": end, "pid": pid, "args": {name: value}}
+                for name, value in sorted(self.counters.items())
+            )
+            events.extend(
+                {"name": f"error: {stage}", "ph": "i", "s": "p", "ts": end, "pid": pid, "args": {"message": message}}
+                for stage, message in self.errors
+            )
+            return {
+                "traceEvents": events,
+                "displayTimeUnit": "ms",
+                "otherData": {"page": self.name, "started": self.started, "counters": dict(self.counters)},
+            }
+
+    def save(self, directory):
+        """Writes the trace to a new JSON file in ``directory``, and its profile next to it, and returns its path."""
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, self._file_stem() + ".json")
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump(self.to_chrome(), file)
+        self.path = path
+        self.save_profile(directory)
+        _prune(directory, MAX_TRACE_FILES)
+        return path
+
+    def save_profile(self, directory):
+        """Writes the combined cProfile statistics of the page to a ``.prof`` file, if it was profiled.
+
+        The file can be read with pstats or snakeviz. Returns its path, or None.
+        """
+        with self._lock:
+            profiles = list(self.profiles)
+        if not profiles:
+            return None
+        import pstats
+
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, self._file_stem() + ".prof")
+        pstats.Stats(*profiles).dump_stats(path)
+        self.profile_path = path
+        return path
+
+    def _file_stem(self):
+        stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(self.started)) + f"{self.started % 1:.3f}"[1:]
+        return f"{stamp}-{_slug(self.name)}"
+
+
+def current():
+    """Returns the trace active in this context, or None."""
+    return _current.get()
+
+
+@contextmanager
+def activate(trace):
+    """Makes ``trace`` the current trace for the duration of the block."""
+    token = _current.set(trace)
+    try:
+        yield trace
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def span(name, category="stage", **args):
+    """Times the enclosed block as a span of the current trace; does nothing without one."""
+    trace = _current.get()
+    if trace is None:
+        yield args
+        return
+    token = _details.set(args)
+    start = time.perf_counter()
+    try:
+        yield args
+    finally:
+        trace.add_span(name, category, start, time.perf_counter() - start, args)
+        _details.reset(token)
+
+
+def annotate(**details):
+    """Adds details, such as whether the output came from the cache, to the innermost open span."""
+    args = _details.get()
+    if args is not None:
+        args.update(details)
+
+
+def count(name, amount=1):
+    """Adds ``amount`` to a counter of the current trace, if there is one."""
+    trace = _current.get()
+    if trace is not None:
+        trace.count(name, amount)
+
+
+def error(stage, message):
+    """Records an error that is shown in the page instead of raised."""
+    trace = _current.get()
+    if trace is not None:
+        trace.error(stage, message)
+
+
+@contextmanager
+def profile():
+    """Runs the enclosed block under cProfile when GALACTON_PROFILE is set and a trace is active.
+
+    Blocks run on several threads, and cProfile only sees the thread it runs in,
+    so each profiled block gets its own profiler; the trace combines them when it
+    is saved (see Trace.save_profile).
+    """
+    trace = _current.get()
+    if trace is None or not os.environ.get("GALACTON_PROFILE"):
+        yield
+        return
+    import cProfile
+
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # This thread is already being profiled by an enclosing block
+        yield
+        return
+    try:
+        yield
+    finally:
+        profiler.disable()
+        trace.add_profile(profiler)
+
+
+def _slug(name):
+    # Keep the last path component readable and the file name safe
+    base = name.rstrip("/").rsplit("/", 1)[-1] or "page"
+    return re.sub(r"[^A-Za-z0-9._-]+", "_", base)[:60]
+
+
+def _prune(directory, keep):
+    files = sorted(
+        (entry for entry in os.scandir(directory) if entry.name.endswith(".json")),
+        key=lambda entry: entry.stat().st_mtime,
+    )
+    for entry in files[:max(0, len(files) - keep)]:
+        # A trace's profile goes with it
+        for path in (entry.path, entry.path[:-len(".json")] + ".prof"):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
@@ -0,0 +1,92 @@
+from PyQt5.QtCore import Qt
+from PyQt5.QtWidgets import QDockWidget, QLabel, QTreeWidget, QTreeWidgetItem, QVBoxLayout, QWidget
+
+
+class TracePanel(QDockWidget):
+    """Side panel listing where the time went while loading the current page."""
+
+    def __init__(self, parent=None):
+        super().__init__("Profile", parent)
+        self.setObjectName("trace-panel")
+        self.setAllowedAreas(Qt.LeftDockWidgetArea | Qt.RightDockWidgetArea | Qt.BottomDockWidgetArea)
+
+        # Total time and the saved trace file
+        self.summary = QLabel("No page loaded yet", self)
+        self.summary.setWordWrap(True)
+        self.summary.setTextInteractionFlags(Qt.TextSelectableByMouse)
+
+        # Stages, blocks, counters and errors as collapsible sections
+        self.tree = QTreeWidget(self)
+        self.tree.setColumnCount(2)
+        self.tree.setHeaderLabels(["Item", "Value"])
+        self.tree.setRootIsDecorated(True)
+
+        layout = QVBoxLayout()
+        layout.setContentsMargins(4, 4, 4, 4)
+        layout.addWidget(self.summary)
+        layout.addWidget(self.tree)
+        container = QWidget(self)
+        container.setLayout(layout)
+        self.setWidget(container)
+
+    def show_trace(self, trace):
+        """Replaces the panel's contents with the timings of ``trace``."""
+        total = trace.finish()
+        summary = f"{trace.name}\nTotal: {_ms(total)}"
+        if trace.path:
+            summary += f"\nTrace: {trace.path}"
+        if trace.profile_path:
+            summary += f"\nProfile: {trace.profile_path}"
+        self.summary.setText(summary)
+        self.tree.clear()
+
+        stages = self._section("Stages")
+        for name, duration in trace.stage_totals().items():
+            QTreeWidgetItem(stages, [name, _ms(duration)])
+
+        blocks = self._section("Blocks (slowest first)")
+        for name, duration, details in trace.block_spans():
+            value = _ms(duration)
+            if "cached" in details:
+                value += " (cached)" if details["cached"] else " (executed)"
+            item = QTreeWidgetItem(blocks, [name, value])
+            # Resources used by blocks that ran on a worker
+            if "cpu_seconds" in details:
+                QTreeWidgetItem(item, ["CPU", _ms(details["cpu_seconds"])])
+            if details.get("worker_peak_rss_bytes"):
+                QTreeWidgetItem(item, ["Worker peak RSS", _bytes(details["worker_peak_rss_bytes"])])
+            if details.get("peak_rss_growth_bytes") is not None:
+                QTreeWidgetItem(item, ["Peak RSS growth", _bytes(details["peak_rss_growth_bytes"])])
+            if "output_bytes" in details:
+                QTreeWidgetItem(item, ["Output", _bytes(details["output_bytes"])])
+
+        counters = self._section("Counters")
+        for name, value in sorted(trace.counters.items()):
+            QTreeWidgetItem(counters, [name, _bytes(value) if name.endswith("bytes_fetched") else str(value)])
+
+        if trace.errors:
+            errors = self._section("Errors")
+            for stage, message in trace.errors:
+                item = QTreeWidgetItem(errors, [stage, message])
+                item.setToolTip(1, message)
+
+        self.tree.expandAll()
+        self.tree.resizeColumnToContents(0)
+
+    def _section(self, title):
+        item = QTreeWidgetItem(self.tree, [title, ""])
+        font = item.font(0)
+        font.setBold(True)
+        item.setFont(0, font)
+        return item
+
+
+def _ms(seconds):
+    return f"{seconds * 1000:.1f} ms"
+
+
+def _bytes(count):
+    for unit in ("B", "KB", "MB"):
+        if count < 1024 or unit == "MB":
+            return f"{count:.0f} {unit}" if unit == "B" else f"{count:.1f} {unit}"
+        count /= 1024
@@ -1,66 +1,26 @@
 import sys
+
+from galacton.pykernel import KERNEL_FLAG
+
+# A bundled executable re-launches itself with this flag to act as a Python worker;
+# handle it before importing Qt, which the worker does not need
+if __name__ == "__main__" and sys.argv[1:2] == [KERNEL_FLAG]:
+    from galacton.pykernel import serve
+    serve()
+    sys.exit()
+
 import os
-import hashlib
-import requests
 import shutil
-import stat
-import textwrap
-import subprocess
-import re
-import html
-import io
-import contextlib
-from urllib.parse import urlparse, urljoin, unquote
-from sympy import preview  # For rendering LaTeX equations as images
+from urllib.parse import urlparse
 from PyQt5.QtWidgets import QApplication, QMainWindow, QVBoxLayout, QWidget, QLineEdit, QPushButton, QHBoxLayout
-from PyQt5.QtWebEngineWidgets import QWebEngineView, QWebEnginePage, QWebEngineSettings
-from PyQt5.QtCore import QUrl
-from lxml import etree  # For parsing XML-like syntax
-
-def ensure_tmp_directory():
-    # Define the output directory for temporary images
-    output_dir = os.path.join(os.path.dirname(__file__), "tmp")  # Make 'tmp' relative to the script's location
-
-    # Create the directory if it doesn't exist
-    if not os.path.exists(output_dir):
-        os.makedirs(output_dir)
-
-    # Ensure the directory has the correct permissions
-    os.chmod(output_dir, stat.S_IRWXU | stat.S_IRWXG | stat.S_IRWXO)  # Read, write, and execute for everyone
-
-    return output_dir
-
-def escape_special_chars(text):
-    """Escapes special characters like <, >, and & in code blocks."""
-    return text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
-
-def unescape_special_chars(escaped_text):
-    """Unescapes special characters like &lt;, &gt;, and &amp; back to their original form."""
-    return html.unescape(escaped_text)
-
-def preprocess_pyml_content(pyml_content):
-    """Preprocess the .pyml content to escape special characters within code blocks."""
-    # Define a regex pattern to match content within <r> and <python> tags
-    code_block_pattern = r'(<(python|r)>)([\s\S]*?)(<\/\2>)'
-
-    # Replace each match with escaped content
-    def escape_code_block(match):
-        # Full match includes opening and closing tags
-        opening_tag, language, code_content, closing_tag = match.groups()
-        # Escape special characters in the code content
-        escaped_content = escape_special_chars(code_content)
-        # Return the escaped code block
-        return f"{opening_tag}{escaped_content}{closing_tag}"
-
-    # Apply regex substitution to escape special characters in code blocks
-    return re.sub(code_block_pattern, escape_code_block, pyml_content)
-
-def convert_file_url_to_local_path(file_url):
-    # Convert 'file://' URL to local path
-    if file_url.startswith('file://'):
-        # Remove 'file://' prefix and unquote to handle spaces or special characters
-        return unquote(file_url[7:])
-    return file_url
+from PyQt5.QtWebEngineWidgets import QWebEngineView, QWebEnginePage, QWebEngineSettings, QWebEngineScript
+from PyQt5.QtCore import Qt, QUrl, QTimer, QStandardPaths
+from galacton.pipeline import RenderPipeline
+from galacton.history import History
+from galacton.pyml import RenderServices, block_patch_script, convert_file_url_to_local_path, document_url
+from galacton.scheme import AssetSchemeHandler, register_scheme
+from galacton.search import results_html
+from galacton.trace_panel import TracePanel
 
 class CustomWebEnginePage(QWebEnginePage):
     def __init__(self, renderer):
@@ -86,6 +46,25 @@ class PyMLRenderer(QMainWindow):
         self.handling_link = False  # Flag to prevent recursive handling
         self.enable_javascript = enable_javascript
 
+        # Caches and engines shared by every page render. The interpreter workers are
+        # started once the window is up, so they do not compete with drawing it
+        self.services = RenderServices(prestart=False, output_dir=cache_directory())
+
+        # Pages are fetched and rendered in the background and streamed into the view
+        self.render_pipeline = RenderPipeline(self.services, self)
+        self.render_pipeline.fetched.connect(self.handle_fetched)
+        self.render_pipeline.page_ready.connect(self.show_page)
+        self.render_pipeline.page_updated.connect(self.update_page)
+        self.render_pipeline.block_ready.connect(self.show_block)
+        self.render_pipeline.failed.connect(self.show_error)
+        self.render_pipeline.traced.connect(self.show_trace)
+        self.page_loaded = False
+        self.pending_blocks = []
+        self.restore_scroll = None  # Scroll position to return to once a live-reloaded page has loaded
+
+        # Visited documents, for the back and forward buttons
+        self.history = History()
+
         # Ensure LaTeX is in the PATH
         latex_path = shutil.which("latex")  # Check if LaTeX is in the current PATH
         dvipng_path = shutil.which("dvipng")
@@ -112,6 +91,14 @@ class PyMLRenderer(QMainWindow):
         # Create a horizontal layout for the URL bar
         url_layout = QHBoxLayout()
 
+        # Back and forward buttons, served from the rendered page cache when possible
+        self.back_button = QPushButton("<", self)
+        self.back_button.clicked.connect(self.go_back)
+        url_layout.addWidget(self.back_button)
+        self.forward_button = QPushButton(">", self)
+        self.forward_button.clicked.connect(self.go_forward)
+        url_layout.addWidget(self.forward_button)
+
         # URL bar (QLineEdit)
         self.url_bar = QLineEdit(self)
         self.url_bar.setPlaceholderText("Enter file path or URL...")
@@ -123,6 +110,18 @@ class PyMLRenderer(QMainWindow):
         go_button.clicked.connect(self.navigate_to_url)  # Trigger navigation when the button is clicked
         url_layout.addWidget(go_button)
 
+        # Searches every document that has been opened, or indexed with "python -m galacton index"
+        self.search_bar = QLineEdit(self)
+        self.search_bar.setPlaceholderText("Search documents...")
+        self.search_bar.setMaximumWidth(220)
+        self.search_bar.returnPressed.connect(self.search_documents)
+        url_layout.addWidget(self.search_bar)
+
+        # Toggles the side panel with the current page's timings
+        self.profile_button = QPushButton("Profile", self)
+        self.profile_button.setCheckable(True)
+        url_layout.addWidget(self.profile_button)
+
         # Add the URL layout to the main layout
         layout.addLayout(url_layout)
 
@@ -130,6 +129,10 @@ class PyMLRenderer(QMainWindow):
         self.web_view = QWebEngineView()
         self.web_page = CustomWebEnginePage(self)
         self.web_view.setPage(self.web_page)
+        # Serves equations, plots and the pages themselves from the asset store
+        self.asset_handler = AssetSchemeHandler(self.services.assets, self)
+        self.asset_handler.install(self.web_page.profile())
+        self.web_view.loadFinished.connect(self.handle_load_finished)
         # self.web_view.urlChanged.connect(self.handle_link_click)
         # self.web_view.urlChanged.connect(self.update_url_bar)  # Connect URL change to update method
         layout.addWidget(self.web_view)
@@ -139,17 +142,32 @@ class PyMLRenderer(QMainWindow):
         central_widget.setLayout(layout)
         self.setCentralWidget(central_widget)
 
+        # Per-stage and per-block timings, hidden until the Profile button is pressed
+        self.trace_panel = TracePanel(self)
+        self.addDockWidget(Qt.RightDockWidgetArea, self.trace_panel)
+        self.trace_panel.hide()
+        self.profile_button.clicked.connect(self.trace_panel.setVisible)
+        self.trace_panel.visibilityChanged.connect(self.profile_button.setChecked)
+
         # Apply initial JavaScript setting
         self.apply_javascript_setting()
 
-        # Load initial PyML content from a file
-        # self.load_pyml_file("https://raw.githubusercontent.com/RadEZorack/Galacton/main/index.pyml")
-        # self.load_pyml_file("index.pyml")
+        # Load the initial page once the event loop is running, so the window is shown first
+        QTimer.singleShot(0, self.start)
+
+    def start(self):
         # Set initial content URL
         initial_url = "https://raw.githubusercontent.com/RadEZorack/Galacton/main/index.pyml"
         # initial_url = "index.pyml"
-        # self.url_bar.setText(initial_url)  # Set the initial URL in the URL bar
-        self.load_pyml_file(initial_url)
+        # Show the locally cached copy right away; it is revalidated in the background
+        self.load_pyml_file(initial_url, allow_stale=True)
+        self.services.python_kernels.start()
+
+    def closeEvent(self, event):
+        # Stop the interpreter processes along with the window
+        self.render_pipeline.cancel()
+        self.services.shutdown()
+        super().closeEvent(event)
 
     def navigate_to_url(self):
         # Get the URL from the URL bar
@@ -158,6 +176,15 @@ class PyMLRenderer(QMainWindow):
         # Call the load_pyml_file function to navigate to the entered URL
         self.load_pyml_file(url)
 
+    def search_documents(self):
+        query = self.search_bar.text().strip()
+        if not query:
+            return
+        # The results page replaces the current one; its links are opened like any other .pyml link
+        self.render_pipeline.cancel()
+        results = self.services.search_index.search(query)
+        self.web_view.setHtml(results_html(query, results, lambda path: QUrl.fromLocalFile(path).toString()))
+
     # def update_url_bar(self, url):
     #     # Update the URL bar with the current URL
     #     print(url.toString())
@@ -173,309 +200,127 @@ class PyMLRenderer(QMainWindow):
         self.enable_javascript = self.javascript_checkbox.isChecked()
         self.apply_javascript_setting()
 
-    def load_pyml_file(self, file_path):
-        try:
-            # Convert file URL to a local path if necessary
-            if file_path.startswith('file://'):
-                file_path = convert_file_url_to_local_path(file_path)
-
-            # Update the URL bar with the current URL
-            self.url_bar.setText(file_path)
-                
-            # Check if the path is a URL
-            parsed_url = urlparse(file_path)
-            if parsed_url.scheme in ['http', 'https']:
-                # Fetch content from the URL
-                response = requests.get(file_path)
-                response.raise_for_status()  # Check for HTTP errors
-                pyml_content = response.text
-                
-                # Store the root base URL if not already set
-                if not self.root_base_url:
-                    self.root_base_url = os.path.dirname(file_path) + '/'
-
-                # Update the current base URL to the directory of the current file
-                self.current_base_url = os.path.dirname(file_path) + '/'
-
-            else:
-                # Load content from a local file
-                with open(file_path, 'r') as file:
-                    pyml_content = file.read()
-                    self.current_base_url = os.path.dirname(os.path.abspath(file_path)) + '/'  # Store local base path
-
-
-            # Parse and render the PyML content
-            self.parse_pyml(pyml_content)
-
-        except Exception as e:
-            self.web_view.setHtml(f"<p>Error loading PyML: {e}</p>")
+    def go_back(self):
+        if self.history.can_go_back():
+            self.load_pyml_file(self.history.back(), record_history=False)
+
+    def go_forward(self):
+        if self.history.can_go_forward():
+            self.load_pyml_file(self.history.forward(), record_history=False)
+
+    def update_history_buttons(self):
+        self.back_button.setEnabled(self.history.can_go_back())
+        self.forward_button.setEnabled(self.history.can_go_forward())
+
+    def load_pyml_file(self, file_path, record_history=True, allow_stale=False):
+        # Convert file URL to a local path if necessary
+        if file_path.startswith('file://'):
+            file_path = convert_file_url_to_local_path(file_path)
+
+        if record_history:
+            self.history.visit(document_url(file_path))
+        self.update_history_buttons()
+
+        # Update the URL bar with the current URL
+        self.url_bar.setText(file_path)
+
+        # Store the root base URL if not already set
+        if urlparse(file_path).scheme in ['http', 'https'] and not self.root_base_url:
+            self.root_base_url = os.path.dirname(file_path) + '/'
+
+        # Fetching, parsing and rendering happen in the background; see show_page and show_block
+        self.render_pipeline.load(file_path, allow_stale)
 
     def parse_pyml(self, pyml_content):
-        try:
-            # Preprocess the content to escape special characters within code blocks
-            preprocessed_content = preprocess_pyml_content(pyml_content)
-
-            # Now parse the preprocessed content
-            root = etree.fromstring(preprocessed_content)
-
-            # Start building the HTML content
-            content = """
-            <!DOCTYPE html>
-            <html>
-            <head>
-                <title>PyML Renderer</title>
-            </head>
-            <body>
-            """
-
-            # Process elements
-            for element in root.iter():
-                attrs = ' '.join(f'{key}="{value}"' for key, value in element.attrib.items())
-                if element.tag == 'meta':
-                    # parse the meta tag if needed. But don't include in final output
-                    pass
-                elif element.tag == 'latex':
-                    # Convert LaTeX to an image and embed it
-                    img_tag = self.render_latex_to_image(element.text.strip())
-                    content += f"<div {attrs}>{img_tag}</div>\n"
-                elif element.tag == 'python':  # Handle the <python> tag
-                    src_file = element.get('src')
-                    cache_enabled = element.get('cache', 'True').lower() == 'true'
-
-                    escaped_code = escape_special_chars(element.text) if element.text else None
-                    # Use the new unified function to handle both inline code and source files
-                    content += self.execute_python_code(escaped_code, src_file, cache_enabled)
-
-                elif element.tag == 'r':  # Handle the <r> tag
-                    src_file = element.get('src')
-                    cache_enabled = element.get('cache', 'True').lower() == 'true'
-
-                    escaped_code = escape_special_chars(element.text) if element.text else None
-
-                    # Use the new function to handle both inline R code and source files
-                    content += self.execute_r_code(escaped_code, src_file, cache_enabled)
-                    
-                elif element.tag == 'a':
-                    # Resolve relative URLs
-                    href = self.resolve_relative_path(element.get('href'))
-                    content += f"<a href='{href}' {attrs}>{element.text}</a>\n"
-                else:
-                    # Handle all other tags generically, including their attributes
-                    content += f"<{element.tag} {attrs}>{element.text or ''}</{element.tag}>\n"
-                # Add more handlers for other elements as needed...
-
-            # Close HTML content
-            content += """
-            </body>
-            </html>
-            """
-
-            # Load the HTML content into the web view with a base URL
-            base_url = QUrl.fromLocalFile(os.path.dirname(os.path.realpath(__file__)) + '/')
-            self.web_view.setHtml(content, base_url)
-        except Exception as e:
-            self.web_view.setHtml(f"<p>Error parsing PyML: {e}</p>")
-
-    # def handle_link_click(self, url):
-    #     # Only handle the link if it's not the initial page load
-    #     if self.initial_load:
-    #         self.initial_load = False
-    #         return
-        
-    #     # Avoid recursive handling
-    #     if self.handling_link:
-    #         return
-
-    #     # Start handling the link
-    #     self.handling_link = True
-    #     url_str = url.toString()
-    #     print(f"url_str {url_str}")
-
-    #     if url_str.endswith('.pyml'):
-    #         self.load_pyml_file(url_str)
-    #     else:
-    #         # For other links, navigate normally
-    #         self.web_view.setUrl(url)
-
-    #     # End handling the link
-    #     self.handling_link = False
-
-
-    def render_latex_to_image(self, latex_code):
-        try:
-            # Ensure the "tmp" directory exists and has correct permissions
-            output_dir = ensure_tmp_directory()
-
-            # Check if LaTeX and dvipng are installed
-            if not shutil.which("latex") or not shutil.which("dvipng"):
-                raise EnvironmentError("LaTeX or dvipng program is not installed or not found in PATH.")
-
-            # Create a hash of the LaTeX code
-            latex_hash = hashlib.md5(latex_code.encode('utf-8')).hexdigest()
-            output_image_path = os.path.join(output_dir, f"{latex_hash}.png")
-
-            # Check if the image already exists
-            if not os.path.exists(output_image_path):
-                # Render the LaTeX code to a PNG image
-                result = preview(latex_code, viewer='file', filename=output_image_path, dvioptions=["-D", "150"])
-                if result is not None:
-                    raise RuntimeError(f"dvipng error: {result}")
-
-            # Return an HTML img tag with the relative path to the generated image
-            return f'<img src="{output_image_path}" alt="LaTeX Image">'
-        except EnvironmentError as e:
-            return f"<p>Error rendering LaTeX: {e}</p>\n"
-        except RuntimeError as e:
-            return f"<p>Error rendering LaTeX: {e}</p>\n"
-        except Exception as e:
-            return f"<p>Error rendering LaTeX: {e}</p>\n"
-
-    def resolve_relative_path(self, path):
-        # If the path is already a complete URL, return it as is
-        if urlparse(path).scheme in ['http', 'https']:
-            return path
-
-        # If working with a remote base URL
-        # if self.root_base_url and self.root_base_url.startswith('http'):
-        #     return urljoin(self.root_base_url, path)
-        # Use the correct base URL (remote or local)
-        if self.current_base_url.startswith('http'):
-            # If currently using a remote base URL, use urljoin for proper resolution
-            return urljoin(self.current_base_url, path)
-
-        # Otherwise, assume it's a local file path
-        return os.path.abspath(os.path.join(self.current_base_url, path))
-
-
-    def execute_python_code(self, inline_code=None, src_file=None, cache_enabled=True):
-        try:
-            # Determine if we're executing inline code or loading from a file
-            if src_file:
-                # Resolve the path to make it an absolute URL if needed
-                file_path = self.resolve_relative_path(src_file)
-
-                # Determine if the file path is local or remote
-                is_remote = file_path.startswith('http')
-
-                # Read the Python script content
-                if is_remote:
-                    # Load script from the remote URL
-                    response = requests.get(file_path)
-                    response.raise_for_status()
-                    code = response.text
-                else:
-                    # Load script from the local file
-                    with open(file_path, 'r') as file:
-                        code = file.read()
-
-            else:
-                # Use inline code directly, dedenting to handle any leading spaces
-                code = textwrap.dedent(inline_code or "")
-
-            # Unescape special characters before execution
-            code = unescape_special_chars(code)
-
-            # # Generate a hash for the script content
-            # script_hash = hashlib.md5(code.encode('utf-8')).hexdigest()
-            # cached_output_html = f"tmp/{script_hash}.html"
-            # cached_output_img = f"tmp/{script_hash}.png"
-
-            # # Check if caching is enabled and the cached output exists
-            # if cache_enabled:
-            #     if os.path.exists(cached_output_html):
-            #         return f'<iframe src="{cached_output_html}" width="100%" height="600" frameborder="0" allowfullscreen></iframe>'
-            #     elif os.path.exists(cached_output_img):
-            #         return f'<img src="{cached_output_img}" alt="Python Output Image" />'
-
-            # Capture the output of the script execution
-            output_buffer = io.StringIO()
-            with contextlib.redirect_stdout(output_buffer):
-                exec_locals = {}
-                exec_globals = {}
-                exec(code, exec_globals, exec_locals)
-
-            # Get the captured output
-            output = output_buffer.getvalue()
-
-            # Convert line breaks to <br> tags to maintain formatting
-            output_html = output.replace("\n", "<br>")
-
-            return f"<div>{output_html}</div>\n"
-
-            #     # Determine the type of output (image or HTML)
-            #     if isinstance(output, str):
-            #         if output.endswith('.png'):
-            #             if cache_enabled:
-            #                 os.rename(output, cached_output_img)
-            #             return f'<img src="{cached_output_img if cache_enabled else output}" alt="Python Output Image" />'
-            #         elif output.endswith('.html'):
-            #             if cache_enabled:
-            #                 os.rename(output, cached_output_html)
-            #             return f'<iframe src="{cached_output_html if cache_enabled else output}" width="100%" height="600" frameborder="0" allowfullscreen></iframe>'
-            #     # Default to displaying raw output if it's not a recognized file type
-            #     return f"<pre>{output}</pre>\n"
-        except Exception as e:
-            return f"Error executing code: {e}\n"
-
-    def execute_r_code(self, inline_code=None, src_file=None, cache_enabled=True):
-        try:
-            # Determine if we're executing inline code or loading from a file
-            if src_file:
-                # Resolve the path to make it an absolute URL if needed
-                file_path = self.resolve_relative_path(src_file)
-
-                # Determine if the file path is local or remote
-                is_remote = file_path.startswith('http')
-
-                # Read the R script content
-                if is_remote:
-                    # Load script from the remote URL
-                    response = requests.get(file_path)
-                    response.raise_for_status()
-                    code = response.text
-                else:
-                    # Load script from the local file
-                    with open(file_path, 'r') as file:
-                        code = file.read()
-
-            else:
-                # Use inline code directly, dedenting to handle any leading spaces
-                code = textwrap.dedent(inline_code or "")
-
-            # Unescape special characters before execution
-            code = unescape_special_chars(code)
-
-            # # Generate a hash for the script content
-            # script_hash = hashlib.md5(code.encode('utf-8')).hexdigest()
-            # cached_output_html = f"tmp/{script_hash}.html"
-            # cached_output_img = f"tmp/{script_hash}.png"
-
-            # # Check if caching is enabled and the cached output exists
-            # if cache_enabled:
-            #     if os.path.exists(cached_output_html):
-            #         return f'<iframe src="{cached_output_html}" width="100%" height="600" frameborder="0" allowfullscreen></iframe>'
-            #     elif os.path.exists(cached_output_img):
-            #         return f'<img src="{cached_output_img}" alt="R Output Image" />'
-
-            # Execute the R script and capture the output
-            with open("tmp/script.R", "w") as temp_file:
-                temp_file.write(code)
-
-            result = subprocess.run(["Rscript", "tmp/script.R"], capture_output=True, text=True)
-
-            if result.returncode != 0:
-                return f"Error executing R code: {result.stderr}"
-
-            # Process the output and return
-            output = unescape_special_chars(result.stdout).replace("\n", "<br>")
-            return f"<div>{output}</div>\n"
-
-        except Exception as e:
-            return f"Error executing R code: {e}\n"
+        # Render already loaded content relative to the current base URL
+        self.render_pipeline.render_content(pyml_content, self.current_base_url or "")
+
+    def handle_fetched(self, generation, file_path, pyml_content, base_url):
+        # Update the current base URL to the directory of the current file
+        if self.render_pipeline.is_current(generation):
+            self.current_base_url = base_url
+
+    def show_page(self, generation, content, keep_scroll=False):
+        if not self.render_pipeline.is_current(generation):
+            return
+        # Block results that arrive before the skeleton has loaded are queued until it has
+        self.page_loaded = False
+        self.pending_blocks = []
+        self.restore_scroll = self.web_page.scrollPosition() if keep_scroll else None
+
+        # Relative URLs, such as the files scripts write to tmp/, resolve against the application directory
+        base_url = QUrl.fromLocalFile(os.path.dirname(os.path.realpath(__file__)) + '/').toString(QUrl.FullyEncoded)
+        content = content.replace("<head>", f'<head>\n<base href="{base_url}">', 1)
+        # Load the page by URL from the asset store; setHtml is limited to 2 MB
+        self.web_view.load(QUrl(self.services.assets.put(content, "text/html", persist=False)))
+
+    def update_page(self, generation, content):
+        # A watched local file was saved and its markup changed; stay where the reader was
+        self.show_page(generation, content, keep_scroll=True)
+
+    def show_block(self, generation, element_id, output_html):
+        if not self.render_pipeline.is_current(generation):
+            return
+        if not self.page_loaded:
+            self.pending_blocks.append((element_id, output_html))
+            return
+        # Replace the block's placeholder in the live page. The application world is used so
+        # that this works even when page JavaScript is disabled; the output's own scripts
+        # are inserted into the page, so they run in its main world
+        self.web_page.runJavaScript(block_patch_script(element_id, output_html), QWebEngineScript.ApplicationWorld)
+
+    def show_error(self, generation, content):
+        if self.render_pipeline.is_current(generation):
+            self.web_view.setHtml(content)
+
+    def show_trace(self, generation, trace):
+        if self.render_pipeline.is_current(generation):
+            self.trace_panel.show_trace(trace)
+
+    def handle_load_finished(self, ok):
+        if not ok or self.page_loaded:
+            return
+        self.page_loaded = True
+        if self.restore_scroll is not None:
+            position, self.restore_scroll = self.restore_scroll, None
+            self.web_page.runJavaScript(
+                f"window.scrollTo({position.x()}, {position.y()});", QWebEngineScript.ApplicationWorld
+            )
+        pending_blocks, self.pending_blocks = self.pending_blocks, []
+        for element_id, output_html in pending_blocks:
+            self.show_block(self.render_pipeline.generation, element_id, output_html)
+
+
+def cache_directory():
+    """Returns where caches are kept: tmp/ next to main.py (None), or a per-user cache directory when bundled.
+
+    A one-file executable unpacks itself into a new directory on every run, so
+    anything written next to it would be lost when the app exits.
+    """
+    if not getattr(sys, "frozen", False):
+        return None
+    return QStandardPaths.writableLocation(QStandardPaths.CacheLocation) or None
+
+
+def report_startup(app, window):
+    """Prints start-up milestones for benchmarks/bench_startup.py, then quits once the first page has loaded."""
+    QTimer.singleShot(0, lambda: print("GALACTON_STARTUP first_paint", flush=True))
+
+    def page_loaded(ok):
+        print("GALACTON_STARTUP page_loaded", flush=True)
+        app.quit()
+
+    window.web_view.loadFinished.connect(page_loaded)
 
 
 if __name__ == "__main__":
+    # Custom schemes have to be known before the application starts
+    register_scheme()
     app = QApplication(sys.argv)
+    # Names the per-user cache directory of a bundled executable
+    app.setApplicationName("Galacton")
     window = PyMLRenderer()
     window.show()
+    if os.environ.get("GALACTON_STARTUP_PROBE"):
+        report_startup(app, window)
     sys.exit(app.exec())
@@ -2,26 +2,35 @@
 
 import os
 
+# Packages that are only needed to build the bundle, never at run time
+BUILD_ONLY = {'altgraph', 'macholib', 'pyinstaller', 'pyinstaller-hooks-contrib', 'setuptools'}
+
 # Function to read requirements.txt and extract package names
 def read_requirements():
     with open('requirements.txt', 'r') as f:
         lines = f.readlines()
-    packages = [line.split("==")[0].strip() for line in lines if line and not line.startswith("#")]
-    return packages
+    packages = [line.split("==")[0].strip() for line in lines if line.strip() and not line.startswith("#")]
+    return [package for package in packages if package.lower() not in BUILD_ONLY]
+
+# Generate hidden imports dynamically, so code blocks can import any listed package.
+# The Python worker module is started by flag rather than imported, so list it explicitly
+hidden_imports = read_requirements() + ['galacton.pykernel']
 
-# Generate hidden imports dynamically
-hidden_imports = read_requirements()
+# Caches are not bundled: a bundled app keeps them in the per-user cache directory (see cache_directory in main.py).
+# Locally installed KaTeX / MathJax for math="katex" and math="mathjax" documents
+datas = [('assets/icon.ico', 'assets')]
+datas += [(os.path.join('assets', name), os.path.join('assets', name)) for name in ('katex', 'mathjax') if os.path.isdir(os.path.join('assets', name))]
 
 a = Analysis(
     ['main.py'],
     pathex=[],
     binaries=[],
-    datas=[('tmp', 'tmp'), ('assets/icon.ico', 'assets')],
+    datas=datas,
     hiddenimports=hidden_imports,
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
-    excludes=[],
+    excludes=['PyInstaller', 'setuptools', 'altgraph', 'macholib', 'tkinter'],
     noarchive=False,
     optimize=0,
     env={'PATH': os.environ['PATH']}  # Include the current PATH
@@ -0,0 +1,68 @@
+import os
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from galacton import cache
+from galacton.cache import OutputCache
+
+
+def test_outputs_are_stored_under_their_key(tmp_path):
+    output_cache = OutputCache(str(tmp_path))
+    key = output_cache.make_key("python", "print(1)")
+
+    assert output_cache.get(key) is None
+    output_cache.put(key, "<div>1</div>")
+
+    assert output_cache.get(key) == "<div>1</div>"
+    assert OutputCache(str(tmp_path)).get(key) == "<div>1</div>"
+    assert output_cache.make_key("python", "print(2)") != key
+    assert output_cache.make_key("python", "print(1)", context="earlier") != key
+
+
+def test_expired_entries_are_removed_when_read(tmp_path, monkeypatch):
+    output_cache = OutputCache(str(tmp_path), max_age=60)
+    key = output_cache.make_key("python", "print(1)")
+    output_cache.put(key, "<div>1</div>")
+
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now + 120)
+
+    assert output_cache.get(key) is None
+    assert os.listdir(tmp_path) == []
+    assert output_cache.stats()["entries"] == 0
+
+
+def test_least_recently_used_outputs_are_evicted(tmp_path):
+    output_cache = OutputCache(str(tmp_path), max_bytes=25)
+    for name in ("a", "b", "c"):
+        output_cache.put(name, name * 10)
+        time.sleep(0.01)
+
+    assert output_cache.stats()["bytes"] <= 25
+    assert output_cache.get("a") is None
+    assert output_cache.get("c") == "c" * 10
+
+
+def test_r_fingerprint_changes_with_package_versions(monkeypatch):
+    installed = {"stdout": "R version 4.3.1\nggplot2==3.4.0;stats==4.3.1\n"}
+
+    def run(command, **kwargs):
+        assert command[:2] == ["Rscript", "-e"]
+        return subprocess.CompletedProcess(command, 0, stdout=installed["stdout"], stderr="")
+
+    monkeypatch.setattr(subprocess, "run", run)
+    before = cache.r_environment_fingerprint()
+    installed["stdout"] = "R version 4.3.1\nggplot2==3.5.0;stats==4.3.1\n"
+
+    assert cache.r_environment_fingerprint() != before
+
+
+def test_r_fingerprint_without_r(monkeypatch):
+    def run(command, **kwargs):
+        raise FileNotFoundError(command[0])
+
+    monkeypatch.setattr(subprocess, "run", run)
+    assert cache.r_environment_fingerprint() == "none"
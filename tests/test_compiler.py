@@ -0,0 +1,82 @@
+import os
+import sys
+
+from lxml import etree
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from galacton import compiler
+from galacton.compiler import PyMLCompiler, register_tag_handler
+
+
+def compile_pyml(source, **kwargs):
+    return PyMLCompiler(**kwargs).compile(etree.fromstring(source))
+
+
+def test_nested_lists_keep_their_structure():
+    source = "<document><ul><li>one<ul><li>one.a</li></ul></li><li>two</li></ul></document>"
+    assert compile_pyml(source) == "<ul><li>one<ul><li>one.a</li></ul></li><li>two</li></ul>"
+
+
+def test_tail_text_follows_its_element():
+    source = "<document>before <b>bold</b> between <i>italic</i> after<br/>end</document>"
+    assert compile_pyml(source) == "before <b>bold</b> between <i>italic</i> after<br>end"
+
+
+def test_text_and_attributes_are_escaped():
+    source = '<document><a href="?a=1&amp;b=&quot;2&quot;" title="&lt;x&gt;">1 &lt; 2 &amp; 3</a></document>'
+    assert compile_pyml(source) == '<a href="?a=1&amp;b=&quot;2&quot;" title="&lt;x&gt;">1 &lt; 2 &amp; 3</a>'
+
+
+def test_script_text_is_copied_verbatim():
+    source = "<document><script><![CDATA[if (a < b && c) {}]]></script></document>"
+    assert compile_pyml(source) == "<script>if (a < b && c) {}</script>"
+
+
+def test_comments_are_dropped_but_their_tail_is_kept():
+    assert compile_pyml("<document>a<!-- hidden -->b</document>") == "ab"
+
+
+def test_deep_nesting_does_not_recurse():
+    # Deeper than the parser allows, so the tree is built directly
+    depth = 5000
+    root = element = etree.Element("document")
+    for _ in range(depth):
+        element = etree.SubElement(element, "div")
+    element.text = "x"
+    assert PyMLCompiler().compile(root) == "<div>" * depth + "x" + "</div>" * depth
+
+
+def test_registered_handlers_replace_the_element(monkeypatch):
+    monkeypatch.setattr(compiler, "TAG_HANDLERS", {})
+
+    @register_tag_handler("note")
+    def note(pyml_compiler, element, out):
+        out.append(f'<aside{pyml_compiler.attributes(element, role="note")}>')
+        pyml_compiler.compile_children(element, out)
+        out.append("</aside>")
+
+    source = '<document><note class="n">see <b>this</b></note> tail</document>'
+    assert compile_pyml(source) == '<aside class="n" role="note">see <b>this</b></aside> tail'
+    assert compiler.TAG_HANDLERS == {"note": note}
+
+
+def test_compiler_handlers_override_registered_ones(monkeypatch):
+    monkeypatch.setattr(compiler, "TAG_HANDLERS", {})
+    register_tag_handler("note", lambda pyml_compiler, element, out: out.append("global"))
+
+    def local(pyml_compiler, element, out):
+        out.append("local")
+
+    assert compile_pyml("<document><note/></document>", handlers={"note": local}) == "local"
+    assert compile_pyml("<document><note/></document>") == "global"
+
+
+def test_handlers_may_emit_objects():
+    marker = object()
+
+    def block(pyml_compiler, element, out):
+        out.append(marker)
+
+    parts = list(PyMLCompiler(handlers={"python": block}).iter_compile(etree.fromstring("<document>a<python/>b</document>")))
+    assert parts == ["a", marker, "b"]
@@ -0,0 +1,143 @@
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from galacton.fetch import Fetcher
+
+
+class _Handler(BaseHTTPRequestHandler):
+    # Routes are path -> (body, extra headers); requests are recorded on the server
+    def do_GET(self):
+        self.server.requests.append((self.path, dict(self.headers)))
+        body, headers = self.server.routes[self.path]
+        etag = headers.get("ETag")
+        last_modified = headers.get("Last-Modified")
+        not_modified = (etag and self.headers.get("If-None-Match") == etag) or (
+            last_modified and self.headers.get("If-Modified-Since") == last_modified
+        )
+        self.send_response(304 if not_modified else 200)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        if not_modified:
+            self.end_headers()
+            return
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    httpd.routes = {}
+    httpd.requests = []
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    httpd.url = f"http://127.0.0.1:{httpd.server_address[1]}"
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def _cached_bodies(cache_dir):
+    return [name for name in os.listdir(cache_dir) if name.endswith(".body")]
+
+
+def test_etag_revalidation_uses_304(server, tmp_path):
+    server.routes["/doc.pyml"] = (b"<document/>", {"ETag": '"v1"', "Cache-Control": "no-cache"})
+    fetcher = Fetcher(str(tmp_path), offline=False)
+
+    assert fetcher.get(server.url + "/doc.pyml").content == b"<document/>"
+    result = fetcher.get(server.url + "/doc.pyml")
+
+    assert result.content == b"<document/>"
+    assert result.from_cache
+    assert server.requests[1][1].get("If-None-Match") == '"v1"'
+    assert fetcher.downloads == 1 and fetcher.revalidated == 1
+
+
+def test_last_modified_revalidation_uses_304(server, tmp_path):
+    last_modified = "Wed, 04 Sep 2024 10:00:00 GMT"
+    server.routes["/doc.pyml"] = (b"<document/>", {"Last-Modified": last_modified, "Cache-Control": "max-age=0"})
+    fetcher = Fetcher(str(tmp_path), offline=False)
+
+    fetcher.get(server.url + "/doc.pyml")
+    fetcher.get(server.url + "/doc.pyml")
+
+    assert server.requests[1][1].get("If-Modified-Since") == last_modified
+    assert fetcher.downloads == 1 and fetcher.revalidated == 1
+
+
+def test_fresh_copy_is_served_without_a_request(server, tmp_path):
+    server.routes["/doc.pyml"] = (b"<document/>", {"Cache-Control": "max-age=3600"})
+    fetcher = Fetcher(str(tmp_path), offline=False)
+
+    fetcher.get(server.url + "/doc.pyml")
+    assert fetcher.get(server.url + "/doc.pyml").from_cache
+    assert len(server.requests) == 1
+
+
+def test_no_store_is_never_written(server, tmp_path):
+    server.routes["/secret.pyml"] = (b"secret", {"Cache-Control": "no-store", "ETag": '"s"'})
+    fetcher = Fetcher(str(tmp_path), offline=False)
+
+    assert fetcher.get(server.url + "/secret.pyml").content == b"secret"
+    assert fetcher.get(server.url + "/secret.pyml").content == b"secret"
+
+    assert os.listdir(tmp_path) == []
+    assert fetcher.downloads == 2
+    assert "If-None-Match" not in server.requests[1][1]
+
+
+def test_stale_copy_is_served_when_the_server_is_down(server, tmp_path):
+    server.routes["/doc.pyml"] = (b"<document/>", {"Cache-Control": "max-age=0"})
+    fetcher = Fetcher(str(tmp_path), offline=False, timeout=5)
+    url = server.url + "/doc.pyml"
+    fetcher.get(url)
+
+    server.shutdown()
+    server.server_close()
+
+    result = fetcher.get(url)
+    assert result.content == b"<document/>"
+    assert result.from_cache
+
+
+def test_offline_mode_refuses_uncached_urls(server, tmp_path, monkeypatch):
+    server.routes["/doc.pyml"] = (b"<document/>", {"Cache-Control": "max-age=0"})
+    Fetcher(str(tmp_path), offline=False).get(server.url + "/doc.pyml")
+
+    monkeypatch.setenv("GALACTON_OFFLINE", "1")
+    fetcher = Fetcher(str(tmp_path))
+
+    # Cached copies are served regardless of age, without contacting the server
+    assert fetcher.get(server.url + "/doc.pyml").content == b"<document/>"
+    assert len(server.requests) == 1
+    with pytest.raises(ConnectionError):
+        fetcher.get(server.url + "/other.pyml")
+
+
+def test_least_recently_used_responses_are_evicted(server, tmp_path):
+    for name in ("a", "b", "c"):
+        server.routes[f"/{name}.pyml"] = (name.encode() * 100, {"Cache-Control": "max-age=3600"})
+    fetcher = Fetcher(str(tmp_path), max_bytes=250, offline=False)
+
+    fetcher.get(server.url + "/a.pyml")
+    fetcher.get(server.url + "/b.pyml")
+    fetcher.get(server.url + "/a.pyml")  # a is now more recently used than b
+    fetcher.get(server.url + "/c.pyml")
+
+    assert fetcher.stats()["bytes"] <= 250
+    assert len(_cached_bodies(tmp_path)) == 2
+    assert fetcher.get(server.url + "/a.pyml").from_cache
+    requests_before = len(server.requests)
+    assert fetcher.get(server.url + "/b.pyml").content == b"b" * 100
+    assert len(server.requests) == requests_before + 1
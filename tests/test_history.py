@@ -0,0 +1,59 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from galacton.history import PageCache, page_key
+from galacton.pyml import PageRenderer, RenderServices, source_hash, sources_unchanged
+
+
+def test_page_key_covers_the_document_content():
+    assert page_key("/doc.pyml", "<document/>") == page_key("/doc.pyml", "<document/>")
+    assert page_key("/doc.pyml", "<document/>") != page_key("/doc.pyml", "<document></document>")
+
+
+def test_pages_are_checked_against_their_sources():
+    cache = PageCache()
+    cache.put("key", "<p>page</p>", {"/s.py": "hash"})
+    seen = []
+
+    assert cache.get("key", lambda sources: seen.append(sources) or True) == "<p>page</p>"
+    assert seen == [{"/s.py": "hash"}]
+    # A page whose sources changed is dropped for good
+    assert cache.get("key", lambda sources: False) is None
+    assert "key" not in cache
+    assert cache.hits == 1 and cache.misses == 1
+
+
+def test_least_recently_viewed_pages_are_evicted():
+    cache = PageCache(max_bytes=10)
+    cache.put("a", "aaaa")
+    cache.put("b", "bbbb")
+    cache.get("a")
+    cache.put("c", "cccc")
+
+    assert "a" in cache and "c" in cache
+    assert "b" not in cache
+
+
+def test_sources_unchanged_rereads_local_scripts(tmp_path):
+    script = tmp_path / "s.py"
+    script.write_text("print(1)\n")
+    sources = {str(script): source_hash("print(1)\n")}
+
+    assert sources_unchanged(sources, fetcher=None)
+    script.write_text("print(2)\n")
+    assert not sources_unchanged(sources, fetcher=None)
+    script.unlink()
+    assert not sources_unchanged(sources, fetcher=None)
+
+
+def test_pages_with_uncached_blocks_are_not_cacheable(tmp_path):
+    (tmp_path / "s.py").write_text("print(1)\n")
+    renderer = PageRenderer(str(tmp_path) + "/", RenderServices(prestart=False, output_dir=str(tmp_path / "out")))
+
+    assert renderer.build_page("<document><python>print(1)</python></document>").cacheable
+    assert not renderer.build_page('<document><python cache="False">print(1)</python></document>').cacheable
+
+    renderer.load_block_code(src_file="s.py")
+    assert renderer.sources == {str(tmp_path / "s.py"): source_hash("print(1)\n")}
@@ -0,0 +1,78 @@
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from galacton.pykernel import PythonKernelPool, outputs_to_html
+from galacton.pyml import block_patch_script
+
+PLOTLY_BLOCK = """
+import plotly.graph_objects as go
+display(go.Figure(go.Scatter(x=[1, 2, 3], y=[2, 1, 3])))
+"""
+
+
+@pytest.fixture(scope="module")
+def plotly_html():
+    plotly = pytest.importorskip("plotly")
+    pool = PythonKernelPool(size=1)
+    try:
+        outputs, _ = pool.execute("plotly", PLOTLY_BLOCK)
+    finally:
+        pool.shutdown()
+    output_html = outputs_to_html(outputs)
+    # Load plotly from the copy shipped with the package, so the test needs no network access
+    bundle = os.path.join(os.path.dirname(plotly.__file__), "package_data", "plotly.min.js")
+    for cdn in ("https://cdn.plot.ly/", "http://cdn.plot.ly/"):
+        start = output_html.find(cdn)
+        if start != -1:
+            end = output_html.index('"', start)
+            output_html = output_html[:start] + "file://" + bundle + output_html[end:]
+    return output_html
+
+
+def test_plotly_output_is_patched_in_with_its_scripts(plotly_html):
+    assert "plotly-graph-div" in plotly_html
+    assert "<script" in plotly_html
+
+    script = block_patch_script("block-1", plotly_html)
+
+    assert '"block-1"' in script
+    # The scripts are re-created after the output is inserted, since innerHTML never runs them
+    assert "createElement(\"script\")" in script
+
+
+def test_plotly_block_draws_in_the_live_page(plotly_html, tmp_path):
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    # Qt WebEngine also fails to import where system libraries it needs are missing
+    QtWebEngineWidgets = pytest.importorskip("PyQt5.QtWebEngineWidgets", exc_type=ImportError)
+    from PyQt5.QtCore import QUrl
+    from PyQt5.QtWidgets import QApplication
+
+    app = QApplication.instance() or QApplication([])
+    page = QtWebEngineWidgets.QWebEnginePage()
+    loaded = []
+    page.loadFinished.connect(loaded.append)
+    page.setHtml('<html><body><div id="block-1">Rendering</div></body></html>', QUrl.fromLocalFile(str(tmp_path) + "/"))
+
+    def wait_for(condition, seconds=30):
+        deadline = time.monotonic() + seconds
+        while not condition() and time.monotonic() < deadline:
+            app.processEvents()
+            time.sleep(0.01)
+        return condition()
+
+    assert wait_for(lambda: loaded) and loaded[0]
+    # As in the browser, the output is patched in from the application world
+    page.runJavaScript(block_patch_script("block-1", plotly_html), QtWebEngineWidgets.QWebEngineScript.ApplicationWorld)
+
+    drawn = []
+
+    def count_plots():
+        page.runJavaScript("document.querySelectorAll('#block-1 .main-svg').length", drawn.append)
+        return bool(wait_for(lambda: drawn, 5)) and drawn.pop() > 0
+
+    assert wait_for(count_plots)
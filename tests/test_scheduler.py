@@ -0,0 +1,101 @@
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from galacton.scheduler import BlockScheduler, Task, infer_sessions, python_names, r_names
+
+
+def test_closing_the_run_drops_tasks_that_have_not_started():
+    scheduler = BlockScheduler(max_workers=1)
+    started = []
+    release = threading.Event()
+
+    def block(key):
+        def run():
+            started.append(key)
+            if key:
+                release.wait(5)
+            return key
+        return run
+
+    results = scheduler.run([Task(key, block(key)) for key in range(6)])
+    assert next(results) == (0, 0)
+    # Block 1 has been picked up by the worker and holds it until it is released
+    threading.Timer(0.2, release.set).start()
+    results.close()
+
+    assert started == [0, 1]
+    scheduler.shutdown()
+
+
+def test_closing_the_run_waits_for_running_tasks():
+    scheduler = BlockScheduler(max_workers=2)
+    slow_started = threading.Event()
+    finished = []
+
+    def fast():
+        slow_started.wait(5)
+        return "fast"
+
+    def slow():
+        slow_started.set()
+        time.sleep(0.3)
+        finished.append("slow")
+
+    results = scheduler.run([Task("fast", fast), Task("slow", slow)])
+    assert next(results) == ("fast", "fast")
+    results.close()
+
+    assert finished == ["slow"]
+    scheduler.shutdown()
+
+
+def test_python_names_reports_names_read_before_they_are_bound():
+    bound, used = python_names("import os.path\ny = x + 1\ndef f(): return z\nclass C: pass\nprint(y)")
+    assert bound == {"os", "y", "f", "C"}
+    assert used == {"x", "z"}  # print is a builtin and y is bound by this block first
+
+
+def test_python_names_rejects_code_that_does_not_parse():
+    assert python_names("def (") is None
+
+
+def test_r_names_finds_assignments_in_both_directions():
+    bound, used = r_names('a <- 1\nb = a + c\n2 ->> d\ncat("e <- ignored") # f <- ignored')
+    assert bound >= {"a", "b", "d"}
+    assert {"a", "c", "cat"} <= used
+    assert "e" not in used and "f" not in used
+
+
+def _python_sessions(blocks):
+    return infer_sessions([(key, session, code) for key, session, code in blocks], python_names)
+
+
+def test_blocks_that_share_variables_share_a_session():
+    groups = _python_sessions([(0, None, "x = 1"), (1, None, "print(x)"), (2, None, "print('alone')")])
+    assert groups[0] == groups[1]
+    assert groups[2] != groups[0]
+
+
+def test_explicit_sessions_are_shared():
+    groups = _python_sessions([(0, "s", "a = 1"), (1, "s", "b = 2"), (2, None, "c = 3")])
+    assert groups[0] == groups[1] != groups[2]
+
+
+def test_a_block_reading_a_name_bound_in_an_explicit_session_joins_it():
+    groups = _python_sessions([(0, "s", "x = 41"), (1, None, "print(x + 1)")])
+    assert groups[0] == groups[1]
+
+
+def test_an_explicit_session_reading_a_name_bound_elsewhere_joins_that_block():
+    groups = _python_sessions([(0, None, "import math"), (1, "t", "print(math.pi)"), (2, "t", "y = 1")])
+    assert groups[0] == groups[1] == groups[2]
+
+
+def test_blocks_that_do_not_parse_run_on_their_own():
+    groups = _python_sessions([(0, None, "x = 1"), (1, None, "print(x"), (2, None, "print(x)")])
+    assert groups[0] == groups[2]
+    assert groups[1] != groups[0]
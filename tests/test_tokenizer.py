@@ -0,0 +1,63 @@
+import os
+import sys
+
+import pytest
+from lxml import etree
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from galacton.tokenizer import mark_raw_text, parse_pyml
+
+
+def test_code_is_kept_byte_for_byte():
+    code = '\nif a < b and c > d: print("<b>&amp;</b>")\n'
+    root = parse_pyml(f"<document><python>{code}</python><r>x <- 1 && y</r></document>")
+    assert root.find("python").text == code
+    assert root.find("r").text == "x <- 1 && y"
+
+
+def test_attributes_and_src_are_kept():
+    root = parse_pyml('<document><python src="scripts/plot.py" cache="False">a < 1</python></document>')
+    block = root.find("python")
+    assert block.get("src") == "scripts/plot.py"
+    assert block.get("cache") == "False"
+    assert block.text == "a < 1"
+
+
+def test_self_closing_code_elements_are_left_alone():
+    source = '<document><python src="a.py"/><p>x &lt; y</p><r src="b.R" /></document>'
+    assert mark_raw_text(source) == source
+    root = parse_pyml(source)
+    assert root.find("python").get("src") == "a.py"
+    assert root.find("python").text is None
+    assert root.find("p").text == "x < y"
+
+
+def test_cdata_terminator_inside_code_survives():
+    code = 'x = [[1]]>0\nprint("]]>")'
+    assert parse_pyml(f"<document><python>{code}</python></document>").find("python").text == code
+
+
+def test_comments_and_cdata_are_not_tokenized():
+    source = (
+        "<document><!-- <python>not code & </python> -->"
+        "<p><![CDATA[<python>also not code</python>]]></p></document>"
+    )
+    assert mark_raw_text(source) == source
+    root = parse_pyml(source)
+    assert root.find(".//python") is None
+    assert root.find("p").text == "<python>also not code</python>"
+
+
+def test_tags_that_only_start_like_code_elements_are_markup():
+    source = "<document><pythonic>a &amp; b</pythonic><rect/></document>"
+    assert mark_raw_text(source) == source
+
+
+def test_empty_code_elements_stay_empty():
+    assert parse_pyml("<document><python></python></document>").find("python").text is None
+
+
+def test_unterminated_code_is_reported_by_the_parser():
+    with pytest.raises(etree.XMLSyntaxError):
+        parse_pyml("<document><python>print(1 < 2)</document>")